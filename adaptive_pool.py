@@ -0,0 +1,133 @@
+# adaptive_pool.py - In-memory question pools for adaptive tests
+#
+# QuestionCatalog üzerinden (koleksiyon, type, difficulty) başına karıştırılmış soru id
+# havuzları tutar. Her kullanıcının havuz başına kendi cursor'ı vardır: kullanıcı havuzu
+# rastgele bir noktadan başlayarak sırayla dolaşır, böylece ardışık testlerde aynı sorular
+# gelmez. Son verilen RECENT_SEEN_LIMIT soru, başka aday kalmadıkça tekrar verilmez.
+#
+# Tüm işlemler bellek içi - adaptif test hazırlamak için MongoDB'ye gidilmez.
+# Kullanıcı durumu süreç başınadır (worker yeniden başlarsa cursor'lar sıfırlanır).
+
+import os
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from question_catalog import QuestionCatalog
+
+RECENT_SEEN_LIMIT = int(os.getenv("ADAPTIVE_RECENT_SEEN", "200"))
+MAX_TRACKED_USERS = int(os.getenv("ADAPTIVE_MAX_USERS", "50000"))
+
+PoolKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class _UserState:
+    """Kullanıcının havuz cursor'ları ve son gördüğü sorular"""
+
+    __slots__ = ("cursors", "recent", "recent_ids")
+
+    def __init__(self, recent_limit: int):
+        self.cursors: Dict[PoolKey, int] = {}
+        self.recent = deque(maxlen=recent_limit)
+        self.recent_ids: Set[str] = set()
+
+    def remember(self, question_ids: Iterable[str]):
+        for question_id in question_ids:
+            if question_id in self.recent_ids:
+                continue
+            if len(self.recent) == self.recent.maxlen:
+                self.recent_ids.discard(self.recent[0])
+            self.recent.append(question_id)
+            self.recent_ids.add(question_id)
+
+
+class AdaptivePool:
+    """(type, difficulty) -> karıştırılmış soru havuzu, kullanıcı başına cursor"""
+
+    def __init__(self, catalog: QuestionCatalog, recent_limit: int = RECENT_SEEN_LIMIT,
+                 max_users: int = MAX_TRACKED_USERS, rng: Optional[random.Random] = None):
+        self.catalog = catalog
+        self.recent_limit = recent_limit
+        self.max_users = max_users
+        self._rng = rng or random.Random()
+
+        self._lock = threading.Lock()
+        self._pools: Dict[PoolKey, List[str]] = {}
+        self._pool_version: Optional[int] = None
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+
+    def _pool(self, key: PoolKey) -> List[str]:
+        # Katalog değiştiyse havuzlar yeniden karıştırılır (cursor'lar yeni havuzda devam eder)
+        if self._pool_version != self.catalog.version:
+            self._pools.clear()
+            self._pool_version = self.catalog.version
+
+        pool = self._pools.get(key)
+        if pool is None:
+            collection_name, question_type, difficulty = key
+            pool = self.catalog.ids(collection_name, difficulty=difficulty, question_type=question_type)
+            self._rng.shuffle(pool)
+            self._pools[key] = pool
+        return pool
+
+    def _user(self, user_id: str) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(self.recent_limit)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def take(self, user_id: str, collection_name: str, k: int,
+             question_type: Optional[str] = None, difficulty: Optional[str] = None,
+             exclude_ids: Optional[Set[str]] = None,
+             exclude_types: Optional[Set[Optional[str]]] = None) -> List[Dict]:
+        """
+        Kullanıcının cursor'ından itibaren en fazla k soru (kopya olarak).
+        Son görülen sorular ancak başka aday kalmazsa verilir.
+        """
+        if k <= 0:
+            return []
+        self.catalog.ensure_loaded()
+        exclude_ids = exclude_ids or set()
+
+        with self._lock:
+            key = (collection_name, question_type, difficulty)
+            pool = self._pool(key)
+            if not pool:
+                return []
+
+            state = self._user(user_id)
+            cursor = state.cursors.get(key)
+            if cursor is None:
+                cursor = self._rng.randrange(len(pool))
+
+            picked: List[str] = []
+            seen_recently: List[str] = []
+            steps = 0
+            for steps in range(1, len(pool) + 1):
+                question_id = pool[(cursor + steps - 1) % len(pool)]
+                if question_id in exclude_ids:
+                    continue
+                if exclude_types is not None and \
+                        self.catalog.question_type(collection_name, question_id) in exclude_types:
+                    continue
+                if question_id in state.recent_ids:
+                    seen_recently.append(question_id)
+                    continue
+                picked.append(question_id)
+                if len(picked) >= k:
+                    break
+
+            state.cursors[key] = (cursor + steps) % len(pool)
+            picked.extend(seen_recently[:k - len(picked)])
+            state.remember(picked)
+
+        return self.catalog.get_many(collection_name, picked)
+
+    def forget_user(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
@@ -1,3 +1,4 @@
+import json
 import requests
 import streamlit as st
 from config.settings import API_BASE_URL
@@ -55,29 +56,40 @@ def update_profile(email, department, grade):
     return api_request("user/update-profile", method="POST", data=data)
 
 # 시험 관련 API
+
+# 레벨 테스트 응답 캐시 - 서버가 같은 ETag에 304를 주면 다시 받지 않음
+_level_test_cache = {"etag": None, "response": None}
+
 def get_level_test():
-    """레벨 테스트 가져오기"""
-    response = api_request("exam/level-test")
+    """레벨 테스트 가져오기 (게시된 표준 시험지, ETag로 재검증)"""
+    url = f"{API_BASE_URL}/exam/level-test"
+    headers = {"If-None-Match": _level_test_cache["etag"]} if _level_test_cache["etag"] else {}
     
-    if response and response.get("status") == "success":
-        test_data = response.get("test", [])
-        
-        # 데이터 형식 정리
-        for question in test_data:
-            if "Problem" not in question and "problem" in question:
-                question["Problem"] = question["problem"]
-            
-            if "Choices" not in question and "choices" in question:
-                question["Choices"] = question["choices"]
-            
-            if "Answer Key" not in question and "answer_key" in question:
-                question["Answer Key"] = question["answer_key"]
+    try:
+        http_response = requests.get(url, headers=headers)
+    except Exception as e:
+        st.error(f"API 연결 오류: {str(e)}")
+        return None
     
-    return response
+    if http_response.status_code == 304 and _level_test_cache["response"] is not None:
+        response = _level_test_cache["response"]
+    elif http_response.status_code == 200:
+        response = http_response.json()
+        _level_test_cache["etag"] = http_response.headers.get("ETag")
+        _level_test_cache["response"] = response
+    else:
+        st.error(f"API 오류: {http_response.status_code} - {http_response.text}")
+        return None
+    
+    # 서버가 표준 필드(_id, problem, choices, difficulty, type)로 보내므로 별도 정리 불필요
+    # 호출자가 문제 목록을 수정해도 캐시는 그대로 유지
+    return {**response, "test": [dict(question) for question in response.get("test", [])]}
 
-def submit_test(user_id, answers):
-    """테스트 답안 제출"""
+def submit_test(user_id, answers, test_version=None):
+    """테스트 답안 제출 (test_version: 풀었던 시험지 버전)"""
     data = {"user_id": user_id, "answers": answers}
+    if test_version is not None:
+        data["test_version"] = test_version
     return api_request("exam/submit-test", method="POST", data=data)
 
 def get_practice_question(difficulty):
@@ -94,6 +106,29 @@ def explain_answer(question_id, student_answer):
     data = {"question_id": question_id, "student_answer": student_answer}
     return api_request("llm/explain-answer", method="POST", data=data)
 
+def stream_explain_answer(question_id, student_answer):
+    """문제 해설 스트리밍 (SSE) - (event, data) 튜플을 생성되는 대로 반환
+    event: meta -> 문제/정답 정보, token -> 해설 조각, done -> 전체 해설, error -> 오류"""
+    url = f"{API_BASE_URL}/llm/explain-answer/stream"
+    data = {"question_id": question_id, "student_answer": student_answer}
+    
+    try:
+        with requests.post(url, json=data, stream=True, timeout=(10, 120)) as response:
+            if response.status_code != 200:
+                yield "error", {"detail": f"API 오류: {response.status_code} - {response.text}"}
+                return
+            
+            response.encoding = "utf-8"
+            event = "message"
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+                    event = "message"
+    except Exception as e:
+        yield "error", {"detail": f"API 연결 오류: {str(e)}"}
+
 def get_user_test_history(user_id):
     """사용자 테스트 기록 가져오기"""
     return api_request(f"exam/user-test-history/{user_id}")
@@ -0,0 +1,142 @@
+# async_db.py - Async data-access layer for the FastAPI handlers
+#
+# Handler'lar async def - senkron pymongo çağrıları event loop'u bloklar.
+# Bu katman pymongo çağrılarını sınırlı bir thread havuzunda çalıştırır
+# (Motor'un yaptığı gibi) ve Motor uyumlu bir API sunar:
+#
+#   adb = AsyncDatabase(db)
+#   user = await adb["users"].find_one({"_id": user_id})
+#   docs = await adb["exam_questions"].find({}).skip(10).limit(20).to_list(None)
+#
+# Birden çok sorgudan oluşan servis çağrıları (BKT güncellemesi vb.) tek seferde:
+#   result = await run_blocking(bkt_system.update_bkt_with_answers, user_id, answers)
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Eşzamanlı Mongo çağrısı üst sınırı - bağlantı havuzu boyutunu aşmamalı
+# (uygulama başlarken services.py MONGO_MAX_POOL_SIZE'a göre ayarlar)
+MONGO_IO_THREADS = int(os.getenv("MONGO_IO_THREADS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=MONGO_IO_THREADS, thread_name_prefix="mongo-io")
+
+
+def configure_executor(max_workers: int):
+    """I/O havuzunu yeniden boyutlandır (uygulama başlangıcında, Mongo pool boyutuna göre)"""
+    global _executor
+    previous = _executor
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongo-io")
+    previous.shutdown(wait=False)
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Senkron fonksiyonu Mongo I/O havuzunda çalıştır ve sonucunu bekle"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class AsyncCursor:
+    """find() sonucu - sort/skip/limit zincirlenir, to_list() ile tek seferde okunur"""
+
+    def __init__(self, collection, args, kwargs):
+        self._collection = collection
+        self._args = args
+        self._kwargs = kwargs
+        self._modifiers: List = []
+
+    def sort(self, *args, **kwargs) -> "AsyncCursor":
+        self._modifiers.append(("sort", args, kwargs))
+        return self
+
+    def skip(self, count: int) -> "AsyncCursor":
+        self._modifiers.append(("skip", (count,), {}))
+        return self
+
+    def limit(self, count: int) -> "AsyncCursor":
+        self._modifiers.append(("limit", (count,), {}))
+        return self
+
+    def batch_size(self, count: int) -> "AsyncCursor":
+        self._modifiers.append(("batch_size", (count,), {}))
+        return self
+
+    def _fetch(self, length: Optional[int]) -> List[Dict]:
+        cursor = self._collection.find(*self._args, **self._kwargs)
+        for name, args, kwargs in self._modifiers:
+            cursor = getattr(cursor, name)(*args, **kwargs)
+        if length is not None:
+            cursor = cursor.limit(length)
+        return list(cursor)
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        return await run_blocking(self._fetch, length)
+
+
+class AsyncCollection:
+    """pymongo Collection'ın await edilebilir karşılığı"""
+
+    def __init__(self, collection):
+        self.sync = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs) -> AsyncCursor:
+        return AsyncCursor(self.sync, args, kwargs)
+
+    async def aggregate(self, pipeline: List[Dict], **kwargs) -> List[Dict]:
+        return await run_blocking(lambda: list(self.sync.aggregate(pipeline, **kwargs)))
+
+    async def find_one(self, *args, **kwargs):
+        return await run_blocking(self.sync.find_one, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await run_blocking(self.sync.find_one_and_update, *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs) -> int:
+        return await run_blocking(self.sync.count_documents, *args, **kwargs)
+
+    async def distinct(self, *args, **kwargs) -> List:
+        return await run_blocking(self.sync.distinct, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await run_blocking(self.sync.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await run_blocking(self.sync.insert_many, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await run_blocking(self.sync.update_one, *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await run_blocking(self.sync.update_many, *args, **kwargs)
+
+    async def replace_one(self, *args, **kwargs):
+        return await run_blocking(self.sync.replace_one, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await run_blocking(self.sync.delete_one, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await run_blocking(self.sync.delete_many, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await run_blocking(self.sync.bulk_write, *args, **kwargs)
+
+
+class AsyncDatabase:
+    """pymongo Database'in await edilebilir karşılığı - adb["users"]"""
+
+    def __init__(self, db):
+        self.sync = db
+        self._collections: Dict[str, AsyncCollection] = {}
+
+    def __getitem__(self, name: str) -> AsyncCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = AsyncCollection(self.sync[name])
+        return collection
+
+    async def list_collection_names(self, *args, **kwargs) -> List[str]:
+        return await run_blocking(self.sync.list_collection_names, *args, **kwargs)
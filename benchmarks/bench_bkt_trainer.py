@@ -0,0 +1,122 @@
+# bench_bkt_trainer.py - Speed and parameter recovery of the EM trainer on synthetic data
+#
+# Bilinen parametrelerle (type başına biraz farklı) sentetik cevap dizileri üretir, bkt_trainer ile
+# küresel ve type başına öğrenir; süreyi ve gerçek değerlere olan ortalama mutlak hatayı raporlar.
+# MongoDB gerekmez.
+#
+#   python benchmarks/bench_bkt_trainer.py --types 40 --sequences-per-type 2000 --processes 8
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bkt_trainer import RawSequence, SequenceSet, fit_bkt, train  # noqa: E402
+from type_based_bkt_system import BKT_PARAMETER_FIELDS  # noqa: E402
+from vectorized_bkt import DIFFICULTIES  # noqa: E402
+
+TRUE_PARAMS = {
+    "하": {"slip": 0.08, "guess": 0.25, "learn": 0.15, "prior": 0.35},
+    "중": {"slip": 0.12, "guess": 0.20, "learn": 0.10, "prior": 0.25},
+    "상": {"slip": 0.18, "guess": 0.12, "learn": 0.06, "prior": 0.15}
+}
+
+# Eğitimin başlangıç noktası - motorun elle ayarlanmış değerleri
+START_PARAMS = {
+    "하": {"slip": 0.05, "guess": 0.20, "learn": 0.10, "prior": 0.2},
+    "중": {"slip": 0.08, "guess": 0.15, "learn": 0.08, "prior": 0.15},
+    "상": {"slip": 0.12, "guess": 0.10, "learn": 0.05, "prior": 0.1}
+}
+
+
+def perturb(params: Dict, rng: np.random.Generator, scale: float) -> Dict:
+    return {
+        difficulty: {
+            field: float(np.clip(value * rng.uniform(1 - scale, 1 + scale), 0.01, 0.45 if field != "prior" else 0.9))
+            for field, value in values.items()
+        }
+        for difficulty, values in params.items()
+    }
+
+
+def simulate(params: Dict, num_sequences: int, min_length: int, max_length: int,
+             rng: np.random.Generator) -> List[RawSequence]:
+    sequences = []
+    arrays = {field: np.array([params[d][field] for d in DIFFICULTIES]) for field in BKT_PARAMETER_FIELDS}
+    for _ in range(num_sequences):
+        length = int(rng.integers(min_length, max_length + 1))
+        difficulties = rng.integers(0, len(DIFFICULTIES), size=length)
+        known = rng.random() < arrays["prior"][difficulties[0]]
+        outcomes = []
+        for d in difficulties:
+            p_correct = 1 - arrays["slip"][d] if known else arrays["guess"][d]
+            outcomes.append(bool(rng.random() < p_correct))
+            if not known and rng.random() < arrays["learn"][d]:
+                known = True
+        sequences.append((difficulties.tolist(), outcomes))
+    return sequences
+
+
+def mean_abs_error(fitted: Dict, truth: Dict) -> float:
+    errors = [
+        abs(fitted[difficulty][field] - truth[difficulty][field])
+        for difficulty in fitted for field in BKT_PARAMETER_FIELDS
+    ]
+    return float(np.mean(errors)) if errors else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bkt_trainer EM benchmark (sentetik veri)")
+    parser.add_argument("--types", type=int, default=20)
+    parser.add_argument("--sequences-per-type", type=int, default=1000)
+    parser.add_argument("--min-length", type=int, default=3)
+    parser.add_argument("--max-length", type=int, default=40)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--type-spread", type=float, default=0.3, help="type parametrelerinin göreli sapması")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    truth_by_type = {f"type-{i:03d}": perturb(TRUE_PARAMS, rng, args.type_spread) for i in range(args.types)}
+
+    started = time.monotonic()
+    sequences_by_type = {
+        question_type: simulate(params, args.sequences_per_type, args.min_length, args.max_length, rng)
+        for question_type, params in truth_by_type.items()
+    }
+    num_answers = sum(len(d) for sequences in sequences_by_type.values() for d, _ in sequences)
+    print(f"simulated: {args.types} types x {args.sequences_per_type} sequences, "
+          f"{num_answers} answers ({time.monotonic() - started:.1f}s)")
+
+    # Tek type üzerinde tek süreç EM hızı
+    sample_type = next(iter(sequences_by_type))
+    sample = SequenceSet(sequences_by_type[sample_type])
+    started = time.monotonic()
+    sample_fit = fit_bkt(sample, START_PARAMS)
+    elapsed = time.monotonic() - started
+    print(f"single type: {sample.num_sequences} sequences, {sample.num_answers} answers, "
+          f"{sample_fit['iterations']} iterations in {elapsed:.2f}s "
+          f"({sample.num_answers * sample_fit['iterations'] / elapsed / 1e6:.1f}M answer-steps/s), "
+          f"MAE vs truth {mean_abs_error(sample_fit['difficulty_params'], truth_by_type[sample_type]):.4f}")
+
+    for processes in sorted({1, args.processes}):
+        started = time.monotonic()
+        param_set = train(sequences_by_type, START_PARAMS, per_type=True, processes=processes)
+        elapsed = time.monotonic() - started
+        type_errors = [
+            mean_abs_error(param_set["type_params"][question_type], truth)
+            for question_type, truth in truth_by_type.items() if question_type in param_set["type_params"]
+        ]
+        start_errors = [mean_abs_error(START_PARAMS, truth) for truth in truth_by_type.values()]
+        print(f"processes={processes}: total {elapsed:.2f}s, "
+              f"per-type MAE {np.mean(type_errors):.4f} (hand-tuned start {np.mean(start_errors):.4f}), "
+              f"global MAE vs base truth {mean_abs_error(param_set['difficulty_params'], TRUE_PARAMS):.4f}")
+
+
+if __name__ == "__main__":
+    main()
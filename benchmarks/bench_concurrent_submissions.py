@@ -0,0 +1,133 @@
+# bench_concurrent_submissions.py - Load test for concurrent level-test submissions
+#
+# Çalışan bir API'ye eşzamanlı /submit-test istekleri gönderir, aynı anda hafif bir
+# "probe" endpoint'ini (practice-question) ölçer ve p50/p95/p99 gecikmeleri raporlar.
+# Event loop bloklanıyorsa probe gecikmesi submit gecikmesiyle birlikte yükselir.
+#
+# Önce / sonra karşılaştırması için iki sürümü ayrı ayrı ayağa kaldırıp çalıştırın:
+#   uvicorn main:app --port 8000
+#   python benchmarks/bench_concurrent_submissions.py --base-url http://localhost:8000 \
+#       --concurrency 50 --requests 500
+#
+# mongod olmadan tekrarlanabilir ölçüm için API'yi latency_mongo_server.py ile (bellek içi Mongo +
+# round trip başına sabit gecikme) başlatın - komutlar o dosyanın başında.
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(name: str, latencies: List[float], errors: int, elapsed: float):
+    if not latencies:
+        print(f"{name:>8}: no successful requests ({errors} errors)")
+        return
+    print(
+        f"{name:>8}: n={len(latencies)} err={errors} "
+        f"rps={len(latencies) / elapsed:.1f} "
+        f"mean={statistics.mean(latencies):.1f}ms "
+        f"p50={percentile(latencies, 50):.1f}ms "
+        f"p95={percentile(latencies, 95):.1f}ms "
+        f"p99={percentile(latencies, 99):.1f}ms "
+        f"max={max(latencies):.1f}ms"
+    )
+
+
+async def create_bench_user(client: httpx.AsyncClient) -> str:
+    """Benchmark için geçici kullanıcı oluştur ve user_id döndür"""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    password = uuid.uuid4().hex
+    response = await client.post("/api/user/register", json={
+        "email": email, "password": password, "name": "bench", "grade": 1, "department": "bench"
+    })
+    response.raise_for_status()
+    response = await client.post("/api/user/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return response.json()["user"]["user_id"]
+
+
+async def timed(client: httpx.AsyncClient, method: str, url: str,
+                latencies: List[float], counters: Dict[str, int], **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            counters["errors"] += 1
+            return
+    except httpx.HTTPError:
+        counters["errors"] += 1
+        return
+    latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        user_id = args.user_id or await create_bench_user(client)
+
+        response = await client.get("/api/exam/level-test")
+        response.raise_for_status()
+        answers = {question["_id"]: 1 for question in response.json()["test"]}
+        payload = {"user_id": user_id, "answers": answers}
+        print(f"👤 user_id={user_id}, {len(answers)} questions per submission")
+
+        # Isınma
+        for _ in range(args.warmup):
+            await client.post("/api/exam/submit-test", json=payload)
+
+        submit_latencies: List[float] = []
+        probe_latencies: List[float] = []
+        submit_counters = {"errors": 0}
+        probe_counters = {"errors": 0}
+        semaphore = asyncio.Semaphore(args.concurrency)
+        done = asyncio.Event()
+
+        async def submit_one():
+            async with semaphore:
+                await timed(client, "POST", "/api/exam/submit-test",
+                            submit_latencies, submit_counters, json=payload)
+
+        async def probe_loop():
+            while not done.is_set():
+                await timed(client, "GET", "/api/exam/practice-question/중",
+                            probe_latencies, probe_counters)
+                await asyncio.sleep(args.probe_interval)
+
+        started = time.perf_counter()
+        probe_task = asyncio.create_task(probe_loop())
+        await asyncio.gather(*(submit_one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    print(f"⏱️ {args.requests} submissions, concurrency={args.concurrency}, {elapsed:.2f}s")
+    report("submit", submit_latencies, submit_counters["errors"], elapsed)
+    report("probe", probe_latencies, probe_counters["errors"], elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /submit-test load benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--user-id", help="mevcut kullanıcı (verilmezse geçici kullanıcı oluşturulur)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="probe istekleri arası (sn)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench_explain_answer.py - Throughput test for /api/llm/explain-answer
+#
+# API'yi sahte modelle çalıştırıp (OpenAI anahtarı gerekmez) eşzamanlı açıklama
+# isteklerinin gecikmesini ölçer:
+#   LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=1500 uvicorn main:app --port 8000
+#   python benchmarks/bench_explain_answer.py --concurrency 50 --requests 1000
+#
+# --distinct küçük tutulursa istekler aynı açıklamalara yığılır (cache / coalescing),
+# büyük tutulursa çoğu istek cache miss olur.
+
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+import httpx
+
+from bench_concurrent_submissions import report, timed
+
+
+async def load_question_ids(client: httpx.AsyncClient, collection: str, count: int) -> List[str]:
+    response = await client.get(f"/api/exam/get-questions/{collection}", params={"limit": count})
+    response.raise_for_status()
+    return [question["_id"] for question in response.json()["questions"]]
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        question_ids = await load_question_ids(client, args.collection, args.questions)
+        if not question_ids:
+            raise SystemExit(f"{args.collection} koleksiyonunda soru yok")
+
+        rng = random.Random(args.seed)
+        # (soru, cevap) çiftleri - istekler bu havuzdan seçilir
+        pairs = [(rng.choice(question_ids), rng.randint(1, 5)) for _ in range(args.distinct)]
+        print(f"❓ {len(question_ids)} questions, {len(pairs)} distinct (question, answer) pairs")
+
+        latencies: List[float] = []
+        counters = {"errors": 0}
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def explain_one():
+            question_id, student_answer = rng.choice(pairs)
+            async with semaphore:
+                await timed(client, "POST", "/api/llm/explain-answer", latencies, counters,
+                            json={"question_id": question_id, "student_answer": student_answer})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(explain_one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    print(f"⏱️ {args.requests} explain requests, concurrency={args.concurrency}, {elapsed:.2f}s")
+    report("explain", latencies, counters["errors"], elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /explain-answer load benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--collection", default="diagnosis_test")
+    parser.add_argument("--questions", type=int, default=100, help="kullanılacak soru sayısı")
+    parser.add_argument("--distinct", type=int, default=200, help="farklı (soru, cevap) çifti sayısı")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# bench_serialization.py - Response serialization cost: FastAPI default path vs json_response (orjson)
+#
+# İki tipik yanıtı karşılaştırır:
+#   - 30 soruluk seviye testi (ObjectId _id, datetime alanlı katalog dokümanları)
+#   - tam mastery raporu (TypeBasedPhysioTherapyBKT.get_mastery_report, NumPy skalerli BKT durumu)
+# Eski yol: elle ObjectId/datetime çevirme + jsonable_encoder + json.dumps (Starlette JSONResponse).
+# Yeni yol: BSONJSONResponse.render - dokümanlar olduğu gibi, tek geçiş.
+# İki çıktının aynı JSON'a çözüldüğü de kontrol edilir. MongoDB gerekmez (istemci bağlanmaz).
+#
+#   python benchmarks/bench_serialization.py --types 150 --repeat 2000
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_response import BSONJSONResponse  # noqa: E402
+from type_based_bkt_system import TypeBasedPhysioTherapyBKT  # noqa: E402
+from vectorized_bkt import DIFFICULTIES  # noqa: E402
+
+
+def level_test_questions(rng: np.random.Generator, count: int = 30) -> List[Dict]:
+    created_at = datetime(2024, 3, 1, 9, 30)
+    return [
+        {
+            "_id": ObjectId(),
+            "problem_id": int(i),
+            "problem": f"다음 중 견관절의 외회전에 작용하는 근육으로 옳은 것은? ({i})" * 2,
+            "choices": [f"보기 {j} - 극하근, 소원근, 견갑하근 중 하나" for j in range(1, 6)],
+            "difficulty": DIFFICULTIES[i % len(DIFFICULTIES)],
+            "type": f"type-{int(rng.integers(0, 40)):02d}",
+            "session": "1교시",
+            "subject": "물리치료 기초",
+            "created_at": created_at + timedelta(minutes=i)
+        }
+        for i in range(count)
+    ]
+
+
+def level_test_payload(questions: List[Dict]) -> Dict:
+    return {
+        "status": "success",
+        "test": questions,
+        "test_info": {"total_questions": len(questions), "is_standardized": True, "test_version": 3}
+    }
+
+
+def bkt_state(rng: np.random.Generator, num_types: int) -> Dict:
+    """Vektörize motorun ürettiği gibi NumPy skalerli durum"""
+    now = datetime(2024, 3, 1, 10, 0)
+    type_mastery = {}
+    for t in range(num_types):
+        attempts = np.int64(rng.integers(1, 30))
+        type_mastery[f"type-{t:03d}"] = {
+            "mastery_probability": np.float64(rng.random()),
+            "total_attempts": attempts,
+            "correct_answers": np.int64(rng.integers(0, attempts + 1)),
+            "last_updated": now - timedelta(hours=t),
+            "difficulty_performance": {
+                d: {"attempts": np.int64(rng.integers(0, 10)), "correct": np.int64(rng.integers(0, 5)),
+                    "mastery": np.float64(rng.random())}
+                for d in DIFFICULTIES
+            }
+        }
+    return {
+        "_id": ObjectId(),
+        "user_id": str(ObjectId()),
+        "type_mastery": type_mastery,
+        "total_attempts": int(sum(entry["total_attempts"] for entry in type_mastery.values())),
+        "total_correct": int(sum(entry["correct_answers"] for entry in type_mastery.values())),
+        "overall_mastery": np.float64(rng.random()),
+        "updated_at": now
+    }
+
+
+def mastery_report(state: Dict) -> Dict:
+    # Bağlanmayan istemci - rapor sadece verilen durumdan hesaplanır
+    engine = TypeBasedPhysioTherapyBKT(MongoClient(connect=False))
+    engine.get_user_bkt_state = lambda user_id: state
+    return {"status": "success", "report": engine.get_mastery_report(state["user_id"])}
+
+
+def legacy_level_test(payload: Dict) -> bytes:
+    """Önceki handler: soru başına elle çevirme, sonra FastAPI'nin varsayılan yolu"""
+    questions = []
+    for question in payload["test"]:
+        question = dict(question)
+        question["_id"] = str(question["_id"])
+        if hasattr(question.get("created_at"), "isoformat"):
+            question["created_at"] = question["created_at"].isoformat()
+        questions.append(question)
+    return starlette_render(jsonable_encoder({**payload, "test": questions}))
+
+
+def legacy_report(payload: Dict) -> bytes:
+    """Eski yol NumPy tamsayılarını tanımaz - motorun yaptığı gibi önce Python sayılarına çevrilir"""
+    return starlette_render(jsonable_encoder(to_python_numbers(payload)))
+
+
+def to_python_numbers(value):
+    if isinstance(value, dict):
+        return {key: to_python_numbers(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_python_numbers(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def starlette_render(content) -> bytes:
+    # starlette.responses.JSONResponse.render
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def orjson_render(payload: Dict) -> bytes:
+    return BSONJSONResponse.render(None, payload)
+
+
+def measure(fn: Callable, payload: Dict, repeat: int) -> float:
+    fn(payload)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def compare(name: str, payload: Dict, legacy: Callable, repeat: int):
+    old_body, new_body = legacy(payload), orjson_render(payload)
+    same = json.loads(old_body) == json.loads(new_body)
+    old_us, new_us = measure(legacy, payload, repeat), measure(orjson_render, payload, repeat)
+    print(f"{name}: {len(new_body) / 1024:.1f} KiB, same JSON: {same}")
+    print(f"   jsonable_encoder + json.dumps: {old_us:9.1f} µs")
+    print(f"   BSONJSONResponse (orjson):     {new_us:9.1f} µs   ({old_us / new_us:.1f}x, "
+          f"{old_us - new_us:.1f} µs saved per response)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yanıt serileştirme benchmark'ı")
+    parser.add_argument("--types", type=int, default=150, help="mastery raporundaki type sayısı")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    compare("level test (30 questions)", level_test_payload(level_test_questions(rng)),
+            legacy_level_test, args.repeat)
+    compare(f"mastery report ({args.types} types)", mastery_report(bkt_state(rng, args.types)),
+            legacy_report, max(1, args.repeat // 10))
+
+
+if __name__ == "__main__":
+    main()
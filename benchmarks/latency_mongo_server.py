@@ -0,0 +1,107 @@
+# latency_mongo_server.py - Run the API on an in-memory Mongo with simulated round-trip latency
+#
+# bench_concurrent_submissions.py sonuçlarını gerçek bir mongod olmadan tekrarlamak için:
+# pymongo.MongoClient mongomock ile değiştirilir ve her sürücü çağrısına (find_one, update_one ...)
+# --latency-ms kadar gecikme eklenir. time.sleep GIL'i bırakır - gerçek soket I/O'su gibi.
+# mongomock thread-safe olmadığı için çağrılar tek kilitle sıralanır (gecikme kilit dışında).
+#
+# Gereken ek paket: pip install mongomock
+#
+# user-011 ölçümü (100 submit, concurrency 20, 5 ms gecikme):
+#   git worktree add /tmp/before 22ddf31~1
+#   python benchmarks/latency_mongo_server.py --app-dir /tmp/before --port 8001 &
+#   python benchmarks/latency_mongo_server.py --port 8000 &
+#   python benchmarks/bench_concurrent_submissions.py --base-url http://localhost:8001 --concurrency 20 --requests 100
+#   python benchmarks/bench_concurrent_submissions.py --base-url http://localhost:8000 --concurrency 20 --requests 100
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import mongomock
+import mongomock.collection
+import pymongo
+from bson import ObjectId
+
+# Bir round trip sayılan sürücü çağrıları
+ROUND_TRIP_METHODS = [
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "count_documents", "find_one_and_update", "aggregate", "distinct",
+    "bulk_write"
+]
+
+DIFFICULTIES = ["하", "중", "상"]
+
+
+def install_latency(latency_seconds: float):
+    lock = threading.RLock()
+    depth = threading.local()
+
+    def wrap(method):
+        def wrapper(self, *args, **kwargs):
+            # mongomock metotları birbirini çağırır - sadece en dıştaki çağrı round trip sayılır
+            outer = not getattr(depth, "n", 0)
+            if outer:
+                time.sleep(latency_seconds)
+            depth.n = getattr(depth, "n", 0) + 1
+            try:
+                with lock:
+                    return method(self, *args, **kwargs)
+            finally:
+                depth.n -= 1
+        return wrapper
+
+    for name in ROUND_TRIP_METHODS:
+        method = getattr(mongomock.collection.Collection, name, None)
+        if method is not None:
+            setattr(mongomock.collection.Collection, name, wrap(method))
+
+    def no_change_streams(self, *args, **kwargs):
+        # Standalone sunucu gibi davran - katalog polling'e düşer
+        raise pymongo.errors.PyMongoError("change streams are not supported by the in-memory server")
+
+    mongomock.collection.Collection.watch = no_change_streams
+
+
+def seed_questions(db, count: int):
+    db["diagnosis_test"].insert_many([
+        {
+            "_id": ObjectId(),
+            "problem_id": i,
+            "problem": f"question {i}",
+            "choices": ["a", "b", "c", "d", "e"],
+            "answer_key": 1 + i % 5,
+            "difficulty": DIFFICULTIES[i % 3],
+            "type": f"T{i % 4}"
+        }
+        for i in range(count)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API on in-memory Mongo with simulated latency")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help="main.py'nin bulunduğu dizin (ör. eski sürüm için git worktree)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="sürücü çağrısı başına gecikme")
+    parser.add_argument("--questions", type=int, default=60, help="diagnosis_test'e eklenecek soru sayısı")
+    args = parser.parse_args()
+
+    install_latency(args.latency_ms / 1000)
+    client = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *a, **k: client
+    seed_questions(client[os.getenv("MONGO_DB_NAME", "physical_therapy_questions")], args.questions)
+
+    sys.path.insert(0, args.app_dir)
+    os.chdir(args.app_dir)
+    import main as app_main
+    import uvicorn
+
+    print(f"🧪 In-memory Mongo, {args.latency_ms:g} ms per round trip, {args.questions} questions")
+    uvicorn.run(app_main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
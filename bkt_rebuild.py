@@ -0,0 +1,339 @@
+# bkt_rebuild.py - Rebuild bkt_tracking from the answer_events log
+#
+# Kullanım:
+#   python bkt_rebuild.py --backfill-events   # bir kez: answer_events öncesi geçmişi test_results'tan ekle
+#   python bkt_rebuild.py                     # baştan yeniden hesapla
+#   python bkt_rebuild.py --resume            # son checkpoint'ten devam et
+#   python bkt_rebuild.py --dry-run           # yazmadan sadece hesapla
+#
+# bkt_parameters'ta yayınlanmış bir parametre seti varsa (bkt_trainer.py --publish) onunla hesaplar.
+#
+# answer_events sadece olay günlüğü eklendikten sonraki cevapları içerir. Daha önceki testler
+# --backfill-events ile test_results.detailed_results'tan (test_date sırasıyla, günlükteki olayların
+# önüne) eklenir. bkt_tracking'deki total_attempts günlükteki olay sayısından büyük olan kullanıcılar
+# (ör. kaydı olmayan alıştırma cevapları) yeniden hesaplamada atlanır ve raporlanır - aksi halde
+# geçmişleri sessizce silinirdi. --allow-partial-history bu kontrolü kapatır.
+
+import argparse
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import MongoSettings, create_mongo_client
+from test_history_store import TEST_RESULTS_COLLECTION, migrate_all
+from type_based_bkt_system import TypeBasedPhysioTherapyBKT
+from vectorized_bkt import VectorizedBKT
+
+CHECKPOINT_ID = "bkt_rebuild"
+BACKFILL_CHECKPOINT_ID = "answer_events_backfill"
+# Geri doldurulan olaylar - bkt_version <= 0, böylece replay'de canlı olayların (1, 2, ...) önüne gelir
+BACKFILL_SOURCE = "test_results"
+BACKFILL_PROJECTION = {
+    "user_id": 1, "test_date": 1, "detailed_results.question_id": 1, "detailed_results.type": 1,
+    "detailed_results.difficulty": 1, "detailed_results.student_answer": 1, "detailed_results.is_correct": 1
+}
+# bkt_version kullanıcı başına kesin artan - timestamp (ms) aynı olabilir
+EVENT_SORT = [("user_id", 1), ("bkt_version", 1), ("seq", 1)]
+EVENT_PROJECTION = {"_id": 0, "user_id": 1, "type": 1, "difficulty": 1, "is_correct": 1}
+
+# Yeniden oluşturma (ve bkt_trainer.py) answer_events'i bu sırayla okur - sıralama index'ten gelir
+REQUIRED_INDEXES = [
+    {"collection": "answer_events", "keys": EVENT_SORT, "name": "answer_events_replay"}
+]
+
+HOT_QUERIES = [
+    {"name": "answer_events_replay", "collection": "answer_events",
+     "filter": {"user_id": {"$gt": "__audit__"}}, "projection": EVENT_PROJECTION, "sort": EVENT_SORT}
+]
+
+
+def iter_user_event_chunks(events_collection, after_user_id: Optional[str],
+                           users_per_chunk: int) -> Iterator[Tuple[List[str], List[Tuple]]]:
+    """
+    answer_events'i user_id sırasıyla akıt, users_per_chunk kullanıcılık parçalar döndür
+    Bir kullanıcının olayları hiçbir zaman iki parçaya bölünmez.
+    """
+    query = {"user_id": {"$gt": after_user_id}} if after_user_id is not None else {}
+    cursor = events_collection.find(query, EVENT_PROJECTION).sort(EVENT_SORT).batch_size(10000)
+
+    chunk_users: List[str] = []
+    chunk_events: List[Tuple] = []
+    for event in cursor:
+        user_id = event["user_id"]
+        if not chunk_users or chunk_users[-1] != user_id:
+            if len(chunk_users) >= users_per_chunk:
+                yield chunk_users, chunk_events
+                chunk_users, chunk_events = [], []
+            chunk_users.append(user_id)
+
+        chunk_events.append((
+            user_id,
+            TypeBasedPhysioTherapyBKT.normalize_question_type(event.get("type")),
+            event.get("difficulty", "중"),
+            bool(event.get("is_correct"))
+        ))
+
+    if chunk_users:
+        yield chunk_users, chunk_events
+
+
+def rebuild_chunk(engine: TypeBasedPhysioTherapyBKT, user_ids: List[str],
+                  events: List[Tuple]) -> List[Dict]:
+    """Bir parçanın olaylarını vektörel BKT motorundan geçir"""
+    type_names = list(dict.fromkeys(event[1] for event in events))
+    vector_engine = VectorizedBKT.from_engine(engine, user_ids, type_names)
+    vector_engine.apply_answers(*vector_engine.encode_answers(events))
+    return vector_engine.to_state_documents()
+
+
+def write_states(bkt_collection, states: List[Dict]):
+    """Yeni durumları toplu yaz - version artar, böylece eşzamanlı güncellemeler tekrar dener"""
+    operations = []
+    for state in states:
+        user_id = state.pop("user_id")
+        operations.append(UpdateOne(
+            {"user_id": user_id},
+            {
+                "$set": state,
+                "$inc": {"version": 1},
+                "$setOnInsert": {"created_at": state["updated_at"]}
+            },
+            upsert=True
+        ))
+    if operations:
+        bkt_collection.bulk_write(operations, ordered=False)
+
+
+def partial_history_users(bkt_collection, user_ids: List[str], events: List[Tuple]) -> Dict[str, Tuple[int, int]]:
+    """
+    Kayıtlı durumu günlükten daha fazla cevap içeren kullanıcılar: {user_id: (total_attempts, olay sayısı)}
+    Bunları günlükten yeniden hesaplamak eksik olaylardaki geçmişi siler.
+    """
+    logged = Counter(event[0] for event in events)
+    stored = bkt_collection.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "total_attempts": 1})
+    return {
+        doc["user_id"]: (doc.get("total_attempts") or 0, logged[doc["user_id"]])
+        for doc in stored
+        if (doc.get("total_attempts") or 0) > logged[doc["user_id"]]
+    }
+
+
+# ---------- answer_events geri doldurma ----------
+
+def _first_live_event_time(events_collection, user_id: str) -> Optional[datetime]:
+    """Kullanıcının günlüğe canlı yazılmış ilk olayının zamanı (ObjectId'den - test _id'leriyle aynı saat)"""
+    event = events_collection.find_one(
+        {"user_id": user_id, "bkt_version": {"$gt": 0}}, {"_id": 1}, sort=EVENT_SORT
+    )
+    if event is None or not isinstance(event["_id"], ObjectId):
+        return None
+    return event["_id"].generation_time
+
+
+def _predates_event_log(test: Dict, first_event_time: Optional[datetime]) -> bool:
+    if first_event_time is None:
+        return True
+    if not isinstance(test["_id"], ObjectId):
+        # Gömülü test_history'den taşınmış kayıt - olay günlüğünden önce
+        return True
+    # Günlük eklendikten sonraki testlerin cevapları zaten olay olarak yazıldı
+    return test["_id"].generation_time < first_event_time
+
+
+def _backfill_operations(events_collection, user_id: str, tests: List[Dict]) -> Tuple[List[UpdateOne], int]:
+    first_event_time = _first_live_event_time(events_collection, user_id)
+    eligible = [test for test in tests if _predates_event_log(test, first_event_time)]
+
+    operations = []
+    for index, test in enumerate(eligible):
+        # En eski test -len(eligible), en yenisi -1: canlı olaylardan (bkt_version >= 1) önce, test_date sırasıyla
+        bkt_version = index - len(eligible)
+        test_date = test.get("test_date")
+        for seq, result in enumerate(test.get("detailed_results") or []):
+            event = {
+                "user_id": user_id,
+                "timestamp": test_date if isinstance(test_date, datetime) else None,
+                "seq": seq,
+                "question_id": result.get("question_id"),
+                "type": TypeBasedPhysioTherapyBKT.normalize_question_type(result.get("type")),
+                "difficulty": result.get("difficulty", "중"),
+                "student_answer": result.get("student_answer"),
+                "is_correct": bool(result.get("is_correct")),
+                "bkt_version": bkt_version,
+                "source": BACKFILL_SOURCE,
+                "test_result_id": test["_id"]
+            }
+            # Deterministik _id - tekrar çalıştırmak aynı olayları iki kez eklemez
+            operations.append(UpdateOne(
+                {"_id": f"{test['_id']}-{seq}"}, {"$setOnInsert": event}, upsert=True
+            ))
+    return operations, len(tests) - len(eligible)
+
+
+def backfill_answer_events(db, force: bool = False, dry_run: bool = False) -> Dict:
+    """
+    answer_events'ten önceki testleri test_results.detailed_results'tan olay olarak ekle (bir kez)
+    Gömülü test_history dizileri önce test_results'a taşınır.
+    """
+    checkpoints = db["bkt_rebuild_checkpoints"]
+    stats = {"users": 0, "tests": 0, "events": 0, "skipped_tests": 0}
+    if not force and checkpoints.find_one({"_id": BACKFILL_CHECKPOINT_ID, "completed": True}):
+        # Sıfırlanan kullanıcıların (reset-user-bkt) olayları yeniden eklenmesin
+        print("ℹ️ answer_events backfill zaten yapılmış - tekrar için --force")
+        return stats
+
+    if not dry_run:
+        migrate_all(db)
+
+    events_collection = db["answer_events"]
+    cursor = db[TEST_RESULTS_COLLECTION].find(
+        {"detailed_results": {"$exists": True}}, BACKFILL_PROJECTION
+    ).sort([("user_id", -1), ("test_date", 1)]).batch_size(1000)  # (user_id, test_date -1) index'inin tersi
+
+    def flush(user_id: str, tests: List[Dict]):
+        operations, skipped = _backfill_operations(events_collection, user_id, tests)
+        if operations and not dry_run:
+            events_collection.bulk_write(operations, ordered=False)
+        stats["users"] += 1
+        stats["tests"] += len(tests) - skipped
+        stats["skipped_tests"] += skipped
+        stats["events"] += len(operations)
+        if stats["users"] % 1000 == 0:
+            print(f"📥 {stats['users']} kullanıcı / {stats['events']} olay geri dolduruldu")
+
+    current_user, tests = None, []
+    for test in cursor:
+        user_id = str(test["user_id"])
+        if user_id != current_user:
+            if tests:
+                flush(current_user, tests)
+            current_user, tests = user_id, []
+        tests.append(test)
+    if tests:
+        flush(current_user, tests)
+
+    if not dry_run:
+        checkpoints.replace_one(
+            {"_id": BACKFILL_CHECKPOINT_ID},
+            dict(stats, completed=True, finished_at=datetime.utcnow()),
+            upsert=True
+        )
+
+    print(f"✅ answer_events backfill: {stats['users']} kullanıcı, {stats['tests']} test, {stats['events']} olay "
+          f"({stats['skipped_tests']} test zaten günlükte)")
+    return stats
+
+
+def run_rebuild(db, engine: TypeBasedPhysioTherapyBKT, resume: bool = False,
+                users_per_chunk: int = 500, dry_run: bool = False,
+                allow_partial_history: bool = False) -> Dict:
+    checkpoints = db["bkt_rebuild_checkpoints"]
+    checkpoint = checkpoints.find_one({"_id": CHECKPOINT_ID}) if resume else None
+
+    if not checkpoints.find_one({"_id": BACKFILL_CHECKPOINT_ID, "completed": True}):
+        print("⚠️ answer_events backfill yapılmamış - önceki testler günlükte yok "
+              "(python bkt_rebuild.py --backfill-events)")
+
+    if checkpoint and checkpoint.get("completed"):
+        print("ℹ️ Önceki yeniden oluşturma tamamlanmış, baştan başlanıyor")
+        checkpoint = None
+
+    after_user_id = checkpoint.get("last_user_id") if checkpoint else None
+    processed_users = checkpoint.get("processed_users", 0) if checkpoint else 0
+    processed_events = checkpoint.get("processed_events", 0) if checkpoint else 0
+
+    if checkpoint:
+        print(f"🔁 Checkpoint'ten devam: last_user_id={after_user_id}, {processed_users} kullanıcı işlenmiş")
+    elif not dry_run:
+        checkpoints.replace_one(
+            {"_id": CHECKPOINT_ID},
+            {
+                "started_at": datetime.utcnow(),
+                "difficulty_params": engine.difficulty_params,
+                "params_version": engine.params_version,
+                "completed": False
+            },
+            upsert=True
+        )
+
+    skipped_users: Dict[str, Tuple[int, int]] = {}
+    started = time.monotonic()
+    for user_ids, events in iter_user_event_chunks(db["answer_events"], after_user_id, users_per_chunk):
+        states = rebuild_chunk(engine, user_ids, events)
+        if not allow_partial_history:
+            partial = partial_history_users(engine.bkt_collection, user_ids, events)
+            if partial:
+                states = [state for state in states if state["user_id"] not in partial]
+                skipped_users.update(partial)
+        if not dry_run:
+            write_states(engine.bkt_collection, states)
+
+        processed_users += len(user_ids)
+        processed_events += len(events)
+        elapsed = time.monotonic() - started
+
+        if not dry_run:
+            # Parça yazıldıktan sonra checkpoint - yarıda kalırsa buradan devam edilir
+            checkpoints.update_one(
+                {"_id": CHECKPOINT_ID},
+                {"$set": {
+                    "last_user_id": user_ids[-1],
+                    "processed_users": processed_users,
+                    "processed_events": processed_events,
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+
+        print(f"📈 {processed_users} kullanıcı / {processed_events} olay işlendi "
+              f"({processed_events / elapsed if elapsed > 0 else 0:.0f} olay/sn), son: {user_ids[-1]}")
+
+    if not dry_run:
+        checkpoints.update_one(
+            {"_id": CHECKPOINT_ID},
+            {"$set": {"completed": True, "finished_at": datetime.utcnow()}}
+        )
+
+    print(f"✅ Yeniden oluşturma bitti: {processed_users} kullanıcı, {processed_events} olay")
+    if skipped_users:
+        print(f"⚠️ {len(skipped_users)} kullanıcı atlandı - bkt_tracking günlükten daha fazla cevap içeriyor:")
+        for user_id, (stored_attempts, logged_events) in list(skipped_users.items())[:20]:
+            print(f"   user={user_id}: total_attempts={stored_attempts}, answer_events={logged_events}")
+        if len(skipped_users) > 20:
+            print(f"   ... ve {len(skipped_users) - 20} kullanıcı daha")
+    return {
+        "processed_users": processed_users,
+        "processed_events": processed_events,
+        "skipped_users": sorted(skipped_users)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="answer_events günlüğünden bkt_tracking'i yeniden oluştur")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--resume", action="store_true", help="son checkpoint'ten devam et")
+    parser.add_argument("--users-per-chunk", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="hesapla ama yazma")
+    parser.add_argument("--backfill-events", action="store_true",
+                        help="önce test_results'taki eski testleri answer_events'e ekle (bir kez)")
+    parser.add_argument("--force", action="store_true", help="--backfill-events'i tekrar çalıştır")
+    parser.add_argument("--allow-partial-history", action="store_true",
+                        help="günlüğü eksik kullanıcıları da günlükten yeniden yaz (eski geçmiş silinir)")
+    args = parser.parse_args()
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    mongo_client = create_mongo_client(settings)
+    engine = TypeBasedPhysioTherapyBKT(mongo_client, db_name=settings.db_name)
+    # bkt_trainer.py ile yayınlanmış en son parametrelerle yeniden hesapla
+    print(f"ℹ️ BKT parameters: version {engine.sync_parameters(force=True)}")
+    if args.backfill_events:
+        backfill_answer_events(engine.db, force=args.force, dry_run=args.dry_run)
+    run_rebuild(engine.db, engine, resume=args.resume, users_per_chunk=args.users_per_chunk,
+                dry_run=args.dry_run, allow_partial_history=args.allow_partial_history)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+# bkt_trainer.py - Fit BKT parameters with EM from logged answers
+#
+# answer_events (ya da eski kayıtlar için test_results.detailed_results) içindeki
+# (kullanıcı, type) cevap dizilerinden slip/guess/learn/prior değerlerini EM (Baum-Welch) ile öğrenir.
+# Model motordakiyle aynıdır: type başına tek gizli durum (biliyor / bilmiyor), her cevabın
+# slip/guess/learn değeri sorunun zorluğundan, başlangıç olasılığı ilk sorunun zorluğunun prior'ından.
+# (Motorun 0.01-0.99 sınırlaması olasılık modelinin parçası değildir, EM'de yok sayılır.)
+#
+# Tüm diziler uzunluğa göre sıralanıp zaman-öncelikli düzleştirilir - ileri/geri geçişler adım başına
+# tek NumPy işlemi. --per-type ile her type ayrıca öğrenilir (süreç havuzu, küresel değerlere doğru
+# büzülmüş MAP tahmini); az verisi olan type'lar küresel değerleri kullanır.
+#
+# Kullanım:
+#   python bkt_trainer.py                                         # öğren ve özet yazdır
+#   python bkt_trainer.py --per-type --processes 8 --output bkt_params.json
+#   python bkt_trainer.py --per-type --publish                    # bkt_parameters'a yeni version olarak yayınla
+#   python bkt_trainer.py --publish-file bkt_params.json          # önceden üretilmiş (ya da eski) seti yayınla
+#
+# Motor yayınlanan en son seti TTL ile kendisi yükler (TypeBasedPhysioTherapyBKT.sync_parameters).
+# Kayıtlı mastery değerlerini yeni parametrelerle yeniden hesaplamak için: python bkt_rebuild.py
+
+import argparse
+import json
+import multiprocessing
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from bkt_rebuild import iter_user_event_chunks
+from database import MongoSettings, create_mongo_client
+from index_manager import create_indexes
+from test_history_store import TEST_RESULTS_COLLECTION
+from type_based_bkt_system import (
+    BKT_PARAMETERS_COLLECTION, BKT_PARAMETERS_INDEX, BKT_PARAMETER_FIELDS, TypeBasedPhysioTherapyBKT,
+    validate_parameter_set
+)
+from vectorized_bkt import DIFFICULTIES, DIFFICULTY_INDEX
+
+# EM sırasında parametre sınırları - slip/guess < 0.5 olmalı ki "biliyor" durumu anlamını korusun
+PARAM_BOUNDS = {
+    "slip": (0.001, 0.45),
+    "guess": (0.001, 0.45),
+    "learn": (0.0001, 0.5),
+    "prior": (0.01, 0.99)
+}
+
+RawSequence = Tuple[List[int], List[bool]]  # (zorluk indeksleri, doğru/yanlış) - zaman sırasıyla
+
+
+class SequenceSet:
+    """
+    Cevap dizileri - uzunluğa göre azalan sırada, zaman-öncelikli düzleştirilmiş:
+    t. adımda ilk active_counts[t] dizi aktiftir ve o adımın cevapları offsets[t]:offsets[t + 1] aralığındadır.
+    Dolgu (padding) yok, her adım tek vektör işlemi.
+    """
+
+    def __init__(self, sequences: Sequence[RawSequence]):
+        sequences = [sequence for sequence in sequences if len(sequence[0])]
+        lengths = np.array([len(difficulties) for difficulties, _ in sequences], dtype=np.int64)
+        order = np.argsort(-lengths, kind="stable")
+
+        self.num_sequences = len(sequences)
+        self.lengths = lengths[order]
+        max_length = int(self.lengths[0]) if self.num_sequences else 0
+
+        # active_counts[t] = uzunluğu t'den büyük dizi sayısı
+        ended = np.cumsum(np.bincount(self.lengths, minlength=max_length + 1))[:max_length]
+        self.active_counts = self.num_sequences - ended
+        self.offsets = np.concatenate([[0], np.cumsum(self.active_counts)]).astype(np.int64)
+        self.num_answers = int(self.offsets[-1])
+
+        self.difficulty = np.empty(self.num_answers, dtype=np.int64)
+        self.correct = np.empty(self.num_answers, dtype=bool)
+        if self.num_sequences:
+            steps = np.concatenate([np.arange(length) for length in self.lengths])
+            ranks = np.repeat(np.arange(self.num_sequences), self.lengths)
+            positions = self.offsets[steps] + ranks
+            self.difficulty[positions] = np.concatenate([sequences[i][0] for i in order])
+            self.correct[positions] = np.concatenate([sequences[i][1] for i in order])
+
+        self.first_difficulty = self.difficulty[:self.num_sequences]
+
+    def answers_per_difficulty(self) -> np.ndarray:
+        return np.bincount(self.difficulty, minlength=len(DIFFICULTIES))
+
+
+def params_to_arrays(difficulty_params: Dict) -> Dict[str, np.ndarray]:
+    return {
+        field: np.array([float(difficulty_params[d][field]) for d in DIFFICULTIES])
+        for field in BKT_PARAMETER_FIELDS
+    }
+
+
+def arrays_to_params(arrays: Dict[str, np.ndarray], difficulties: Sequence[int] = range(len(DIFFICULTIES))) -> Dict:
+    return {
+        DIFFICULTIES[d]: {field: round(float(arrays[field][d]), 6) for field in BKT_PARAMETER_FIELDS}
+        for d in difficulties
+    }
+
+
+def e_step(sequences: SequenceSet, params: Dict[str, np.ndarray]) -> Tuple[Dict[str, np.ndarray], float]:
+    """
+    İleri-geri geçiş (ölçekli) - zorluk başına beklenen sayımlar ve log-olabilirlik
+    Geçiş: t. cevaptan sonra bilmiyor -> biliyor olasılığı learn[zorluk_t] (unutma yok).
+    """
+    difficulty, correct, offsets = sequences.difficulty, sequences.correct, sequences.offsets
+    slip, guess, learn = params["slip"][difficulty], params["guess"][difficulty], params["learn"][difficulty]
+
+    # Gözlem olasılıkları: P(cevap | biliyor), P(cevap | bilmiyor)
+    emit_known = np.where(correct, 1 - slip, slip)
+    emit_unknown = np.where(correct, guess, 1 - guess)
+
+    # İleri: known[i] = P(biliyor_t | cevaplar_1..t), scale[i] = P(cevap_t | cevaplar_1..t-1)
+    known = np.empty(sequences.num_answers)
+    scale = np.empty(sequences.num_answers)
+    predicted = params["prior"][sequences.first_difficulty]
+    for t in range(len(sequences.active_counts)):
+        start, end = offsets[t], offsets[t + 1]
+        p = predicted[:end - start]
+        joint_known = p * emit_known[start:end]
+        step_scale = joint_known + (1 - p) * emit_unknown[start:end]
+        filtered = joint_known / step_scale
+        known[start:end] = filtered
+        scale[start:end] = step_scale
+        predicted = filtered + (1 - filtered) * learn[start:end]
+
+    # Geri: beta'lar scale ile normalize - gamma = filtered * beta
+    beta_known = np.ones(sequences.num_answers)
+    beta_unknown = np.ones(sequences.num_answers)
+    learned = np.zeros(sequences.num_answers)  # beklenen bilmiyor_t -> biliyor_t+1 geçişi
+    has_next = np.zeros(sequences.num_answers, dtype=bool)
+    for t in range(len(sequences.active_counts) - 2, -1, -1):
+        start = offsets[t]
+        next_start, next_end = offsets[t + 1], offsets[t + 2]
+        continuing = next_end - next_start  # ilk 'continuing' dizi t + 1'de devam ediyor
+
+        next_known = emit_known[next_start:next_end] * beta_known[next_start:next_end] / scale[next_start:next_end]
+        next_unknown = emit_unknown[next_start:next_end] * beta_unknown[next_start:next_end] / scale[next_start:next_end]
+        step_learn = learn[start:start + continuing]
+
+        beta_known[start:start + continuing] = next_known
+        beta_unknown[start:start + continuing] = step_learn * next_known + (1 - step_learn) * next_unknown
+        learned[start:start + continuing] = (1 - known[start:start + continuing]) * step_learn * next_known
+        has_next[start:start + continuing] = True
+
+    gamma_known = known * beta_known
+    gamma_unknown = (1 - known) * beta_unknown
+    num_difficulties = len(DIFFICULTIES)
+
+    def per_difficulty(weights: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        if mask is None:
+            return np.bincount(difficulty, weights=weights, minlength=num_difficulties)
+        return np.bincount(difficulty[mask], weights=weights[mask], minlength=num_difficulties)
+
+    first_known = gamma_known[:sequences.num_sequences]
+    counts = {
+        "slip": (per_difficulty(gamma_known * ~correct), per_difficulty(gamma_known)),
+        "guess": (per_difficulty(gamma_unknown * correct), per_difficulty(gamma_unknown)),
+        "learn": (per_difficulty(learned, has_next), per_difficulty(gamma_unknown, has_next)),
+        "prior": (
+            np.bincount(sequences.first_difficulty, weights=first_known, minlength=num_difficulties),
+            np.bincount(sequences.first_difficulty, minlength=num_difficulties).astype(float)
+        ),
+        "initial_mastery": float(first_known.mean()) if sequences.num_sequences else 0.0
+    }
+    return counts, float(np.log(scale).sum())
+
+
+def m_step(counts: Dict, params: Dict[str, np.ndarray], anchor: Dict[str, np.ndarray],
+           strength: float) -> Dict[str, np.ndarray]:
+    """Beklenen sayımlardan yeni parametreler - strength > 0 ise anchor'a doğru sözde sayım (MAP)"""
+    updated = {}
+    for field in BKT_PARAMETER_FIELDS:
+        numerator, denominator = counts[field]
+        numerator = numerator + strength * anchor[field]
+        denominator = denominator + strength
+        with np.errstate(divide="ignore", invalid="ignore"):
+            estimate = np.where(denominator > 0, numerator / denominator, params[field])
+        low, high = PARAM_BOUNDS[field]
+        updated[field] = np.clip(estimate, low, high)
+    return updated
+
+
+def fit_bkt(sequences: SequenceSet, initial_params: Dict, anchor_params: Optional[Dict] = None,
+            strength: float = 0.0, max_iter: int = 100, tol: float = 1e-6) -> Dict:
+    """
+    EM ile zorluk başına slip/guess/learn/prior
+    tol: cevap başına log-olabilirlik artışı bu değerin altına düşünce durur
+    """
+    params = params_to_arrays(initial_params)
+    anchor = params_to_arrays(anchor_params or initial_params)
+    for field in BKT_PARAMETER_FIELDS:
+        params[field] = np.clip(params[field], *PARAM_BOUNDS[field])
+
+    log_likelihood = -np.inf
+    counts: Dict = {}
+    converged = False
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        counts, new_log_likelihood = e_step(sequences, params)
+        improvement = (new_log_likelihood - log_likelihood) / max(1, sequences.num_answers)
+        log_likelihood = new_log_likelihood
+        if improvement < tol:
+            converged = True
+            break
+        params = m_step(counts, params, anchor, strength)
+
+    answers = sequences.answers_per_difficulty()
+    return {
+        "difficulty_params": arrays_to_params(params, [d for d in range(len(DIFFICULTIES)) if answers[d] > 0]),
+        "all_difficulty_params": arrays_to_params(params),
+        "initial_mastery": round(counts.get("initial_mastery", 0.0), 6),
+        "log_likelihood": log_likelihood,
+        "iterations": iterations,
+        "converged": converged,
+        "num_sequences": sequences.num_sequences,
+        "num_answers": sequences.num_answers
+    }
+
+
+def _fit_type_job(job: Tuple) -> Tuple[str, Dict]:
+    question_type, sequences, global_params, strength, max_iter, tol = job
+    return question_type, fit_bkt(sequences, global_params, global_params, strength, max_iter, tol)
+
+
+def fit_per_type(sequences_by_type: Dict[str, SequenceSet], global_params: Dict, strength: float = 20.0,
+                 min_sequences: int = 30, processes: int = 1, max_iter: int = 100,
+                 tol: float = 1e-6) -> Dict[str, Dict]:
+    """Her type için ayrı EM (küresel değerlerden başlar ve onlara doğru büzülür) - süreç havuzunda"""
+    jobs = [
+        (question_type, sequences, global_params, strength, max_iter, tol)
+        for question_type, sequences in sequences_by_type.items()
+        if sequences.num_sequences >= min_sequences
+    ]
+    # Büyük type'lar önce - süreçler arasında yük dengesi
+    jobs.sort(key=lambda job: -job[1].num_answers)
+
+    if processes <= 1 or len(jobs) <= 1:
+        return dict(_fit_type_job(job) for job in jobs)
+
+    results = {}
+    with multiprocessing.Pool(min(processes, len(jobs))) as pool:
+        for question_type, result in pool.imap_unordered(_fit_type_job, jobs):
+            results[question_type] = result
+    return results
+
+
+# ---------- Veri kaynakları ----------
+
+def _collect(sequences_by_type: Dict[str, List[RawSequence]], user_sequences: Dict[str, RawSequence]):
+    for question_type, sequence in user_sequences.items():
+        sequences_by_type.setdefault(question_type, []).append(sequence)
+    user_sequences.clear()
+
+
+def _append_answer(user_sequences: Dict[str, RawSequence], question_type, difficulty, is_correct) -> bool:
+    d = DIFFICULTY_INDEX.get(difficulty)
+    if d is None:
+        return False
+    difficulties, outcomes = user_sequences.setdefault(question_type, ([], []))
+    difficulties.append(d)
+    outcomes.append(bool(is_correct))
+    return True
+
+
+def load_event_sequences(db, users_per_chunk: int = 5000) -> Dict[str, List[RawSequence]]:
+    """answer_events -> {type: [(zorluklar, doğru/yanlış)]} - (kullanıcı, type) başına bir dizi"""
+    sequences_by_type: Dict[str, List[RawSequence]] = {}
+    for _, events in iter_user_event_chunks(db["answer_events"], None, users_per_chunk):
+        user_sequences: Dict[str, RawSequence] = {}
+        current_user = None
+        for user_id, question_type, difficulty, is_correct in events:
+            if user_id != current_user:
+                _collect(sequences_by_type, user_sequences)
+                current_user = user_id
+            _append_answer(user_sequences, question_type, difficulty, is_correct)
+        _collect(sequences_by_type, user_sequences)
+    return sequences_by_type
+
+
+def iter_test_result_answers(db) -> Iterator[Tuple[str, str, str, bool]]:
+    """test_results.detailed_results - answer_events'ten önceki geçmiş için"""
+    cursor = db[TEST_RESULTS_COLLECTION].find(
+        {"detailed_results": {"$exists": True}},
+        {"_id": 0, "user_id": 1, "detailed_results.type": 1,
+         "detailed_results.difficulty": 1, "detailed_results.is_correct": 1}
+    ).sort([("user_id", -1), ("test_date", 1)]).batch_size(1000)  # (user_id, test_date -1) index'inin tersi
+    for test in cursor:
+        for result in test.get("detailed_results") or []:
+            yield (
+                str(test["user_id"]),
+                TypeBasedPhysioTherapyBKT.normalize_question_type(result.get("type")),
+                result.get("difficulty", "중"),
+                bool(result.get("is_correct"))
+            )
+
+
+def load_test_result_sequences(db) -> Dict[str, List[RawSequence]]:
+    sequences_by_type: Dict[str, List[RawSequence]] = {}
+    user_sequences: Dict[str, RawSequence] = {}
+    current_user = None
+    for user_id, question_type, difficulty, is_correct in iter_test_result_answers(db):
+        if user_id != current_user:
+            _collect(sequences_by_type, user_sequences)
+            current_user = user_id
+        _append_answer(user_sequences, question_type, difficulty, is_correct)
+    _collect(sequences_by_type, user_sequences)
+    return sequences_by_type
+
+
+# ---------- Eğitim ve yayın ----------
+
+def train(sequences_by_type: Dict[str, List[RawSequence]], initial_params: Dict, per_type: bool = False,
+          strength: float = 20.0, min_sequences: int = 30, processes: int = 1,
+          max_iter: int = 100, tol: float = 1e-6) -> Dict:
+    """Küresel (zorluk başına) + isteğe bağlı type başına parametre seti (version yayınlanırken verilir)"""
+    started = time.monotonic()
+    all_sequences = [sequence for sequences in sequences_by_type.values() for sequence in sequences]
+    global_fit = fit_bkt(SequenceSet(all_sequences), initial_params, max_iter=max_iter, tol=tol)
+    global_params = global_fit["all_difficulty_params"]
+    print(f"🌐 Global fit: {global_fit['num_sequences']} dizi, {global_fit['num_answers']} cevap, "
+          f"{global_fit['iterations']} iterasyon ({time.monotonic() - started:.1f}s)")
+
+    param_set = {
+        "created_at": datetime.utcnow().isoformat(),
+        "difficulty_params": global_params,
+        "initial_type_mastery": global_fit["initial_mastery"],
+        "type_params": {},
+        "type_initial_mastery": {},
+        "training": {
+            "num_sequences": global_fit["num_sequences"],
+            "num_answers": global_fit["num_answers"],
+            "log_likelihood": global_fit["log_likelihood"],
+            "iterations": global_fit["iterations"],
+            "converged": global_fit["converged"]
+        }
+    }
+
+    if per_type:
+        type_started = time.monotonic()
+        type_fits = fit_per_type(
+            {question_type: SequenceSet(sequences) for question_type, sequences in sequences_by_type.items()},
+            global_params, strength=strength, min_sequences=min_sequences,
+            processes=processes, max_iter=max_iter, tol=tol
+        )
+        for question_type in sorted(type_fits):
+            param_set["type_params"][question_type] = type_fits[question_type]["difficulty_params"]
+            param_set["type_initial_mastery"][question_type] = type_fits[question_type]["initial_mastery"]
+        param_set["training"].update({
+            "types_fitted": len(type_fits),
+            "types_total": len(sequences_by_type),
+            "per_type_strength": strength,
+            "per_type_min_sequences": min_sequences
+        })
+        print(f"🧩 Per-type fit: {len(type_fits)}/{len(sequences_by_type)} type "
+              f"({time.monotonic() - type_started:.1f}s, {processes} süreç)")
+
+    param_set["training"]["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    return param_set
+
+
+def next_version(db) -> int:
+    head = db[BKT_PARAMETERS_COLLECTION].find_one({}, {"version": 1}, sort=[("version", DESCENDING)])
+    return head["version"] + 1 if head else 1
+
+
+def publish_parameter_set(db, param_set: Dict, max_attempts: int = 5) -> int:
+    """Yeni version olarak ekle - eşzamanlı yayında unique index çakışırsa sonraki version"""
+    collection = db[BKT_PARAMETERS_COLLECTION]
+    create_indexes(db, [BKT_PARAMETERS_INDEX])
+    for _ in range(max_attempts):
+        version = next_version(db)
+        document = dict(param_set, version=version, published_at=datetime.utcnow())
+        document.pop("_id", None)
+        validate_parameter_set(document)
+        try:
+            collection.insert_one(document)
+            return version
+        except DuplicateKeyError:
+            continue
+    raise RuntimeError(f"Could not publish BKT parameters after {max_attempts} attempts")
+
+
+def print_summary(current_params: Dict, param_set: Dict):
+    print("📊 난이도별 파라미터 (현재 → 학습):")
+    for difficulty in DIFFICULTIES:
+        old, new = current_params[difficulty], param_set["difficulty_params"][difficulty]
+        changes = ", ".join(f"{field} {old[field]:.3f}→{new[field]:.3f}" for field in BKT_PARAMETER_FIELDS)
+        print(f"   {difficulty}: {changes}")
+    print(f"   initial_type_mastery: {param_set['initial_type_mastery']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cevap kayıtlarından BKT parametrelerini EM ile öğren")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--source", choices=["events", "test_results"], default="events",
+                        help="answer_events ya da test_results.detailed_results")
+    parser.add_argument("--per-type", action="store_true", help="type başına parametreleri de öğren")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--strength", type=float, default=20.0, help="type parametrelerinin küresel değere büzülmesi (sözde cevap sayısı)")
+    parser.add_argument("--min-sequences", type=int, default=30, help="type başına öğrenmek için en az (kullanıcı, type) dizisi")
+    parser.add_argument("--max-iter", type=int, default=100)
+    parser.add_argument("--tol", type=float, default=1e-6)
+    parser.add_argument("--output", help="parametre setini JSON olarak yaz")
+    parser.add_argument("--publish", action="store_true", help="bkt_parameters'a yeni version olarak yayınla")
+    parser.add_argument("--publish-file", help="öğrenmeden bu JSON setini yayınla")
+    args = parser.parse_args()
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    mongo_client = create_mongo_client(settings)
+    engine = TypeBasedPhysioTherapyBKT(mongo_client, db_name=settings.db_name)
+    db = engine.db
+
+    if args.publish_file:
+        with open(args.publish_file, encoding="utf-8") as f:
+            param_set = json.load(f)
+        param_set["source_version"] = param_set.get("version")
+        print(f"✅ Yayınlandı: version {publish_parameter_set(db, param_set)} ({args.publish_file})")
+        return
+
+    # Mevcut (yayınlanmış ya da varsayılan) parametrelerden başla
+    engine.sync_parameters(force=True)
+    started = time.monotonic()
+    if args.source == "events":
+        sequences_by_type = load_event_sequences(db)
+    else:
+        sequences_by_type = load_test_result_sequences(db)
+    num_sequences = sum(len(sequences) for sequences in sequences_by_type.values())
+    print(f"📥 {num_sequences} dizi, {len(sequences_by_type)} type yüklendi ({time.monotonic() - started:.1f}s)")
+    if not num_sequences:
+        print("⚠️ Öğrenecek cevap yok")
+        return
+
+    param_set = train(
+        sequences_by_type, engine.difficulty_params, per_type=args.per_type, strength=args.strength,
+        min_sequences=args.min_sequences, processes=args.processes, max_iter=args.max_iter, tol=args.tol
+    )
+    param_set["source"] = "answer_events" if args.source == "events" else TEST_RESULTS_COLLECTION
+    param_set["base_version"] = engine.params_version
+    print_summary(engine.difficulty_params, param_set)
+
+    if args.publish:
+        param_set["version"] = publish_parameter_set(db, param_set)
+        print(f"✅ Yayınlandı: version {param_set['version']} - motorlar TTL içinde yükler")
+    else:
+        param_set["version"] = next_version(db)
+        validate_parameter_set(param_set)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(param_set, f, ensure_ascii=False, indent=2, default=str)
+        print(f"💾 {args.output} (version {param_set['version']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# database.py - MongoDB connection settings and client factory
+#
+# Tüm ayarlar ortam değişkenlerinden (.env destekli) okunur:
+#   MONGO_URI                          mongodb://localhost:27017/
+#   MONGO_DB_NAME                      physical_therapy_questions
+#   MONGO_MAX_POOL_SIZE                50   (worker başına bağlantı üst sınırı)
+#   MONGO_MIN_POOL_SIZE                0
+#   MONGO_CONNECT_TIMEOUT_MS           5000
+#   MONGO_SERVER_SELECTION_TIMEOUT_MS  5000
+#   MONGO_SOCKET_TIMEOUT_MS            30000
+#   MONGO_READ_PREFERENCE              primary | primaryPreferred | secondary | secondaryPreferred | nearest
+#   MONGO_WRITE_CONCERN                1 | majority
+#   MONGO_WRITE_JOURNAL                true | false
+#   MONGO_ENSURE_INDEXES               true | false (başlangıçta index_manager ile index oluştur)
+#
+# Uygulama tek bir istemci kullanır (main.py lifespan) - bkz. services.py
+
+import os
+from typing import Optional, Union
+
+import pymongo
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/"
+DEFAULT_DB_NAME = "physical_therapy_questions"
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class MongoSettings:
+    """MongoDB bağlantı ayarları"""
+
+    def __init__(self, uri: Optional[str] = None, db_name: Optional[str] = None):
+        self.uri = uri or os.getenv("MONGO_URI", DEFAULT_MONGO_URI)
+        self.db_name = db_name or os.getenv("MONGO_DB_NAME", DEFAULT_DB_NAME)
+        self.max_pool_size = _env_int("MONGO_MAX_POOL_SIZE", 50)
+        self.min_pool_size = _env_int("MONGO_MIN_POOL_SIZE", 0)
+        self.connect_timeout_ms = _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000)
+        self.server_selection_timeout_ms = _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+        self.socket_timeout_ms = _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000)
+        self.read_preference = os.getenv("MONGO_READ_PREFERENCE", "primary")
+        self.write_concern: Union[int, str] = self._parse_write_concern(os.getenv("MONGO_WRITE_CONCERN", "1"))
+        self.write_journal = _env_bool("MONGO_WRITE_JOURNAL", False)
+        self.ensure_indexes = _env_bool("MONGO_ENSURE_INDEXES", True)
+
+    @staticmethod
+    def _parse_write_concern(value: str) -> Union[int, str]:
+        value = value.strip()
+        return int(value) if value.isdigit() else value
+
+    def client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "readPreference": self.read_preference,
+            "w": self.write_concern,
+            "appname": "physio-exam-api"
+        }
+        if self.write_journal:
+            options["journal"] = True
+        return options
+
+
+def create_mongo_client(settings: Optional[MongoSettings] = None) -> pymongo.MongoClient:
+    """Ayarlara göre MongoClient oluştur (bağlantı ilk kullanımda açılır)"""
+    settings = settings or MongoSettings()
+    print(f"🔌 MongoDB client: pool={settings.min_pool_size}-{settings.max_pool_size}, "
+          f"readPreference={settings.read_preference}, w={settings.write_concern}")
+    return pymongo.MongoClient(settings.uri, **settings.client_options())
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Body
-from typing import Dict, Any, List, Optional, Union
-import pymongo 
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Body, Depends, Header, Request, Response
+from typing import Dict, Any, List, Optional, Tuple, Union
+import hmac
 import uuid
 import random
 import utils
@@ -9,15 +9,28 @@ import tempfile
 import os
 from bson import ObjectId
 import datetime
-from type_based_bkt_system import TypeBasedPhysioTherapyBKT
+from question_resolver import fetch_questions_by_ids, fetch_question
+from async_db import run_blocking
+from services import AppServices, get_services
+from json_response import BSONJSONRoute, dumps as json_dumps
+from question_dto import (
+    QUESTION_FIELDS, DEFAULT_QUESTION_FIELDS, ADMIN_QUESTION_FIELDS,
+    parse_fields, question_projection, to_question_dto
+)
+from test_history_store import (
+    record_test_result, get_test_history, get_test_by_index,
+    count_test_results, migrate_user_history
+)
 
-# MongoDB 
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client["physical_therapy_questions"]
-bkt_system = TypeBasedPhysioTherapyBKT(mongo_client)
+exam_router = APIRouter(prefix="/api/exam", tags=["exam"], route_class=BSONJSONRoute)
 
+# Güncel seviye testi formunun tarayıcı/proxy önbelleğinde kalma süresi (saniye) - ETag ile yeniden doğrulanır
+LEVEL_TEST_MAX_AGE = int(os.getenv("LEVEL_TEST_MAX_AGE", "300"))
+# Form yayınlama X-Admin-Key başlığında bu anahtarı ister - ayarlanmazsa yayınlama kapalı
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 
-exam_router = APIRouter(prefix="/api/exam", tags=["exam"])
+# (form_id, alanlar) -> hazır JSON gövdesi (formlar değişmez, aynı form her istekte yeniden serileştirilmez)
+_level_test_bodies: Dict[Tuple[str, Tuple[str, ...]], bytes] = {}
 
 class Question(BaseModel):
     problem_id: Union[str, int]  # Hem string hem int kabul eder
@@ -54,6 +67,7 @@ class MergeData(BaseModel):
 class TestSubmission(BaseModel):
     user_id: str
     answers: Dict[str, int]  # {question_id: selected_answer}
+    test_version: Optional[int] = None  # çözülen seviye testi formunun version'ı (test_info.test_version)
 
 class AnswerCheck(BaseModel):
     question_id: str
@@ -83,7 +97,7 @@ async def upload_questions_pdf(file: UploadFile = File(...)):
             temp_file.write(file_content)
         
         # PDF'i parse et
-        questions =utils.parse_questions_pdf(temp_file_path)
+        questions = await run_blocking(utils.parse_questions_pdf, temp_file_path)
         
         # İşimiz bitti, şimdi dosyayı silebiliriz
         if os.path.exists(temp_file_path):
@@ -111,7 +125,7 @@ async def upload_answers_pdf(file: UploadFile = File(...)):
             temp_file.write(file_content)
         
         # utils.py içindeki parse fonksiyonunu çağır
-        answers = utils.parse_answer_key_pdf(temp_file_path)
+        answers = await run_blocking(utils.parse_answer_key_pdf, temp_file_path)
         # İşimiz bitti, şimdi dosyayı silebiliriz
         if os.path.exists(temp_file_path):
             os.unlink(temp_file_path)
@@ -123,7 +137,7 @@ async def upload_answers_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"PDF parse işlemi sırasında hata: {str(e)}")
 # merge questions and answers and save to mongodb
 @exam_router.post("/merge-and-save")
-async def merge_questions_and_answers(data: dict):
+async def merge_questions_and_answers(data: dict, services: AppServices = Depends(get_services)):
     try:
         questions_raw = data.get("questions", [])
         answers_raw = data.get("answers", [])
@@ -178,7 +192,7 @@ async def merge_questions_and_answers(data: dict):
         #print(f"  - Filtrelenmiş cevaplar: {len(normalized_answers)}")
         
         # Koleksiyonu al
-        custom_collection = db[collection_name]
+        custom_collection = services.adb[collection_name]
         
         # Kaydedilecek veriyi hazırla - SADECE MERGE İŞLEMİ
         data_to_save = []
@@ -205,7 +219,11 @@ async def merge_questions_and_answers(data: dict):
         
         # MongoDB'ye kaydet - ObjectId otomatik atanacak
         if data_to_save:
-            result = custom_collection.insert_many(data_to_save)
+            result = await custom_collection.insert_many(data_to_save)
+            
+            # Bellekteki soru kataloğunu yeni sorularla güncelle
+            if collection_name in services.question_catalog.collections:
+                await run_blocking(services.question_catalog.refresh, collection_name)
             
             # Başarı mesajını oluştur
             if normalized_answers:
@@ -234,109 +252,167 @@ async def merge_questions_and_answers(data: dict):
         print(f"❌ Kaydetme hatası: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Veri kaydetme işlemi sırasında hata: {str(e)}")
 
+def _question_fields(fields: Optional[str], allowed=QUESTION_FIELDS, default=DEFAULT_QUESTION_FIELDS):
+    """?fields= parametresi - bilinmeyen alan 400"""
+    try:
+        return parse_fields(fields, allowed, default)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _level_test_body(form: Dict, fields) -> bytes:
+    """Formun yanıt gövdesi - (form_id, alanlar) başına bir kez serileştirilir"""
+    cache_key = (form["form_id"], fields)
+    body = _level_test_bodies.get(cache_key)
+    if body is None:
+        questions = [to_question_dto(question, fields) for question in form["questions"]]
+        counts = form["difficulty_counts"]
+        payload = {
+            "status": "success",
+            "test": questions,
+            "test_info": {
+                "total_questions": len(questions),
+                "easy_questions": counts.get("하", 0),
+                "medium_questions": counts.get("중", 0),
+                "hard_questions": counts.get("상", 0),
+                "is_standardized": True,  # Bu testin standart olduğunu belirt
+                "seed": form["seed"],
+                "test_version": form["version"],
+                "form_id": form["form_id"]
+            }
+        }
+        body = json_dumps(payload)
+        # Eski version'lar nadiren istenir - önbellek sınırsız büyümesin
+        if len(_level_test_bodies) >= 16:
+            _level_test_bodies.clear()
+        _level_test_bodies[cache_key] = body
+    return body
+
 # Diagnosis test endpoint
 @exam_router.get("/level-test")
-async def get_level_test():
+async def get_level_test(request: Request, seed: Optional[int] = None, version: Optional[int] = None,
+                         fields: Optional[str] = None, services: AppServices = Depends(get_services)):
     """
     Diagnosis test. This endpoint returns a standardized level test with fixed questions.
+    - Varsayılan: yayınlanmış güncel form (test_info.test_version / form_id). ETag + Cache-Control ile
+      önbelleğe alınabilir, If-None-Match eşleşirse 304.
+    - version: belirli bir form (değişmez - immutable olarak önbelleğe alınır)
+    - seed: kayıtsız, o seed'le anlık seçilmiş test (aynı seed + aynı soru bankası -> aynı sorular, aynı sıra)
+    - fields: soru alanları, ör. "_id,problem,choices" (varsayılan: _id,problem,choices,difficulty,type)
     """
+    question_fields = _question_fields(fields)
     try:
-        # Doğru veritabanı ve koleksiyonu kullan
-        collection = db["diagnosis_test"]
-        
-        # Sabit seed ile rastgele seçim - herkes aynı soruları görecek
-        #import random
-        #random.seed(12345)  # Sabit seed
-        
-        # Her bir zorluk seviyesinden soruları çek
-        easy_questions = list(collection.find({"difficulty": "하"}))
-        medium_questions = list(collection.find({"difficulty": "중"}))
-        hard_questions = list(collection.find({"difficulty": "상"}))
-        
-        print(f"Zorluk seviyelerindeki soru sayıları: Kolay:{len(easy_questions)}, Orta:{len(medium_questions)}, Zor:{len(hard_questions)}")
-        
-        # Her zorluk seviyesinden kaç soru alınacağını belirle
-        easy_count = min(10, len(easy_questions))
-        medium_count = min(10, len(medium_questions))
-        hard_count = min(10, len(hard_questions))
-        
-        # Sabit seed ile rastgele soruları seç (herkes aynı soruları alacak)
-        selected_easy = random.sample(easy_questions, easy_count) if easy_count > 0 else []
-        selected_medium = random.sample(medium_questions, medium_count) if medium_count > 0 else []
-        selected_hard = random.sample(hard_questions, hard_count) if hard_count > 0 else []
-        
-        # Tüm soruları birleştir
-        all_questions = selected_easy + selected_medium + selected_hard
-        
-        # Hiç soru bulunamazsa uyarı ver
-        if not all_questions:
-            raise HTTPException(status_code=404, detail="Hiç soru bulunamadı. Lütfen veritabanınızı kontrol edin.")
-        
-        # Soruları sabit sırayla karıştır (herkes aynı sırayı görecek)
-        random.shuffle(all_questions)
-        
-        # ObjectId'leri string'e dönüştür
-        for question in all_questions:
-            if '_id' in question and not isinstance(question['_id'], str):
-                question['_id'] = str(question['_id'])
-                
-            # Streamlit uygulaması için alan adlarını standartlaştır
-            if 'Choices' not in question and 'choices' in question:
-                question['Choices'] = question['choices']
-            elif 'choices' not in question and 'Choices' in question:
-                question['choices'] = question['Choices']
-                
-            if 'Problem' not in question and 'problem' in question:
-                question['Problem'] = question['problem']
-            elif 'problem' not in question and 'Problem' in question:
-                question['problem'] = question['Problem']
-                
-            if 'Answer Key' not in question and 'answer_key' in question:
-                question['Answer Key'] = question['answer_key']
-            elif 'answer_key' not in question and 'Answer Key' in question:
-                question['answer_key'] = question['Answer Key']
-        
-        print(f"✅ Standart seviye tespit sınavı hazırlandı: {len(all_questions)} soru")
-        print(f"📊 Soru dağılımı - Kolay: {easy_count}, Orta: {medium_count}, Zor: {hard_count}")
-        
-        return {
-            "status": "success",
-            "test": all_questions,
-            "test_info": {
-                "total_questions": len(all_questions),
-                "easy_questions": easy_count,
-                "medium_questions": medium_count,
-                "hard_questions": hard_count,
-                "is_standardized": True  # Bu testin standart olduğunu belirt
-            }
-        }
+        if seed is not None:
+            return await _build_seeded_level_test(services, seed, question_fields)
+        
+        if version is not None:
+            form = await run_blocking(services.level_test_forms.get, version)
+            if form is None:
+                raise HTTPException(status_code=404, detail=f"Level test version {version} not found")
+            cache_control = "public, max-age=31536000, immutable"
+        else:
+            form = await run_blocking(services.level_test_forms.current)
+            cache_control = f"public, max-age={LEVEL_TEST_MAX_AGE}"
+        
+        # Alan seçimi farklı bir temsil - ETag'e eklenir
+        etag = f'"{form["form_id"]}"'
+        if question_fields != DEFAULT_QUESTION_FIELDS:
+            etag = f'"{form["form_id"]}:{",".join(question_fields)}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        return Response(content=_level_test_body(form, question_fields), media_type="application/json", headers=headers)
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing diagnosis test: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing diagnosis test:  {str(e)}")
 
 
+async def _build_seeded_level_test(services: AppServices, seed: int, fields) -> Dict:
+    """Yayınlanmış formdan bağımsız, seed ile seçilen test - seçim ve karıştırma aynı rng'den"""
+    rng = random.Random(seed)
+    
+    # Her bir zorluk seviyesinden soruları bellekteki katalogdan seç
+    await services.question_catalog.aensure_loaded()
+    
+    selected_easy = services.question_catalog.sample("diagnosis_test", 10, difficulty="하", rng=rng)
+    selected_medium = services.question_catalog.sample("diagnosis_test", 10, difficulty="중", rng=rng)
+    selected_hard = services.question_catalog.sample("diagnosis_test", 10, difficulty="상", rng=rng)
+    
+    # Tüm soruları birleştir
+    all_questions = selected_easy + selected_medium + selected_hard
+    
+    # Hiç soru bulunamazsa uyarı ver
+    if not all_questions:
+        raise HTTPException(status_code=404, detail="Hiç soru bulunamadı. Lütfen veritabanınızı kontrol edin.")
+    
+    # Soruları sabit sırayla karıştır (aynı seed -> aynı sıra)
+    rng.shuffle(all_questions)
+    all_questions = [to_question_dto(question, fields) for question in all_questions]
+    
+    print(f"✅ Seed'li seviye tespit sınavı hazırlandı: {len(all_questions)} soru (seed={seed})")
+    
+    return {
+        "status": "success",
+        "test": all_questions,
+        "test_info": {
+            "total_questions": len(all_questions),
+            "easy_questions": len(selected_easy),
+            "medium_questions": len(selected_medium),
+            "hard_questions": len(selected_hard),
+            "is_standardized": True,
+            "seed": seed
+        }
+    }
+
+
+@exam_router.post("/admin/level-test/publish")
+async def publish_level_test(seed: Optional[int] = None,
+                             x_admin_key: Optional[str] = Header(default=None),
+                             services: AppServices = Depends(get_services)):
+    """
+    Yeni seviye testi formu yayınla - sonraki /level-test istekleri (TTL sonra tüm worker'lar) bu formu alır.
+    Aynı içerikte bir form zaten varsa yeni version oluşmaz, mevcut form döner.
+    ADMIN_API_KEY tanımlı değilse endpoint kapalıdır.
+    """
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Level test publishing is disabled (ADMIN_API_KEY not set)")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key.encode("utf-8"), ADMIN_API_KEY.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+    try:
+        form = await run_blocking(services.level_test_forms.publish, seed, "admin")
+        return {
+            "status": "success",
+            "test_version": form["version"],
+            "form_id": form["form_id"],
+            "seed": form["seed"],
+            "difficulty_counts": form["difficulty_counts"],
+            "created_at": form["created_at"]
+        }
+    except Exception as e:
+        print(f"❌ Level test publish error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Level test publish error: {str(e)}")
+
+
 @exam_router.post("/submit-test")
-async def submit_test_with_bkt_fixed(submission: TestSubmission):
+async def submit_test_with_bkt_fixed(submission: TestSubmission, services: AppServices = Depends(get_services)):
     """BKT entegreli + detailed_results koruyan + test history düzeltilmiş versiyon"""
     try:
-        collection = db["diagnosis_test"]
-        user_collection = db["users"]
+        user_collection = services.adb["users"]
         
         print(f"🔍 BKT Test Submission: user_id={submission.user_id}")
         
         questions = []
         bkt_updates = []
+        bkt_answers = []
+        
+        # 문제 찾기 - 제출된 모든 문제를 한 번에
+        found_questions = await run_blocking(fetch_questions_by_ids, services.db, list(submission.answers.keys()), ["diagnosis_test"])
         
         for question_id, student_answer in submission.answers.items():
-            # 문제 찾기
-            question = collection.find_one({"_id": question_id})
-            if not question:
-                try:
-                    obj_id = ObjectId(question_id)
-                    question = collection.find_one({"_id": obj_id})
-                except:
-                    pass
+            question = found_questions.get(str(question_id))
             
             if question:
                 questions.append(question)
@@ -345,23 +421,22 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
                 correct_answer = question.get("Answer Key", question.get("answer_key"))
                 is_correct = student_answer == correct_answer
                 
-                # BKT UPDATE (선택적 - hata olursa devam et)
-                try:
-                    bkt_result = bkt_system.update_bkt_with_answer(
-                        user_id=submission.user_id,
-                        question_data={
-                            "type": question.get("type", "general"),
-                            "difficulty": question.get("difficulty", "중"),
-                        },
-                        student_answer=student_answer,
-                        is_correct=is_correct
-                    )
-                    bkt_updates.append(bkt_result)
-                    print(f"✅ BKT Updated: {bkt_result['type']} → {bkt_result['updated_mastery']:.3f}")
-                    
-                except Exception as bkt_error:
-                    print(f"⚠️ BKT update failed for {question_id}: {str(bkt_error)}")
-                    # BKT hatası olsa da test değerlendirmesi devam etsin
+                bkt_answers.append((
+                    {
+                        "type": question.get("type", "general"),
+                        "difficulty": question.get("difficulty", "중"),
+                        "_id": question_id
+                    },
+                    student_answer,
+                    is_correct
+                ))
+        
+        # BKT UPDATE - tüm cevaplar tek seferde (선택적 - hata olursa devam et)
+        try:
+            bkt_updates = await services.bkt_system.aupdate_bkt_with_answers(submission.user_id, bkt_answers)
+        except Exception as bkt_error:
+            print(f"⚠️ BKT batch update failed for {submission.user_id}: {str(bkt_error)}")
+            # BKT hatası olsa da test değerlendirmesi devam etsin
         
         # 기존 점수 계산
         score_result = utils.real_calculate_score(submission.answers, questions)
@@ -396,7 +471,7 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
         
         try:
             if bkt_updates:  # BKT güncellemesi varsa
-                mastery_report = bkt_system.get_mastery_report(submission.user_id)
+                mastery_report = await services.bkt_system.aget_mastery_report(submission.user_id)
                 overall_mastery = mastery_report["overall_mastery"]
                 
                 # Level adjustment
@@ -440,6 +515,9 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
             "total_questions": len(questions),  # ⭐ Gerçek soru sayısı
             "detailed_results": detailed_results  # ⭐ BU MUTLAKA OLMALI
         }
+        # Hangi form çözüldü - aynı version'ı çözenlerin sonuçları doğrudan karşılaştırılabilir
+        if submission.test_version is not None:
+            test_record["test_version"] = submission.test_version
         
         # BKT bilgileri varsa ekle
         if bkt_updates:
@@ -454,13 +532,13 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
         
         print(f"💾 Test record prepared: {test_record['test_type']} with {len(detailed_results)} detailed results")
         
-        # ⭐ CRITICAL FIX: USER GÜNCELLEME - test_history dahil
+        # ⭐ USER GÜNCELLEME - test kaydı test_results koleksiyonuna ayrı doküman olarak
         try:
-            user = user_collection.find_one({"_id": submission.user_id})
+            user = await user_collection.find_one({"_id": submission.user_id}, {"_id": 1})
             if not user:
                 try:
                     obj_id = ObjectId(submission.user_id)
-                    user = user_collection.find_one({"_id": obj_id})
+                    user = await user_collection.find_one({"_id": obj_id}, {"_id": 1})
                     if user:
                         submission.user_id = obj_id
                 except:
@@ -470,19 +548,12 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
                 print(f"❌ User not found: {submission.user_id}")
                 raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
             
-            # ⭐ Test history güncelleme
-            test_history = user.get("test_history", [])
-            test_history.append(test_record)
-            
-            # Son 10 test sakla
-            #if len(test_history) > 10:
-            #    test_history = test_history[-10:]
+            await run_blocking(_save_test_record, services.db, submission.user_id, test_record)
             
-            # User güncelleme
+            # User güncelleme - sadece özet alanlar + sayaç
             update_data = {
                 "test_score": score_result["score"],
                 "level": final_level,
-                "test_history": test_history,  # ⭐ Test history mutlaka dahil
                 "last_test_date": datetime.datetime.now()
             }
             
@@ -490,13 +561,13 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
                 update_data["bkt_level"] = final_level
                 update_data["last_bkt_update"] = datetime.datetime.now()
             
-            update_result = user_collection.update_one(
+            update_result = await user_collection.update_one(
                 {"_id": submission.user_id},
-                {"$set": update_data}
+                {"$set": update_data, "$inc": {"test_count": 1}}
             )
             
             print(f"✅ User updated: modified_count={update_result.modified_count}")
-            print(f"✅ Test history updated: {len(test_history)} tests in history")
+            print(f"✅ Test result saved to test_results")
             
         except Exception as user_update_error:
             print(f"❌ User update error: {str(user_update_error)}")
@@ -533,117 +604,87 @@ async def submit_test_with_bkt_fixed(submission: TestSubmission):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"테스트 평가 중 오류: {str(e)}")
 
+def _save_test_record(db, user_id, test_record: Dict):
+    # Eski gömülü test_history varsa önce taşı (test_count doğru başlasın)
+    migrate_user_history(db, user_id)
+    record_test_result(db, user_id, test_record)
+
+
+async def _find_user_for_history(user_collection, user_id: str):
+    """String ya da ObjectId _id ile kullanıcıyı bul (sadece _id ve name)"""
+    projection = {"_id": 1, "name": 1}
+    user = await user_collection.find_one({"_id": user_id}, projection)
+    if not user:
+        try:
+            user = await user_collection.find_one({"_id": ObjectId(user_id)}, projection)
+        except Exception as oid_error:
+            print(f"❌ ObjectId dönüşümü başarısız: {str(oid_error)}")
+    return user
+
+
+def _serialize_test_record(test: Dict) -> Dict:
+    """test_results dokümanı yanıt biçiminde (ObjectId/datetime'ı BSONJSONResponse çevirir)"""
+    cleaned = dict(test)
+    cleaned["test_id"] = cleaned.pop("_id", None)
+    cleaned.pop("user_id", None)
+    return cleaned
+
+
+def _load_test_history_page(db, user_id, skip: int, limit: int, include_details: bool):
+    # Eski gömülü test_history varsa bir kereliğine taşı
+    migrate_user_history(db, user_id)
+    tests = get_test_history(db, user_id, skip=skip, limit=limit, include_details=include_details)
+    return tests, count_test_results(db, user_id)
+
+
+def _load_test_by_index(db, user_id, test_index: int):
+    migrate_user_history(db, user_id)
+    return get_test_by_index(db, user_id, test_index)
+
+
 # Retrieve user test history endpoint
 @exam_router.get("/user-test-history/{user_id}")
-async def get_user_test_history(user_id: str):
+async def get_user_test_history(user_id: str, skip: int = 0, limit: int = 50,
+                                include_details: bool = False,
+                                services: AppServices = Depends(get_services)):
     """
-    Retrieve user test history
+    Retrieve user test history (en yeni en üstte, sayfalı)
+    detailed_results varsayılan olarak dahil edilmez - detay için /test-details
     """
     try:
-        user_collection = db["users"]
-        print(f"🔍 Test geçmişi isteniyor: user_id={user_id}")
-        print(f"🔍 User ID tipi: {type(user_id)}")
-        print(f"🔍 User ID uzunluğu: {len(user_id)}")
-        
-        # Önce string ID ile ara
-        print("🔄 String ID ile aranıyor...")
-        user = user_collection.find_one({"_id": user_id})
-        
-        if user:
-            print(f"✅ Kullanıcı string ID ile bulundu!")
-        else:
-            print("❌ String ID ile bulunamadı, ObjectId deneniyor...")
-            
-            # ObjectId ile dene
-            try:
-                print(f"🔄 ObjectId dönüşümü deneniyor: {user_id}")
-                obj_id = ObjectId(user_id)
-                print(f"✅ ObjectId oluşturuldu: {obj_id}")
-                
-                user = user_collection.find_one({"_id": obj_id})
-                
-                if user:
-                    print(f"✅ Kullanıcı ObjectId ile bulundu: {user_id}")
-                else:
-                    print(f"❌ ObjectId ile de bulunamadı: {obj_id}")
-                    
-            except Exception as oid_error:
-                print(f"❌ ObjectId dönüşümü başarısız: {str(oid_error)}")
+        user_collection = services.adb["users"]
+        print(f"🔍 Test geçmişi isteniyor: user_id={user_id}, skip={skip}, limit={limit}")
         
+        user = await _find_user_for_history(user_collection, user_id)
         if not user:
-            print(f"❌ Kullanıcı hiçbir şekilde bulunamadı: {user_id}")
-            
-            # Veritabanında gerçekten var mı kontrol et
-            print("🔍 Veritabanında tüm kullanıcıları kontrol ediyorum...")
-            all_users = list(user_collection.find({}, {"_id": 1, "name": 1}))
-            print(f"📊 Toplam kullanıcı sayısı: {len(all_users)}")
-            
-            for i, u in enumerate(all_users[:5]):  # İlk 5 kullanıcıyı göster
-                print(f"  {i+1}. ID: {u.get('_id')} ({type(u.get('_id'))}), Name: {u.get('name')}")
-            
+            print(f"❌ Kullanıcı bulunamadı: {user_id}")
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
-        print(f"✅ Kullanıcı bulundu: {user.get('name', 'İsimsiz')}")
-        
-        test_history = user.get("test_history", [])
-        print(f"📊 Test geçmişi uzunluğu: {len(test_history)}")
-        
-        if len(test_history) == 0:
-            print("ℹ️ Test geçmişi boş")
-            return {
-                "status": "success",
-                "test_history": [],
-                "total_tests": 0
+        limit = max(1, min(limit, 200))
+        tests, total_tests = await run_blocking(
+            _load_test_history_page, services.db, user["_id"], skip, limit, include_details
+        )
+        
+        cleaned_history = [
+            {
+                "test_type": "level_test",
+                "total_score": 0,
+                "level": "하",
+                "correct_count": 0,
+                "total_questions": 0,
+                **_serialize_test_record(test)
             }
+            for test in tests
+        ]
         
-        # Test geçmişini temizle ve seri hale getirilebilir yap
-        cleaned_history = []
-        for i, test in enumerate(test_history):
-            try:
-                print(f"🔄 Test {i+1} işleniyor...")
-                
-                # Datetime nesnelerini string'e dönüştür
-                test_date = test.get("test_date")
-                if test_date and hasattr(test_date, 'isoformat'):
-                    test_date = test_date.isoformat()
-                elif test_date and isinstance(test_date, str):
-                    test_date = test_date  # Zaten string
-                else:
-                    test_date = None
-                
-                cleaned_test = {
-                    "test_date": test_date,
-                    "test_type": test.get("test_type", "level_test"),
-                    "total_score": test.get("total_score", 0),
-                    "level": test.get("level", "하"),
-                    "correct_count": test.get("correct_count", 0),
-                    "total_questions": test.get("total_questions", 0),
-                    "detailed_results": test.get("detailed_results", [])
-                }
-                
-                cleaned_history.append(cleaned_test)
-                print(f"✅ Test {i+1} başarıyla işlendi")
-                
-            except Exception as test_error:
-                print(f"❌ Test {i+1} işlenirken hata: {str(test_error)}")
-                continue
-        
-        # Tarihe göre sırala (en yeni en üstte)
-        try:
-            cleaned_history.sort(
-                key=lambda x: x.get("test_date", "1900-01-01T00:00:00") or "1900-01-01T00:00:00", 
-                reverse=True
-            )
-            print("✅ Testler tarihe göre sıralandı")
-        except Exception as sort_error:
-            print(f"⚠️ Sıralama hatası: {str(sort_error)}")
-        
-        print(f"🎉 Test geçmişi başarıyla hazırlandı: {len(cleaned_history)} test")
+        print(f"🎉 Test geçmişi hazırlandı: {len(cleaned_history)}/{total_tests} test")
         
         return {
             "status": "success",
             "test_history": cleaned_history,
-            "total_tests": len(cleaned_history)
+            "total_tests": total_tests,
+            "skip": skip,
+            "limit": limit
         }
     
     except Exception as e:
@@ -655,91 +696,26 @@ async def get_user_test_history(user_id: str):
 
 # Retrieve specific test details endpoint
 @exam_router.get("/test-details/{user_id}/{test_index}")
-async def get_test_details(user_id: str, test_index: int):
+async def get_test_details(user_id: str, test_index: int, services: AppServices = Depends(get_services)):
     """
-    Retrieve user test history details by user_id and test_index
+    Retrieve user test details by user_id and test_index (0 = en yeni test)
     """
     try:
-        user_collection = db["users"]
+        user_collection = services.adb["users"]
         print(f"🔍 Test detayları isteniyor: user_id={user_id}, test_index={test_index}")
         
-        # Önce string ID ile ara
-        user = user_collection.find_one({"_id": user_id})
-        
-        # Bulunamadıysa ObjectId ile dene
-        if not user:
-            try:
-                obj_id = ObjectId(user_id)
-                user = user_collection.find_one({"_id": obj_id})
-                if user:
-                    print(f"✅ Kullanıcı ObjectId ile bulundu: {user_id}")
-            except Exception as oid_error:
-                print(f"❌ ObjectId dönüşümü başarısız: {str(oid_error)}")
-        
+        user = await _find_user_for_history(user_collection, user_id)
         if not user:
             print(f"❌ Kullanıcı bulunamadı: {user_id}")
             raise HTTPException(status_code=404, detail="Kullanıcı bulunamadı")
         
-        print(f"✅ Kullanıcı bulundu: {user.get('name', 'İsimsiz')}")
-        
-        test_history = user.get("test_history", [])
-        print(f"📊 Test geçmişi uzunluğu: {len(test_history)}")
-        
-        if test_index >= len(test_history) or test_index < 0:
-            print(f"❌ Geçersiz test indeksi: {test_index} (maks: {len(test_history)-1})")
+        test = await run_blocking(_load_test_by_index, services.db, user["_id"], test_index)
+        if not test:
+            print(f"❌ Geçersiz test indeksi: {test_index}")
             raise HTTPException(status_code=404, detail="Test bulunamadı")
         
-        # Tarihe göre sırala ve istenen testi al
-        try:
-            # Tarihleri güvenli şekilde sıralama
-            test_history_with_dates = []
-            for i, test in enumerate(test_history):
-                test_date = test.get("test_date")
-                if hasattr(test_date, 'timestamp'):
-                    sort_key = test_date.timestamp()
-                elif isinstance(test_date, str):
-                    try:
-                        from datetime import datetime
-                        parsed_date = datetime.fromisoformat(test_date.replace('Z', '+00:00'))
-                        sort_key = parsed_date.timestamp()
-                    except:
-                        sort_key = 0
-                else:
-                    sort_key = 0
-                
-                test_history_with_dates.append((sort_key, i, test))
-            
-            # Sıralama (en yeni en üstte)
-            test_history_with_dates.sort(key=lambda x: x[0], reverse=True)
-            sorted_tests = [item[2] for item in test_history_with_dates]
-            
-            print(f"✅ Testler sıralandı, istenilen indeks: {test_index}")
-            
-        except Exception as sort_error:
-            print(f"⚠️ Sıralama hatası: {str(sort_error)}, sıralama olmadan devam ediliyor")
-            sorted_tests = test_history
-        
-        # İstenen testi al
-        test_details = sorted_tests[test_index]
-        print(f"✅ Test {test_index} seçildi")
-        
-        # Datetime nesnelerini string'e dönüştür
-        if "test_date" in test_details:
-            test_date = test_details["test_date"]
-            if hasattr(test_date, 'isoformat'):
-                test_details["test_date"] = test_date.isoformat()
-            print(f"✅ Test tarihi dönüştürüldü")
-        
-        # Detailed results'ı temizle
-        detailed_results = test_details.get("detailed_results", [])
-        print(f"📊 Detaylı sonuçlar: {len(detailed_results)} soru")
-        
-        # Her soru sonucunu kontrol et
-        for i, result in enumerate(detailed_results[:3]):  # İlk 3 soruyu logla
-            print(f"  Soru {i+1}: {result.get('question_text', 'Metin yok')[:50]}...")
-            print(f"    Doğru cevap: {result.get('correct_answer')}")
-            print(f"    Öğrenci cevabı: {result.get('student_answer')}")
-            print(f"    Seçenekler: {len(result.get('choices', []))} adet")
+        test_details = _serialize_test_record(test)
+        print(f"✅ Test {test_index} seçildi: {len(test_details.get('detailed_results', []))} soru")
         
         return {
             "status": "success",
@@ -787,12 +763,12 @@ async def get_test_details(user_id: str, test_index: int):
 
 #Listing collections from mongodb
 @exam_router.get("/collections")
-async def get_collections():
+async def get_collections(services: AppServices = Depends(get_services)):
     """
     MongoDB all collections list
     """
     try:
-        collections = db.list_collection_names()
+        collections = await services.adb.list_collection_names()
         return {"status": "success", "collections": collections}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Koleksiyonları listelerken hata: {str(e)}")
@@ -800,51 +776,32 @@ async def get_collections():
 
 # Practice question endpoint
 @exam_router.get("/practice-question/{difficulty}")
-async def get_practice_question(difficulty: str):
+async def get_practice_question(difficulty: str, seed: Optional[int] = None, fields: Optional[str] = None,
+                                services: AppServices = Depends(get_services)):
     """
     Retrieve a random practice question based on difficulty level
     - difficulty: "하" (easy), "중" (medium), "상" (hard)
+    - seed: verilirse aynı soru bankasında her zaman aynı soru
+    - fields: soru alanları, ör. "_id,problem,choices"
     """
+    question_fields = _question_fields(fields)
     try:
         # Zorluk seviyesi kontrolü
         valid_difficulties = ["하", "중", "상"]
         if difficulty not in valid_difficulties:
             raise HTTPException(status_code=400, detail=f"Geçersiz zorluk seviyesi. Geçerli değerler: {valid_difficulties}")
         
-        # İlgili zorluk seviyesindeki soruları getir
-        collection = db["diagnosis_test"]
-        questions = list(collection.find({"difficulty": difficulty}))
+        # İlgili zorluk seviyesinden rastgele bir soru seç (bellekteki katalog)
+        await services.question_catalog.aensure_loaded()
+        rng = random.Random(seed) if seed is not None else None
+        selected_question = services.question_catalog.choice("diagnosis_test", difficulty=difficulty, rng=rng)
         
-        if not questions:
+        if not selected_question:
             raise HTTPException(status_code=404, detail=f"'{difficulty}' seviyesinde soru bulunamadı")
         
-        # Rastgele bir soru seç
-        import random
-        selected_question = random.choice(questions)
-        
-        # ObjectId'yi string'e dönüştür
-        if '_id' in selected_question and not isinstance(selected_question['_id'], str):
-            selected_question['_id'] = str(selected_question['_id'])
-        
-        # Alan adlarını standartlaştır
-        if 'Choices' not in selected_question and 'choices' in selected_question:
-            selected_question['Choices'] = selected_question['choices']
-        elif 'choices' not in selected_question and 'Choices' in selected_question:
-            selected_question['choices'] = selected_question['Choices']
-            
-        if 'Problem' not in selected_question and 'problem' in selected_question:
-            selected_question['Problem'] = selected_question['problem']
-        elif 'problem' not in selected_question and 'Problem' in selected_question:
-            selected_question['problem'] = selected_question['Problem']
-            
-        if 'Answer Key' not in selected_question and 'answer_key' in selected_question:
-            selected_question['Answer Key'] = selected_question['answer_key']
-        elif 'answer_key' not in selected_question and 'Answer Key' in selected_question:
-            selected_question['answer_key'] = selected_question['Answer Key']
-        
         return {
             "status": "success",
-            "question": selected_question,
+            "question": to_question_dto(selected_question, question_fields),
             "difficulty": difficulty
         }
     
@@ -855,7 +812,7 @@ async def get_practice_question(difficulty: str):
 
 #Submit practice answer endpoint
 @exam_router.post("/submit-practice-answer")
-async def submit_practice_answer(data: dict):
+async def submit_practice_answer(data: dict, services: AppServices = Depends(get_services)):
     """
     Submit a practice question answer for evaluation
     """
@@ -867,15 +824,7 @@ async def submit_practice_answer(data: dict):
             raise HTTPException(status_code=400, detail="question_id ve student_answer gereklidir")
         
         # Soruyu bul
-        collection = db["diagnosis_test"]
-        question = collection.find_one({"_id": question_id})
-        
-        if not question:
-            try:
-                obj_id = ObjectId(question_id)
-                question = collection.find_one({"_id": obj_id})
-            except:
-                pass
+        question = await run_blocking(fetch_question, services.db, question_id, ["diagnosis_test"])
         
         if not question:
             raise HTTPException(status_code=404, detail="Soru bulunamadı")
@@ -902,19 +851,21 @@ async def submit_practice_answer(data: dict):
 
 # Retrieve questions from a specific collection
 @exam_router.get("/get-questions/{collection_name}")
-async def get_questions(collection_name: str, limit: int = 20, skip: int = 0):
+async def get_questions(collection_name: str, limit: int = 20, skip: int = 0, fields: Optional[str] = None,
+                        services: AppServices = Depends(get_services)):
     """
     Retrieve questions from a specific collection
+    - fields: verilirse sadece bu alanlar (cevap anahtarı dahil seçilebilir - yönetim ekranı)
     """
+    question_fields = _question_fields(fields, ADMIN_QUESTION_FIELDS, None) if fields else None
     try:
-        custom_collection = db[collection_name]
-        total = custom_collection.count_documents({})
-        questions = list(custom_collection.find({}).skip(skip).limit(limit))
+        custom_collection = services.adb[collection_name]
+        total = await custom_collection.count_documents({})
+        projection = question_projection(question_fields) if question_fields else None
+        questions = await custom_collection.find({}, projection).skip(skip).limit(limit).to_list(None)
         
-        # ObjectId'yi string'e dönüştür
-        for question in questions:
-            if '_id' in question and not isinstance(question['_id'], str):
-                question['_id'] = str(question['_id'])
+        if question_fields:
+            questions = [to_question_dto(question, question_fields) for question in questions]
         
         return {
             "status": "success", 
@@ -928,29 +879,25 @@ async def get_questions(collection_name: str, limit: int = 20, skip: int = 0):
         raise HTTPException(status_code=500, detail=f"Veri çekme işlemi sırasında hata: {str(e)}")
     
 @exam_router.post("/submit-test-with-type-bkt")
-async def submit_test_with_type_bkt(submission: TestSubmission):
+async def submit_test_with_type_bkt(submission: TestSubmission, services: AppServices = Depends(get_services)):
     """
     TYPE 기반 BKT 통합 테스트 제출
     """
     try:
-        collection = db["diagnosis_test"]
-        user_collection = db["users"]
+        user_collection = services.adb["users"]
         
         print(f"🔍 TYPE-Based BKT Test Submission: user_id={submission.user_id}")
         
         # 기존 점수 계산
         questions = []
         bkt_updates = []
+        bkt_answers = []
+        
+        # 문제 찾기 - 제출된 모든 문제를 한 번에
+        found_questions = await run_blocking(fetch_questions_by_ids, services.db, list(submission.answers.keys()), ["diagnosis_test"])
         
         for question_id, student_answer in submission.answers.items():
-            # 문제 찾기
-            question = collection.find_one({"_id": question_id})
-            if not question:
-                try:
-                    obj_id = ObjectId(question_id)
-                    question = collection.find_one({"_id": obj_id})
-                except:
-                    pass
+            question = found_questions.get(str(question_id))
             
             if question:
                 questions.append(question)
@@ -959,31 +906,28 @@ async def submit_test_with_type_bkt(submission: TestSubmission):
                 correct_answer = question.get("Answer Key", question.get("answer_key"))
                 is_correct = student_answer == correct_answer
                 
-                # BKT 업데이트 - TYPE 기반으로 단순화!
-                try:
-                    bkt_result = bkt_system.update_bkt_with_answer(
-                        user_id=submission.user_id,
-                        question_data={
-                            "type": question.get("type", "general"),  # 전문가가 결정한 유형
-                            "difficulty": question.get("difficulty", "중"),
-                            "_id": question_id
-                        },
-                        student_answer=student_answer,
-                        is_correct=is_correct
-                    )
-                    bkt_updates.append(bkt_result)
-                    
-                    print(f"✅ BKT Updated: {bkt_result['type']} → {bkt_result['updated_mastery']:.3f}")
-                    
-                except Exception as bkt_error:
-                    print(f"⚠️ BKT update failed for question {question_id}: {str(bkt_error)}")
+                bkt_answers.append((
+                    {
+                        "type": question.get("type", "general"),  # 전문가가 결정한 유형
+                        "difficulty": question.get("difficulty", "중"),
+                        "_id": question_id
+                    },
+                    student_answer,
+                    is_correct
+                ))
+        
+        # BKT 업데이트 - TYPE 기반, 제출 전체를 한 번에 반영
+        try:
+            bkt_updates = await services.bkt_system.aupdate_bkt_with_answers(submission.user_id, bkt_answers)
+        except Exception as bkt_error:
+            print(f"⚠️ BKT batch update failed for {submission.user_id}: {str(bkt_error)}")
         
         # 기존 점수 계산
         score_result = utils.real_calculate_score(submission.answers, questions)
         
         # BKT 마스터리 리포트
         try:
-            mastery_report = bkt_system.get_mastery_report(submission.user_id)
+            mastery_report = await services.bkt_system.aget_mastery_report(submission.user_id)
             overall_mastery = mastery_report["overall_mastery"]
             
             # BKT 기반 레벨 조정 (TYPE 기반)
@@ -1020,14 +964,16 @@ async def submit_test_with_type_bkt(submission: TestSubmission):
                 "total_types_tracked": mastery_report["total_types_tracked"] if mastery_report else 0
             }
         }
+        if submission.test_version is not None:
+            test_record["test_version"] = submission.test_version
         
         # 사용자 정보 업데이트
         try:
-            user = user_collection.find_one({"_id": submission.user_id})
+            user = await user_collection.find_one({"_id": submission.user_id}, {"_id": 1})
             if not user:
                 try:
                     obj_id = ObjectId(submission.user_id)
-                    user = user_collection.find_one({"_id": obj_id})
+                    user = await user_collection.find_one({"_id": obj_id}, {"_id": 1})
                     if user:
                         submission.user_id = obj_id
                 except:
@@ -1036,23 +982,21 @@ async def submit_test_with_type_bkt(submission: TestSubmission):
             if not user:
                 raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
             
-            test_history = user.get("test_history", [])
-            test_history.append(test_record)
-            
-            #if len(test_history) > 10:
-            #    test_history = test_history[-10:]
+            await run_blocking(_save_test_record, services.db, submission.user_id, test_record)
             
             # BKT 조정된 정보로 업데이트
-            update_result = user_collection.update_one(
+            update_result = await user_collection.update_one(
                 {"_id": submission.user_id},
-                {"$set": {
-                    "test_score": score_result["score"],
-                    "level": bkt_adjusted_level,
-                    "bkt_level": bkt_adjusted_level,
-                    "test_history": test_history,
-                    "last_test_date": datetime.datetime.now(),
-                    "last_bkt_update": datetime.datetime.now()
-                }}
+                {
+                    "$set": {
+                        "test_score": score_result["score"],
+                        "level": bkt_adjusted_level,
+                        "bkt_level": bkt_adjusted_level,
+                        "last_test_date": datetime.datetime.now(),
+                        "last_bkt_update": datetime.datetime.now()
+                    },
+                    "$inc": {"test_count": 1}
+                }
             )
             
             print(f"✅ User updated with TYPE-BKT level: {bkt_adjusted_level}")
@@ -1095,119 +1039,72 @@ async def submit_test_with_type_bkt(submission: TestSubmission):
         raise HTTPException(status_code=500, detail=f"테스트 평가 중 오류: {str(e)}")
 
 @exam_router.get("/adaptive-test-by-type/{user_id}")
-async def get_adaptive_test_by_type(user_id: str, num_questions: int = 10):
+async def get_adaptive_test_by_type(user_id: str, num_questions: int = 10, fields: Optional[str] = None,
+                                    services: AppServices = Depends(get_services)):
     """
     문제 TYPE 기반 적응형 테스트
+    - fields: 문제 필드 선택, 예: "_id,problem,choices" (bkt_metadata는 항상 포함)
     """
+    question_fields = _question_fields(fields)
     try:
-        # 사용자의 약한 type들 가져오기
-        weak_types = bkt_system.get_weak_types(user_id)
-        
-        if not weak_types:
-            # 약한 유형이 없으면 랜덤 문제
-            return await get_random_test_questions(num_questions)
+        bkt_system = services.bkt_system
+        bkt_state = await bkt_system.aget_user_bkt_state(user_id)
+        weak_types = bkt_system.weak_types_from_state(bkt_state)
+        
+        # 메모리 내 (type, difficulty) 풀에서 기대 정보 이득 순으로 선택 - DB 왕복 없음
+        await services.question_catalog.aensure_loaded()
+        pool = services.adaptive_pool
+        collection_name = "all_questions"
+        selected = await run_blocking(
+            bkt_system.select_questions, user_id, bkt_state, [collection_name], num_questions
+        )
+        
+        if not selected:
+            # type 정보가 있는 문제가 없으면 랜덤 문제
+            return await get_random_test_questions(services, user_id, num_questions, question_fields)
         
         print(f"🎯 Creating TYPE-based adaptive test for {user_id}")
         print(f"   Weak types: {[t['type'] for t in weak_types]}")
         
         adaptive_questions = []
-        collections = ["all_questions"]
+        picked_ids = set()
         
-        # 가장 약한 type들에 집중해서 문제 선별
-        for type_info in weak_types:  # 상위 3개 약한 유형
-            question_type = type_info["type"]
-            mastery = type_info["mastery"]
+        for item, doc in selected:
+            question = to_question_dto(doc, question_fields)
             
-            # 마스터리에 따른 난이도 결정
-            if mastery < 0.3:
-                target_difficulty = "하"
-            elif mastery < 0.5:
-                target_difficulty = "중"
-            else:
-                target_difficulty = "상"
+            # BKT 메타데이터 추가
+            question['bkt_metadata'] = {
+                "target_type": item["type"],
+                "current_mastery": item["mastery"],
+                "adaptive_difficulty": item["difficulty"],
+                "expected_information_gain": round(item["expected_gain"], 4),
+                "reason": bkt_system.selection_reason(item)
+            }
             
-            # 각 컬렉션에서 해당 type+난이도 문제 찾기
-            for collection_name in collections:
-                if len(adaptive_questions) >= num_questions:
-                    break
-                
-                collection = db[collection_name]
-                
-                # type과 난이도로 검색
-                query = {
-                    "type": question_type,
-                    "difficulty": target_difficulty
-                }
-                
-                questions = list(collection.find(query).limit(3))
-                
-                for question in questions:
-                    if len(adaptive_questions) >= num_questions:
-                        break
-                    
-                    # ObjectId를 string으로 변환
-                    if '_id' in question and not isinstance(question['_id'], str):
-                        question['_id'] = str(question['_id'])
-                    
-                    # 필드 표준화
-                    if 'Choices' not in question and 'choices' in question:
-                        question['Choices'] = question['choices']
-                    if 'Problem' not in question and 'problem' in question:
-                        question['Problem'] = question['problem']
-                    if 'Answer Key' not in question and 'answer_key' in question:
-                        question['Answer Key'] = question['answer_key']
-                    
-                    # BKT 메타데이터 추가
-                    question['bkt_metadata'] = {
-                        "target_type": question_type,
-                        "current_mastery": mastery,
-                        "adaptive_difficulty": target_difficulty,
-                        "reason": f"약한 유형 ({question_type}) 개선"
-                    }
-                    
-                    adaptive_questions.append(question)
+            picked_ids.add(str(doc['_id']))
+            adaptive_questions.append(question)
         
         # 문제가 부족하면 다른 type의 문제로 채우기
         if len(adaptive_questions) < num_questions:
-            remaining_needed = num_questions - len(adaptive_questions)
+            # 아직 사용되지 않은 type들에서 문제 가져오기
+            used_types = {q.get('bkt_metadata', {}).get('target_type') for q in adaptive_questions}
             
-            for collection_name in collections:
-                if len(adaptive_questions) >= num_questions:
-                    break
-                
-                collection = db[collection_name]
-                
-                # 아직 사용되지 않은 type들에서 문제 가져오기
-                used_types = [q.get('bkt_metadata', {}).get('target_type') for q in adaptive_questions]
+            additional_questions = pool.take(
+                user_id, collection_name, num_questions - len(adaptive_questions),
+                exclude_ids=picked_ids, exclude_types=used_types
+            )
+            
+            for doc in additional_questions:
+                question = to_question_dto(doc, question_fields)
                 
-                additional_questions = list(collection.aggregate([
-                    {"$match": {"type": {"$nin": used_types}}},
-                    {"$sample": {"size": remaining_needed}}
-                ]))
+                question['bkt_metadata'] = {
+                    "target_type": doc.get("type", "general"),
+                    "current_mastery": 0.5,
+                    "adaptive_difficulty": doc.get("difficulty", "중"),
+                    "reason": "다양한 유형 보충"
+                }
                 
-                for question in additional_questions:
-                    if len(adaptive_questions) >= num_questions:
-                        break
-                    
-                    if '_id' in question and not isinstance(question['_id'], str):
-                        question['_id'] = str(question['_id'])
-                    
-                    # 필드 표준화
-                    if 'Choices' not in question and 'choices' in question:
-                        question['Choices'] = question['choices']
-                    if 'Problem' not in question and 'problem' in question:
-                        question['Problem'] = question['problem']
-                    if 'Answer Key' not in question and 'answer_key' in question:
-                        question['Answer Key'] = question['answer_key']
-                    
-                    question['bkt_metadata'] = {
-                        "target_type": question.get("type", "general"),
-                        "current_mastery": 0.5,
-                        "adaptive_difficulty": question.get("difficulty", "중"),
-                        "reason": "다양한 유형 보충"
-                    }
-                    
-                    adaptive_questions.append(question)
+                adaptive_questions.append(question)
         
         # 문제 섞기
         import random
@@ -1239,13 +1136,13 @@ async def get_adaptive_test_by_type(user_id: str, num_questions: int = 10):
         raise HTTPException(status_code=500, detail=f"적응형 테스트 생성 중 오류: {str(e)}")
 
 @exam_router.get("/debug/question-types/{collection_name}")
-async def debug_question_types(collection_name: str):
+async def debug_question_types(collection_name: str, services: AppServices = Depends(get_services)):
     """디버그: 특정 컬렉션의 문제 유형 분석"""
     try:
         if collection_name not in ["diagnosis_test", "exam_questions"]:
             raise HTTPException(status_code=400, detail="Invalid collection name")
         
-        collection = db[collection_name]
+        collection = services.adb[collection_name]
         
         # type 필드 분석
         pipeline = [
@@ -1258,15 +1155,15 @@ async def debug_question_types(collection_name: str):
             {"$sort": {"count": -1}}
         ]
         
-        type_analysis = list(collection.aggregate(pipeline))
+        type_analysis = await collection.aggregate(pipeline)
         
         # 각 type의 샘플 문제 제한 (너무 많으면 3개만)
         for item in type_analysis:
             if len(item["sample_problems"]) > 3:
                 item["sample_problems"] = item["sample_problems"][:3]
         
-        total_questions = collection.count_documents({})
-        questions_with_type = collection.count_documents({"type": {"$exists": True, "$ne": None}})
+        total_questions = await collection.count_documents({})
+        questions_with_type = await collection.count_documents({"type": {"$exists": True, "$ne": None}})
         
         return {
             "status": "success",
@@ -1281,9 +1178,11 @@ async def debug_question_types(collection_name: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Debug error: {str(e)}")
 
-async def get_random_test_questions(num_questions: int):
+async def get_random_test_questions(services: AppServices, user_id: str, num_questions: int,
+                                    fields=DEFAULT_QUESTION_FIELDS):
     """랜덤 테스트 문제 (fallback)"""
     try:
+        await services.question_catalog.aensure_loaded()
         collections = ["diagnosis_test", "exam_questions"]
         random_questions = []
         
@@ -1291,30 +1190,15 @@ async def get_random_test_questions(num_questions: int):
             if len(random_questions) >= num_questions:
                 break
             
-            collection = db[collection_name]
-            questions = list(collection.aggregate([
-                {"$sample": {"size": num_questions}}
-            ]))
+            questions = services.adaptive_pool.take(user_id, collection_name, num_questions - len(random_questions))
             
-            for question in questions:
-                if len(random_questions) >= num_questions:
-                    break
-                
-                if '_id' in question and not isinstance(question['_id'], str):
-                    question['_id'] = str(question['_id'])
-                
-                # 표준화
-                if 'Choices' not in question and 'choices' in question:
-                    question['Choices'] = question['choices']
-                if 'Problem' not in question and 'problem' in question:
-                    question['Problem'] = question['problem']
-                if 'Answer Key' not in question and 'answer_key' in question:
-                    question['Answer Key'] = question['answer_key']
+            for doc in questions:
+                question = to_question_dto(doc, fields)
                 
                 question['bkt_metadata'] = {
-                    "target_type": question.get("type", "general"),
+                    "target_type": doc.get("type", "general"),
                     "current_mastery": 0.5,
-                    "adaptive_difficulty": question.get("difficulty", "중"),
+                    "adaptive_difficulty": doc.get("difficulty", "중"),
                     "reason": "랜덤 문제 (BKT 데이터 부족)"
                 }
                 
@@ -0,0 +1,245 @@
+# explanation_cache.py - Two-tier cache for LLM explanations
+#
+# 1. katman: süreç içi LRU (TTL'li) - key: (question_id, explanation_type, student_answer)
+# 2. katman: question_explanations koleksiyonu
+#
+# usage_count artışları bellekte biriktirilir ve periyodik olarak tek bulk_write ile yazılır.
+# (question_id, explanation_type, student_answer) unique index'i eşzamanlı iki miss'in
+# aynı açıklamayı iki kez eklemesini engeller.
+#
+# Unique index eklenmeden önce var olan kopyaları temizlemek için:
+#   python explanation_cache.py --dedupe
+
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from async_db import run_blocking
+from database import MongoSettings, create_mongo_client
+from index_manager import create_indexes
+
+EXPLANATIONS_COLLECTION = "question_explanations"
+EXPLANATION_KEY_INDEX = "question_explanation_key"
+
+REQUIRED_INDEXES = [
+    {
+        "collection": EXPLANATIONS_COLLECTION,
+        "keys": [("question_id", ASCENDING), ("explanation_type", ASCENDING), ("student_answer", ASCENDING)],
+        "name": EXPLANATION_KEY_INDEX,
+        "unique": True
+    }
+]
+
+HOT_QUERIES = [
+    {"name": "explanation_correct_answer", "collection": EXPLANATIONS_COLLECTION,
+     "filter": {"question_id": "__audit__", "explanation_type": "correct_answer"}},
+    {"name": "explanation_wrong_answer", "collection": EXPLANATIONS_COLLECTION,
+     "filter": {"question_id": "__audit__", "explanation_type": "wrong_answer", "student_answer": 2}},
+    {"name": "explanation_existing_keys", "collection": EXPLANATIONS_COLLECTION,
+     "filter": {"question_id": {"$in": ["__audit_1__", "__audit_2__"]}}}
+]
+
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "5000"))
+EXPLANATION_CACHE_TTL = float(os.getenv("EXPLANATION_CACHE_TTL", "3600"))
+EXPLANATION_USAGE_FLUSH_SECONDS = float(os.getenv("EXPLANATION_USAGE_FLUSH_SECONDS", "10"))
+
+CacheKey = Tuple[str, str, Optional[int]]
+
+
+def explanation_key(question_id: str, is_correct: bool, student_answer: int) -> CacheKey:
+    """Doğru cevap açıklaması öğrencinin cevabından bağımsız - student_answer None"""
+    if is_correct:
+        return (question_id, "correct_answer", None)
+    return (question_id, "wrong_answer", student_answer)
+
+
+def explanation_query(key: CacheKey) -> Dict:
+    question_id, explanation_type, student_answer = key
+    query = {"question_id": question_id, "explanation_type": explanation_type}
+    if student_answer is not None:
+        query["student_answer"] = student_answer
+    return query
+
+
+def ensure_indexes(db):
+    return create_indexes(db, REQUIRED_INDEXES)
+
+
+def dedupe_explanations(db) -> int:
+    """Aynı anahtarlı kopyalardan en eskisini tut, usage_count'ları ona topla"""
+    collection = db[EXPLANATIONS_COLLECTION]
+    duplicates = collection.aggregate([
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"question_id": "$question_id", "explanation_type": "$explanation_type",
+                    "student_answer": "$student_answer"},
+            "ids": {"$push": "$_id"},
+            "usage_count": {"$sum": {"$ifNull": ["$usage_count", 0]}},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+
+    removed = 0
+    for group in duplicates:
+        keep_id, *extra_ids = group["ids"]
+        collection.update_one({"_id": keep_id}, {"$set": {"usage_count": group["usage_count"]}})
+        removed += collection.delete_many({"_id": {"$in": extra_ids}}).deleted_count
+    print(f"🧹 Removed {removed} duplicate explanations")
+    return removed
+
+
+class ExplanationCache:
+    """question_explanations önünde LRU/TTL katmanı ve tamponlu usage_count sayacı"""
+
+    def __init__(self, db, max_entries: int = EXPLANATION_CACHE_SIZE,
+                 ttl_seconds: float = EXPLANATION_CACHE_TTL,
+                 flush_interval: float = EXPLANATION_USAGE_FLUSH_SECONDS):
+        self.collection = db[EXPLANATIONS_COLLECTION]
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._pending_usage: Dict[CacheKey, int] = {}
+        self._last_used: Dict[CacheKey, datetime] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- bellek katmanı ----------
+
+    def _memory_get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            explanation, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return explanation
+
+    def _memory_put(self, key: CacheKey, explanation: str):
+        with self._lock:
+            self._entries[key] = (explanation, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ---------- okuma / yazma ----------
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Önce bellek, sonra Mongo. Bulunursa kullanım sayacı tamponda artırılır."""
+        explanation = self._memory_get(key)
+        if explanation is None:
+            doc = self.collection.find_one(explanation_query(key), {"explanation": 1})
+            if doc is None:
+                return None
+            explanation = doc.get("explanation", "")
+            self._memory_put(key, explanation)
+        self.record_use(key)
+        return explanation
+
+    def put(self, key: CacheKey, explanation_doc: Dict):
+        """Yeni açıklamayı kaydet - aynı anahtar zaten varsa dokunma"""
+        try:
+            self.collection.update_one(
+                explanation_query(key),
+                {"$setOnInsert": explanation_doc},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Eşzamanlı iki upsert - diğeri önce ekledi
+            pass
+        self._memory_put(key, explanation_doc.get("explanation", ""))
+
+    async def aget(self, key: CacheKey) -> Optional[str]:
+        explanation = self._memory_get(key)
+        if explanation is not None:
+            self.record_use(key)
+            return explanation
+        return await run_blocking(self.get, key)
+
+    async def aput(self, key: CacheKey, explanation_doc: Dict):
+        await run_blocking(self.put, key, explanation_doc)
+
+    # ---------- usage_count tamponu ----------
+
+    def record_use(self, key: CacheKey):
+        with self._lock:
+            self._pending_usage[key] = self._pending_usage.get(key, 0) + 1
+            self._last_used[key] = datetime.utcnow()
+
+    def flush(self) -> int:
+        """Biriken usage_count artışlarını tek bulk_write ile yaz"""
+        with self._lock:
+            pending, self._pending_usage = self._pending_usage, {}
+            last_used, self._last_used = self._last_used, {}
+        if not pending:
+            return 0
+
+        operations = [
+            UpdateOne(explanation_query(key), {"$inc": {"usage_count": count}, "$set": {"last_used": last_used[key]}})
+            for key, count in pending.items()
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            # Yazılamayanları geri koy - bir sonraki flush'ta tekrar denenir
+            print(f"⚠️ Explanation usage flush failed: {str(e)}")
+            with self._lock:
+                for key, count in pending.items():
+                    self._pending_usage[key] = self._pending_usage.get(key, 0) + count
+                    self._last_used.setdefault(key, last_used[key])
+            return 0
+        return len(operations)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="explanation-usage-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arka plan flush'ı durdur ve kalanları yaz"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+            self._thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="question_explanations kopya temizliği ve unique index")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--dedupe", action="store_true", help="aynı anahtarlı kopyaları birleştir")
+    args = parser.parse_args()
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    db = create_mongo_client(settings)[settings.db_name]
+
+    if args.dedupe:
+        dedupe_explanations(db)
+    status = ensure_indexes(db)[f"{EXPLANATIONS_COLLECTION}.{EXPLANATION_KEY_INDEX}"]
+    if status.startswith("failed"):
+        print(f"❌ question_explanations unique index oluşturulamadı ({status}) - önce --dedupe")
+    else:
+        print("✅ question_explanations unique index hazır")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# explanation_generator.py - LLM prompts and generation for question explanations
+#
+# explain-answer endpoint'i ve toplu ön üretim (pregenerate_explanations.py) aynı
+# prompt'ları ve doküman biçimini kullanır.
+
+import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from langchain.prompts import PromptTemplate
+
+# İngilizce prompt, Korece cevap
+CORRECT_ANSWER_PROMPT = """
+You are a medical education expert. The student answered correctly! Please provide a clear and concise explanation in Korean.
+
+Question: {question}
+
+Choices:
+{choices}
+
+Correct Answer: {correct_answer_index}. {correct_answer_text}
+Student's Answer: {student_answer_index}. {student_answer_text}
+
+Please explain in Korean:
+1. Why this answer is correct
+
+Provide the explanation in Korean language, keep it clear, short and educational. Do not provide any additional information or context. Only explanation in Korean.
+
+Korean Explanation:"""
+
+WRONG_ANSWER_PROMPT = """
+You are a medical education expert. The student answered incorrectly. Please provide a clear and helpful explanation in Korean.
+
+Question: {question}
+
+Choices:
+{choices}
+
+Correct Answer: {correct_answer_index}. {correct_answer_text}
+Student's Answer: {student_answer_index}. {student_answer_text}
+
+Please explain in Korean:
+1. Why the correct answer ({correct_answer_index}) is right
+2. Why the student's choice ({student_answer_index}) is wrong
+3. Common misconceptions that might lead to choosing the wrong answer
+
+Provide the explanation in Korean language, be short, supportive and educational.Do not provide any additional information or context. Only explanation in Korean.
+
+Korean Explanation:"""
+
+PROMPT_VARIABLES = ["question", "choices", "correct_answer_index", "correct_answer_text",
+                    "student_answer_index", "student_answer_text"]
+
+FALLBACK_EXPLANATION = "죄송합니다. 설명을 생성하는 중 오류가 발생했습니다."
+
+
+def question_fields(question: Dict) -> Tuple[str, List[str], Optional[int]]:
+    """Soru dokümanından (metin, seçenekler, 1-based doğru cevap) - eski alan adları da desteklenir"""
+    question_text = question.get("Problem", question.get("problem", ""))
+    choices = question.get("Choices", question.get("choices", []))
+    correct_answer = question.get("Answer Key", question.get("answer_key"))
+
+    if correct_answer is None:
+        return question_text, choices, None
+
+    # Normalize answer indices (1-based)
+    if isinstance(correct_answer, int) and correct_answer >= 1:
+        return question_text, choices, correct_answer
+    return question_text, choices, int(correct_answer) if str(correct_answer).isdigit() else 1
+
+
+def build_prompt(is_correct: bool) -> PromptTemplate:
+    return PromptTemplate(
+        template=CORRECT_ANSWER_PROMPT if is_correct else WRONG_ANSWER_PROMPT,
+        input_variables=PROMPT_VARIABLES
+    )
+
+
+def prompt_inputs(question_text: str, choices: List[str], correct_answer_index: int,
+                  student_answer_index: int) -> Dict:
+    # Seçenekleri formatla (1-based)
+    choices_text = ""
+    for i, choice in enumerate(choices, 1):
+        choices_text += f"{i}. {choice}\n"
+
+    # Doğru ve öğrenci cevap metinlerini al
+    correct_answer_text = choices[correct_answer_index - 1] if correct_answer_index <= len(choices) else "Unknown"
+    student_answer_text = choices[student_answer_index - 1] if student_answer_index <= len(choices) else "Unknown"
+
+    return {
+        "question": question_text,
+        "choices": choices_text,
+        "correct_answer_index": correct_answer_index,
+        "correct_answer_text": correct_answer_text,
+        "student_answer_index": student_answer_index,
+        "student_answer_text": student_answer_text
+    }
+
+
+async def generate_explanation_text(llm, question_text: str, choices: List[str], correct_answer_index: int,
+                                    student_answer_index: int, is_correct: bool) -> str:
+    """LLM ile açıklama oluştur - hata olursa exception fırlatır (sonuç önbelleğe yazılmamalı)"""
+    chain = build_prompt(is_correct) | llm
+
+    # ainvoke - LLM yanıtı beklenirken event loop diğer istekleri işler
+    explanation = await chain.ainvoke(
+        prompt_inputs(question_text, choices, correct_answer_index, student_answer_index)
+    )
+
+    # LangChain response'dan text çıkar
+    explanation_text = explanation.content if hasattr(explanation, 'content') else str(explanation)
+    return explanation_text.strip()
+
+
+async def stream_explanation_text(llm, question_text: str, choices: List[str], correct_answer_index: int,
+                                  student_answer_index: int, is_correct: bool) -> AsyncIterator[str]:
+    """generate_explanation_text'in akışlı sürümü - model ürettikçe metin parçaları döndürür"""
+    chain = build_prompt(is_correct) | llm
+
+    async for chunk in chain.astream(
+        prompt_inputs(question_text, choices, correct_answer_index, student_answer_index)
+    ):
+        text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+        if text:
+            yield text
+
+
+def build_explanation_doc(question_id: str, explanation_type: str, explanation_text: str, question_text: str,
+                          correct_answer_index: int, student_answer_index: int, usage_count: int = 1) -> Dict:
+    """question_explanations dokümanı"""
+    return {
+        "question_id": question_id,
+        "explanation": explanation_text,
+        "explanation_type": explanation_type,
+        "created_at": datetime.datetime.utcnow(),
+        "question_text": question_text,
+        "correct_answer": correct_answer_index,
+        "student_answer": student_answer_index,  # Important for wrong answers
+        "usage_count": usage_count  # Track how many times used
+    }
@@ -0,0 +1,166 @@
+# index_manager.py - Index provisioning and query-plan audit
+#
+# Her modül kendi sorgularının ihtiyaç duyduğu index'leri ve sıcak (hot) sorgularını yanında tanımlar:
+#
+#   REQUIRED_INDEXES = [{"collection": "...", "keys": [("alan", 1)], "name": "...", "unique": True}]
+#   HOT_QUERIES = [{"name": "...", "collection": "...", "filter": {...}, "sort": [...]}]
+#
+# Uygulama başlarken ensure_indexes() hepsini idempotent olarak oluşturur (MONGO_ENSURE_INDEXES=false
+# ile kapatılabilir). audit_query_plans() her sıcak sorguyu explain() ile çalıştırır ve kazanan planda
+# COLLSCAN olanları döndürür.
+#
+# Kullanım:
+#   python index_manager.py              # index'leri oluştur
+#   python index_manager.py --list       # tanımlı index'ler ve sıcak sorgular
+#   python index_manager.py --audit      # COLLSCAN varsa çıkış kodu 1 (CI'da kullanılır)
+
+import argparse
+import importlib
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from pymongo.errors import OperationFailure
+
+from database import MongoSettings, create_mongo_client
+
+# REQUIRED_INDEXES / HOT_QUERIES tanımlayan modüller - döngüsel import olmasın diye ilk kullanımda yüklenir
+INDEX_MODULES = [
+    "type_based_bkt_system",
+    "bkt_rebuild",
+    "explanation_cache",
+    "test_history_store",
+    "level_test_forms",
+    "user_router"
+]
+
+
+def _collect(attribute: str, modules: Optional[Iterable[str]] = None) -> List[Dict]:
+    collected = []
+    for module_name in modules or INDEX_MODULES:
+        module = importlib.import_module(module_name)
+        collected.extend(getattr(module, attribute, []))
+    return collected
+
+
+def required_indexes(modules: Optional[Iterable[str]] = None) -> List[Dict]:
+    return _collect("REQUIRED_INDEXES", modules)
+
+
+def hot_queries(modules: Optional[Iterable[str]] = None) -> List[Dict]:
+    return _collect("HOT_QUERIES", modules)
+
+
+def create_indexes(db, specs: Iterable[Dict]) -> Dict[str, str]:
+    """
+    Index'leri oluştur - aynı ad/anahtarla zaten varsa MongoDB bir şey yapmaz.
+    Dönüş: {"koleksiyon.ad": "created" | "exists" | "failed: ..."}
+    """
+    results = {}
+    for spec in specs:
+        collection = db[spec["collection"]]
+        label = f"{spec['collection']}.{spec['name']}"
+        options = {key: spec[key] for key in ("unique", "sparse", "partialFilterExpression") if key in spec}
+        try:
+            existed = spec["name"] in collection.index_information()
+            collection.create_index(spec["keys"], name=spec["name"], **options)
+            results[label] = "exists" if existed else "created"
+        except OperationFailure as e:
+            # Aynı adla farklı tanım ya da unique index'te mevcut kopyalar
+            results[label] = f"failed: {e.details.get('errmsg', str(e)) if e.details else str(e)}"
+    return results
+
+
+def ensure_indexes(db, modules: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    results = create_indexes(db, required_indexes(modules))
+    created = [label for label, status in results.items() if status == "created"]
+    failed = {label: status for label, status in results.items() if status.startswith("failed")}
+    print(f"🗂️ Indexes: {len(results)} required, {len(created)} created, {len(failed)} failed")
+    for label, status in failed.items():
+        print(f"⚠️ Index {label} {status}")
+    return results
+
+
+def plan_stages(plan: Dict) -> Iterator[str]:
+    """Plan ağacındaki tüm stage adları (klasik ve SBE explain çıktısı)"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for key in ("inputStages", "shards"):
+        for child in plan.get(key, []):
+            yield from plan_stages(child.get("winningPlan", child) if key == "shards" else child)
+
+
+def explain_query(db, query: Dict) -> Dict:
+    cursor = db[query["collection"]].find(query.get("filter", {}), query.get("projection"))
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+    if query.get("limit"):
+        cursor = cursor.limit(query["limit"])
+    return cursor.explain()
+
+
+def audit_query_plans(db, queries: Optional[List[Dict]] = None) -> List[Dict]:
+    """Her sıcak sorgunun kazanan planı - collscan=True olanlar index'siz"""
+    report = []
+    for query in queries if queries is not None else hot_queries():
+        winning_plan = explain_query(db, query).get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(plan_stages(winning_plan))
+        report.append({
+            "name": query["name"],
+            "collection": query["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
+
+def assert_no_collscan(db, queries: Optional[List[Dict]] = None):
+    """Testlerden çağrılır - COLLSCAN kullanan sıcak sorgu varsa AssertionError"""
+    offenders = [entry for entry in audit_query_plans(db, queries) if entry["collscan"]]
+    assert not offenders, "COLLSCAN in hot queries: " + ", ".join(
+        f"{entry['name']} ({entry['collection']}: {' > '.join(entry['stages'])})" for entry in offenders
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MongoDB index'lerini oluştur ve sorgu planlarını denetle")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--list", action="store_true", help="tanımlı index'leri ve sıcak sorguları yazdır")
+    parser.add_argument("--audit", action="store_true", help="index'leri oluşturduktan sonra explain() denetimi")
+    parser.add_argument("--no-create", action="store_true", help="index oluşturmadan sadece denetle")
+    args = parser.parse_args()
+
+    if args.list:
+        for spec in required_indexes():
+            flags = " unique" if spec.get("unique") else ""
+            print(f"🗂️ {spec['collection']}.{spec['name']}: {spec['keys']}{flags}")
+        for query in hot_queries():
+            print(f"🔎 {query['name']}: {query['collection']} {query.get('filter', {})} sort={query.get('sort')}")
+        return
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    db = create_mongo_client(settings)[settings.db_name]
+
+    if not args.no_create:
+        results = ensure_indexes(db)
+        for label, status in sorted(results.items()):
+            print(f"   {label}: {status}")
+
+    if args.audit:
+        report = audit_query_plans(db)
+        for entry in report:
+            mark = "❌" if entry["collscan"] else "✅"
+            print(f"{mark} {entry['name']}: {' > '.join(entry['stages'])}")
+        offenders = [entry for entry in report if entry["collscan"]]
+        if offenders:
+            print(f"❌ {len(offenders)} hot queries use COLLSCAN")
+            sys.exit(1)
+        print(f"✅ {len(report)} hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
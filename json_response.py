@@ -0,0 +1,100 @@
+# json_response.py - orjson-backed JSON responses that understand BSON and NumPy values
+#
+# Handler'lar Mongo dokümanlarını / BKT sonuçlarını olduğu gibi döndürebilir, elle çevirmeye gerek yok:
+#   ObjectId        -> "665f..."
+#   datetime/date   -> ISO 8601 (datetime.isoformat() ile aynı çıktı)
+#   numpy skaler/dizi -> sayı / liste
+#   set, Decimal, pydantic model -> liste / sayı / dict
+#
+# Router'lar route_class=BSONJSONRoute ile oluşturulur: endpoint'in döndürdüğü dict/list FastAPI'nin
+# jsonable_encoder'ından geçmeden tek seferde orjson ile serileştirilir. response_model (ya da dönüş tipi)
+# tanımlı route'lar FastAPI'nin normal doğrulama yolundan gider; Response döndürenlere dokunulmaz.
+
+import functools
+import inspect
+from decimal import Decimal
+from typing import Any, Callable, Optional
+
+import numpy as np
+import orjson
+from bson import ObjectId
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """orjson'ın kendisi bilmediği tipler"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, np.generic):
+        # OPT_SERIALIZE_NUMPY'nin kapsamadığı skalerler (np.str_, np.float16 ...)
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bayt dizisi - yanıt gövdeleri ve önceden serileştirilmiş önbellekler için"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class BSONJSONResponse(JSONResponse):
+    """ObjectId / datetime / NumPy değerlerini doğrudan serileştiren JSONResponse"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _serializes_directly(endpoint: Callable, route_options: dict) -> bool:
+    """response_model ya da dönüş tipi varsa FastAPI doğrulasın; özel response_class'a da dokunma"""
+    response_model = route_options.get("response_model")
+    if isinstance(response_model, DefaultPlaceholder):
+        response_model = response_model.value
+    if response_model is not None:
+        return False
+    if inspect.signature(endpoint).return_annotation is not inspect.Signature.empty:
+        return False
+    response_class = route_options.get("response_class")
+    return response_class is None or isinstance(response_class, DefaultPlaceholder) or \
+        issubclass(response_class, BSONJSONResponse)
+
+
+def _to_response(content: Any, status_code: Optional[int]) -> Response:
+    if isinstance(content, Response):
+        return content
+    return BSONJSONResponse(content, status_code=status_code or 200)
+
+
+def _direct_endpoint(endpoint: Callable, status_code: Optional[int]) -> Callable:
+    # functools.wraps: FastAPI parametreleri/bağımlılıkları orijinal imzadan okur
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def direct_endpoint(*args, **kwargs):
+            return _to_response(await endpoint(*args, **kwargs), status_code)
+    else:
+        # Sync endpoint sync kalır - FastAPI yine thread havuzunda çalıştırır
+        @functools.wraps(endpoint)
+        def direct_endpoint(*args, **kwargs):
+            return _to_response(endpoint(*args, **kwargs), status_code)
+    return direct_endpoint
+
+
+class BSONJSONRoute(APIRoute):
+    """Dönüş değerini jsonable_encoder yerine doğrudan BSONJSONResponse'a veren route"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if _serializes_directly(endpoint, kwargs):
+            endpoint = _direct_endpoint(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,222 @@
+# level_test_forms.py - Versioned, immutable standardized level test forms
+#
+# Seviye testi her istekte yeniden seçilmez: yayınlanmış bir "form" sunulur.
+#   {version, form_id, seed, questions: [30 sorunun anlık kopyası (question_dto alanları), sunum sırasıyla],
+#    difficulty_counts, content_hash, reason, created_at}
+# Formlar level_test_forms koleksiyonunda değişmez dokümanlardır - yeni içerik = yeni version.
+#
+# Yeni form ne zaman oluşur:
+#   - yönetici yayınlar (POST /api/exam/admin/level-test/publish) - seed verilmezse rastgele
+#   - hiç form yoksa ilk istekte (LEVEL_TEST_SEED, yoksa 12345 seed'iyle)
+#   - diagnosis_test değişir ve güncel formdaki bir soru silinir/düzenlenir: silinenlerin yerine aynı
+#     zorluktan (deterministik) soru seçilir, düzenlenenler yeni haliyle alınır. Sadece soru eklenmesi
+#     formu değiştirmez - sonuçlar karşılaştırılabilir kalır.
+# content_hash unique: birden çok worker aynı değişikliği görüp aynı formu üretirse tek version oluşur.
+#
+# Worker'lar en son version'ı LEVEL_TEST_FORM_TTL saniyede bir kontrol eder ve formu bellekte tutar.
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from question_catalog import QuestionCatalog
+from question_dto import QUESTION_FIELDS, to_question_dto
+
+LEVEL_TEST_FORMS_COLLECTION = "level_test_forms"
+LEVEL_TEST_COLLECTION = "diagnosis_test"
+LEVEL_TEST_DIFFICULTIES = ["하", "중", "상"]
+QUESTIONS_PER_DIFFICULTY = 10
+DEFAULT_LEVEL_TEST_SEED = 12345
+LEVEL_TEST_FORM_TTL = float(os.getenv("LEVEL_TEST_FORM_TTL", "30"))
+
+REQUIRED_INDEXES = [
+    {"collection": LEVEL_TEST_FORMS_COLLECTION, "keys": [("version", DESCENDING)],
+     "name": "level_test_form_version", "unique": True},
+    {"collection": LEVEL_TEST_FORMS_COLLECTION, "keys": [("content_hash", 1)],
+     "name": "level_test_form_content", "unique": True}
+]
+
+HOT_QUERIES = [
+    {"name": "level_test_form_latest", "collection": LEVEL_TEST_FORMS_COLLECTION, "filter": {},
+     "projection": {"version": 1}, "sort": [("version", DESCENDING)], "limit": 1},
+    {"name": "level_test_form_by_version", "collection": LEVEL_TEST_FORMS_COLLECTION, "filter": {"version": 1}}
+]
+
+
+def _question_snapshot(question: Dict) -> Dict:
+    # Öğrenciye gidebilecek alanlar - cevap anahtarı forma yazılmaz
+    return to_question_dto(question, QUESTION_FIELDS)
+
+
+def content_hash(questions: List[Dict]) -> str:
+    payload = json.dumps(questions, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def sample_questions(catalog: QuestionCatalog, rng: random.Random) -> List[Dict]:
+    """Zorluk başına QUESTIONS_PER_DIFFICULTY soru, karıştırılmış - aynı rng + aynı banka -> aynı sonuç"""
+    questions = []
+    for difficulty in LEVEL_TEST_DIFFICULTIES:
+        questions.extend(catalog.sample(LEVEL_TEST_COLLECTION, QUESTIONS_PER_DIFFICULTY, difficulty=difficulty, rng=rng))
+    rng.shuffle(questions)
+    return [_question_snapshot(question) for question in questions]
+
+
+def difficulty_counts(questions: List[Dict]) -> Dict[str, int]:
+    return {
+        difficulty: sum(1 for question in questions if question.get("difficulty") == difficulty)
+        for difficulty in LEVEL_TEST_DIFFICULTIES
+    }
+
+
+class LevelTestForms:
+    """Yayınlanmış seviye testi formları - güncel form bellekte, version'lar değişmez"""
+
+    def __init__(self, db, catalog: QuestionCatalog, ttl_seconds: float = LEVEL_TEST_FORM_TTL):
+        self.collection = db[LEVEL_TEST_FORMS_COLLECTION]
+        self.catalog = catalog
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._current: Optional[Dict] = None
+        self._checked_at: Optional[float] = None
+        self._by_version: Dict[int, Dict] = {}
+        self._bank_changed = False
+
+        catalog.add_listener(self._on_catalog_change)
+
+    def _on_catalog_change(self, collection_name: str):
+        # Katalog kilidi altında çağrılır - sadece işaretle, kontrol bir sonraki current() çağrısında
+        if collection_name == LEVEL_TEST_COLLECTION:
+            self._bank_changed = True
+
+    # ---------- okuma ----------
+
+    def current(self) -> Dict:
+        """Güncel form - gerekirse Mongo'dan yükler, yoksa oluşturur, banka değiştiyse onarır"""
+        if self._current is not None and not self._bank_changed and \
+                time.monotonic() - self._checked_at <= self.ttl_seconds:
+            return self._current
+
+        with self._lock:
+            latest = self.collection.find_one({}, {"version": 1}, sort=[("version", DESCENDING)])
+            if latest is None:
+                self._set_current(self._insert(self.build(self._default_seed(), reason="initial")))
+            elif self._current is None or latest["version"] != self._current["version"]:
+                self._set_current(self.collection.find_one({"_id": latest["_id"]}))
+
+            if self._bank_changed:
+                self._bank_changed = False
+                repaired = self._repair(self._current)
+                if repaired is not None:
+                    self._set_current(self._insert(repaired))
+
+            self._checked_at = time.monotonic()
+            return self._current
+
+    def get(self, version: int) -> Optional[Dict]:
+        """Belirli bir version (değişmez - bir kez okununca bellekte kalır)"""
+        form = self._by_version.get(version)
+        if form is None:
+            form = self.collection.find_one({"version": version})
+            if form is not None:
+                self._by_version[version] = form
+        return form
+
+    def _set_current(self, form: Dict):
+        self._current = form
+        self._by_version[form["version"]] = form
+
+    @staticmethod
+    def _default_seed() -> int:
+        return int(os.getenv("LEVEL_TEST_SEED", DEFAULT_LEVEL_TEST_SEED))
+
+    # ---------- oluşturma ----------
+
+    def build(self, seed: int, reason: str = "publish") -> Dict:
+        """Kaydedilmemiş form (version yok)"""
+        self.catalog.ensure_loaded()
+        questions = sample_questions(self.catalog, random.Random(seed))
+        if not questions:
+            raise ValueError(f"{LEVEL_TEST_COLLECTION} koleksiyonunda soru yok")
+        return {
+            "seed": seed,
+            "questions": questions,
+            "difficulty_counts": difficulty_counts(questions),
+            "content_hash": content_hash(questions),
+            "reason": reason
+        }
+
+    def _repair(self, form: Dict) -> Optional[Dict]:
+        """Silinen soruları aynı zorluktan yenileriyle değiştir, düzenlenenleri güncelle - değişiklik yoksa None"""
+        self.catalog.ensure_loaded()
+        form_ids = {question["_id"] for question in form["questions"]}
+        # Form başına sabit rng - aynı değişikliği gören tüm worker'lar aynı yedekleri seçer
+        rng = random.Random(f"{form['seed']}-{form['version']}")
+
+        questions = []
+        for question in form["questions"]:
+            current = self.catalog.get(LEVEL_TEST_COLLECTION, question["_id"])
+            if current is None:
+                candidates = [
+                    candidate for candidate in self.catalog.sample(
+                        LEVEL_TEST_COLLECTION, QUESTIONS_PER_DIFFICULTY * 3,
+                        difficulty=question.get("difficulty"), rng=rng
+                    )
+                    if str(candidate["_id"]) not in form_ids
+                ]
+                if not candidates:
+                    continue
+                current = candidates[0]
+                form_ids.add(str(current["_id"]))
+            questions.append(_question_snapshot(current))
+
+        new_hash = content_hash(questions)
+        if new_hash == form["content_hash"]:
+            return None
+        print(f"🔁 Level test form v{form['version']} affected by question bank change - rebuilding")
+        return {
+            "seed": form["seed"],
+            "questions": questions,
+            "difficulty_counts": difficulty_counts(questions),
+            "content_hash": new_hash,
+            "reason": "bank_changed",
+            "previous_version": form["version"]
+        }
+
+    def publish(self, seed: Optional[int] = None, published_by: Optional[str] = None) -> Dict:
+        """Yeni form yayınla - aynı içerikte bir form zaten varsa o döner"""
+        seed = seed if seed is not None else random.randrange(2 ** 31)
+        form = self.build(seed)
+        form["published_by"] = published_by
+        with self._lock:
+            form = self._insert(form)
+            if self._current is None or form["version"] > self._current["version"]:
+                self._set_current(form)
+            self._checked_at = time.monotonic()
+        return form
+
+    def _insert(self, form: Dict, max_attempts: int = 5) -> Dict:
+        for _ in range(max_attempts):
+            latest = self.collection.find_one({}, {"version": 1}, sort=[("version", DESCENDING)])
+            version = latest["version"] + 1 if latest else 1
+            document = dict(form, version=version, form_id=f"v{version}-{form['content_hash'][:12]}",
+                            created_at=datetime.utcnow())
+            try:
+                self.collection.insert_one(document)
+                print(f"📝 Level test form published: {document['form_id']} ({form['reason']})")
+                return document
+            except DuplicateKeyError:
+                # Aynı içerik başka bir worker/istek tarafından zaten yayınlandı
+                existing = self.collection.find_one({"content_hash": form["content_hash"]})
+                if existing is not None:
+                    return existing
+        raise RuntimeError(f"Could not publish level test form after {max_attempts} attempts")
@@ -0,0 +1,187 @@
+# llm_providers.py - Pluggable LLM backends for explanation generation
+#
+# Ortam değişkenleri (.env destekli):
+#   LLM_PROVIDER        openai | local | fake            (varsayılan: openai)
+#   LLM_MODEL           model adı                         (openai: gpt-4o-2024-08-06)
+#   LLM_TEMPERATURE     0
+#   LLM_MAX_TOKENS      2000
+#   LLM_TIMEOUT         60 (sn)
+#   openai_api_key      OpenAI anahtarı
+#   LLM_BASE_URL        local: OpenAI uyumlu sunucu (vLLM, Ollama, LM Studio) - http://localhost:8001/v1
+#   LLM_API_KEY         local: sunucu anahtar istiyorsa
+#   FAKE_LLM_LATENCY_MS fake: yanıt gecikmesi (yük testi için)
+#
+# Model istemcisi ilk kullanımda oluşturulur - anahtar/ağ ayarı olmadan uygulama açılır.
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+load_dotenv()
+
+DEFAULT_OPENAI_MODEL = "gpt-4o-2024-08-06"
+
+
+class LLMSettings:
+    """LLM bağlantı ayarları"""
+
+    def __init__(self, provider: Optional[str] = None, model: Optional[str] = None):
+        self.provider = (provider or os.getenv("LLM_PROVIDER", "openai")).strip().lower()
+        self.model = model or os.getenv("LLM_MODEL")
+        self.temperature = float(os.getenv("LLM_TEMPERATURE", "0"))
+        self.max_tokens = int(os.getenv("LLM_MAX_TOKENS", "2000"))
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+        self.openai_api_key = os.getenv("openai_api_key")
+        self.base_url = os.getenv("LLM_BASE_URL", "http://localhost:8001/v1")
+        self.api_key = os.getenv("LLM_API_KEY", "not-needed")
+        self.fake_latency = float(os.getenv("FAKE_LLM_LATENCY_MS", "0")) / 1000
+
+
+class DeterministicFakeChatModel(BaseChatModel):
+    """
+    Ağsız sahte model - aynı prompt her zaman aynı cevabı verir.
+    Gecikme async yolda asyncio.sleep ile beklenir (gerçek HTTP çağrısı gibi thread tutmaz).
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "deterministic-fake"
+
+    @staticmethod
+    def _response_text(messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"[fake-llm {digest}] 이 문제에 대한 테스트용 설명입니다."
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        text = self._response_text(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Kelime kelime - toplam gecikme parçalara bölünür
+        words = self._response_text(messages).split(" ")
+        for index, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            text = word if index == len(words) - 1 else word + " "
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+class LLMProvider(ABC):
+    """Açıklama üretimi için model kaynağı - llm özelliği LangChain chat modeli döndürür"""
+
+    name = "base"
+
+    def __init__(self, settings: LLMSettings):
+        self.settings = settings
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self) -> BaseChatModel:
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = self._build()
+                    print(f"🤖 LLM provider ready: {self.describe()}")
+        return self._llm
+
+    @abstractmethod
+    def _build(self) -> BaseChatModel:
+        """Model istemcisini oluştur - ilk llm erişiminde bir kez çağrılır"""
+
+    @property
+    def model(self) -> str:
+        return self.settings.model or DEFAULT_OPENAI_MODEL
+
+    def describe(self) -> str:
+        return f"{self.name}:{self.model}"
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def _build(self) -> BaseChatModel:
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            api_key=self.settings.openai_api_key,
+            model=self.model,
+            temperature=self.settings.temperature,
+            max_tokens=self.settings.max_tokens,
+            timeout=self.settings.timeout
+        )
+
+
+class LocalProvider(LLMProvider):
+    """Kendi sunucumuzdaki OpenAI uyumlu model (vLLM, Ollama, LM Studio ...)"""
+
+    name = "local"
+
+    def _build(self) -> BaseChatModel:
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
+            base_url=self.settings.base_url,
+            api_key=self.settings.api_key,
+            model=self.model,
+            temperature=self.settings.temperature,
+            max_tokens=self.settings.max_tokens,
+            timeout=self.settings.timeout
+        )
+
+    def describe(self) -> str:
+        return f"{self.name}:{self.model}@{self.settings.base_url}"
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+
+    @property
+    def model(self) -> str:
+        return self.settings.model or "deterministic-fake"
+
+    def _build(self) -> BaseChatModel:
+        return DeterministicFakeChatModel(latency=self.settings.fake_latency)
+
+    def describe(self) -> str:
+        return f"{self.name} (latency={self.settings.fake_latency * 1000:.0f}ms)"
+
+
+PROVIDERS: Dict[str, type] = {
+    OpenAIProvider.name: OpenAIProvider,
+    LocalProvider.name: LocalProvider,
+    FakeProvider.name: FakeProvider
+}
+
+
+def create_provider(settings: Optional[LLMSettings] = None) -> LLMProvider:
+    settings = settings or LLMSettings()
+    provider_class = PROVIDERS.get(settings.provider)
+    if provider_class is None:
+        raise ValueError(f"Unknown LLM_PROVIDER '{settings.provider}' (expected one of: {', '.join(PROVIDERS)})")
+    return provider_class(settings)
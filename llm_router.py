@@ -1,30 +1,80 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import Dict, Any, List, Optional
-import pymongo
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-import os
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from typing import Dict, AsyncIterator, List
 from pydantic import BaseModel, Field
-import datetime
-import bson
-from bson.objectid import ObjectId
-load_dotenv()
-openai_api_key = os.getenv("openai_api_key")
-
-# MongoDB bağlantısı
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client["physical_therapy_questions"]
+import asyncio
+import json
+from question_resolver import fetch_question
+from async_db import run_blocking
+from explanation_cache import explanation_key
+from explanation_generator import (
+    question_fields, generate_explanation_text, stream_explanation_text, build_explanation_doc
+)
+from services import AppServices, get_services
+from json_response import BSONJSONRoute
 
 # LLM router
-llm_router = APIRouter(prefix="/api/llm", tags=["llm"])
-#MODEL
-llm = ChatOpenAI(
-    api_key=openai_api_key,
-    model="gpt-4o-2024-08-06",
-    temperature=0,
-    max_tokens=2000
-)
+llm_router = APIRouter(prefix="/api/llm", tags=["llm"], route_class=BSONJSONRoute)
+# Aynı açıklama için devam eden LLM üretimleri - eşzamanlı cache miss'ler tek çağrıyı bekler
+# key: (question_id, explanation_type, student_answer)
+_inflight_explanations: Dict[tuple, asyncio.Task] = {}
+# Akışlı üretimlerin parçaları - aynı anahtarı isteyen diğer stream istemcileri de izler
+_inflight_streams: Dict[tuple, "_ExplanationStream"] = {}
+
+
+class _ExplanationStream:
+    """Devam eden akışlı üretim - parçalar birikir, her dinleyici baştan itibaren okur"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.finished = False
+        self._condition = asyncio.Condition()
+
+    async def push(self, text: str):
+        async with self._condition:
+            self.chunks.append(text)
+            self._condition.notify_all()
+
+    async def close(self):
+        async with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self.chunks) or self.finished)
+                pending = self.chunks[index:]
+                finished = self.finished
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                return
+
+
+def _start_generation(key: tuple, factory) -> asyncio.Task:
+    task = asyncio.create_task(factory())
+    _inflight_explanations[key] = task
+    task.add_done_callback(lambda _: _inflight_explanations.pop(key, None))
+    return task
+
+
+async def _coalesced(key: tuple, factory) -> str:
+    """key için çalışan üretim varsa ona katıl, yoksa başlat.
+    İlk isteği yapan istemci bağlantıyı kesse bile üretim diğer bekleyenler için tamamlanır."""
+    task = _inflight_explanations.get(key)
+    if task is None:
+        task = _start_generation(key, factory)
+    else:
+        print(f"⏳ Joining in-flight explanation generation: {key}")
+    return await asyncio.shield(task)
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # Requests
 class QuestionExplanationRequest(BaseModel):
     """Soru açıklaması için gerekli giriş verileri"""
@@ -43,123 +93,86 @@ class QuestionExplanationResponse(BaseModel):
     is_correct: bool = Field(..., description="Whether the student's answer is correct")
     cached: bool = Field(False, description="Whether the explanation was retrieved from cache")
 
+async def _explanation_context(request: QuestionExplanationRequest, services: AppServices) -> Dict:
+    """Soruyu bul, cevabı değerlendir - explain-answer ve stream sürümü ortak"""
+    # Find the question in MongoDB - first search in diagnosis_test
+    question = await run_blocking(fetch_question, services.db, request.question_id, ["diagnosis_test", "exam_questions"])
+    
+    if not question:
+        raise HTTPException(status_code=404, detail="Question not found")
+    
+    # Get question details
+    question_text, choices, correct_answer_index = question_fields(question)
+    
+    if not choices:
+        raise HTTPException(status_code=400, detail="Question choices not found")
+    
+    if correct_answer_index is None:
+        raise HTTPException(status_code=400, detail="Correct answer not found")
+    
+    student_answer_index = request.student_answer
+    
+    # Check correctness
+    is_correct = student_answer_index == correct_answer_index
+    
+    return {
+        "question_text": question_text,
+        "choices": choices,
+        "correct_answer_index": correct_answer_index,
+        "student_answer_index": student_answer_index,
+        "is_correct": is_correct
+    }
+
 @llm_router.post(
     "/explain-answer",
     response_model=QuestionExplanationResponse,
     summary="Question and answer explanation",
     description="Returns a detailed explanation generated by the LLM for a question"
 )
-async def explain_answer(request: QuestionExplanationRequest):
+async def explain_answer(request: QuestionExplanationRequest, services: AppServices = Depends(get_services)):
     """
     Endpoint for question and answer explanation.
     First checks if an explanation exists in the database, otherwise gets it from the LLM.
     """
     try:
-        # Find the question in MongoDB - first search in diagnosis_test
-        collections = ["diagnosis_test", "exam_questions"]
-        question = None
-        
-        for collection_name in collections:
-            collection = db[collection_name]
-            
-            # Search by string ID
-            question = collection.find_one({"_id": request.question_id})
-            
-            # If not found, try with ObjectId
-            if not question:
-                try:
-                    obj_id = ObjectId(request.question_id)
-                    question = collection.find_one({"_id": obj_id})
-                except:
-                    pass
-            
-            if question:
-                break
-        
-        if not question:
-            raise HTTPException(status_code=404, detail="Question not found")
-        
-        # Get question details
-        question_text = question.get("Problem", question.get("problem", ""))
-        choices = question.get("Choices", question.get("choices", []))
-        correct_answer = question.get("Answer Key", question.get("answer_key"))
-        
-        if not choices:
-            raise HTTPException(status_code=400, detail="Question choices not found")
-        
-        if correct_answer is None:
-            raise HTTPException(status_code=400, detail="Correct answer not found")
-        
-        # Normalize answer indices (1-based)
-        if isinstance(correct_answer, int) and correct_answer >= 1:
-            correct_answer_index = correct_answer
-        else:
-            correct_answer_index = int(correct_answer) if str(correct_answer).isdigit() else 1
-        
-        student_answer_index = request.student_answer
-        
-        # Check correctness
-        is_correct = student_answer_index == correct_answer_index
+        context = await _explanation_context(request, services)
+        question_text = context["question_text"]
+        choices = context["choices"]
+        correct_answer_index = context["correct_answer_index"]
+        student_answer_index = context["student_answer_index"]
+        is_correct = context["is_correct"]
         
         explanation_text = ""
         cached = False
         
-        # Explanations collection
-        explanations_collection = db["question_explanations"]
-        
-        # Try to find explanation in cache
-        if is_correct:
-            # For correct answer: search only by question_id
-            cache_query = {
-                "question_id": request.question_id,
-                "explanation_type": "correct_answer"
-            }
-            print(f"🔍 Searching correct answer cache: question_id={request.question_id}")
-            
-        else:
-            # For wrong answer: search by question_id + student_answer combination
-            cache_query = {
-                "question_id": request.question_id,
-                "explanation_type": "wrong_answer",
-                "student_answer": student_answer_index
-            }
-            print(f"🔍 Searching wrong answer cache: question_id={request.question_id}, student_answer={student_answer_index}")
+        # Önce bellek (LRU), sonra question_explanations
+        cache_key = explanation_key(request.question_id, is_correct, student_answer_index)
+        cache_type = "correct answer" if is_correct else f"wrong answer ({student_answer_index})"
+        print(f"🔍 Searching explanation cache ({cache_type}): question_id={request.question_id}")
         
-        # Check if exists in cache
-        existing_explanation = explanations_collection.find_one(cache_query)
+        cached_explanation = await services.explanation_cache.aget(cache_key)
         
-        if existing_explanation:
-            explanation_text = existing_explanation.get("explanation", "")
+        if cached_explanation is not None:
+            explanation_text = cached_explanation
             cached = True
-            cache_type = "correct answer" if is_correct else f"wrong answer ({student_answer_index})"
             print(f"📚 Explanation retrieved from cache ({cache_type}): {request.question_id}")
         else:
-            # Not in cache, get from LLM and save
-            explanation_text = await generate_explanation(question_text, choices, correct_answer_index, student_answer_index, is_correct)
-            
-            # Save to database
-            explanation_doc = {
-                "question_id": request.question_id,
-                "explanation": explanation_text,
-                "explanation_type": "correct_answer" if is_correct else "wrong_answer",
-                "created_at": datetime.datetime.utcnow(),
-                "question_text": question_text,
-                "correct_answer": correct_answer_index,
-                "student_answer": student_answer_index,  # Important for wrong answers
-                "usage_count": 1  # Track how many times used
-            }
-            
-            explanations_collection.insert_one(explanation_doc)
-            cache_type = "correct answer" if is_correct else f"wrong answer ({student_answer_index})"
-            print(f"💾 New explanation saved to database ({cache_type}): {request.question_id}")
-        
-        # If retrieved from cache, increment usage count
-        if cached:
-            explanations_collection.update_one(
-                cache_query,
-                {"$inc": {"usage_count": 1}, "$set": {"last_used": datetime.datetime.utcnow()}}
-            )
-            print(f"📊 Cache usage count incremented")
+            # Not in cache, get from LLM and save (aynı anahtar için tek LLM çağrısı)
+            async def generate_and_store() -> str:
+                # Hata olursa exception bekleyen herkese gider (500) - hata metni önbelleğe yazılmaz
+                text = await generate_explanation_text(services.llm_provider.llm, question_text, choices, correct_answer_index, student_answer_index, is_correct)
+                
+                # Save to database (unique key - yarışı kaybeden upsert mevcut dokümana dokunmaz)
+                explanation_doc = build_explanation_doc(
+                    request.question_id, cache_key[1], text, question_text,
+                    correct_answer_index, student_answer_index
+                )
+                
+                await services.explanation_cache.aput(cache_key, explanation_doc)
+                print(f"💾 New explanation saved to database ({cache_type}): {request.question_id}")
+                return text
+
+            explanation_text = await _coalesced(cache_key, generate_and_store)
         
         return QuestionExplanationResponse(
             explanation=explanation_text,
@@ -174,83 +187,92 @@ async def explain_answer(request: QuestionExplanationRequest):
     except Exception as e:
         print(f"LLM explanation error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error occurred while generating explanation: {str(e)}")
-async def generate_explanation(question_text: str, choices: List[str], correct_answer_index: int, student_answer_index: int, is_correct: bool) -> str:
+
+@llm_router.post(
+    "/explain-answer/stream",
+    summary="Question and answer explanation (streaming)",
+    description="Streams the explanation as server-sent events: meta, token..., done (or error)"
+)
+async def explain_answer_stream(request: QuestionExplanationRequest, services: AppServices = Depends(get_services)):
     """
-    LLM ile açıklama oluştur
+    explain-answer'ın SSE sürümü.
+    Önbellekteki açıklama tek token olayıyla hemen gönderilir; yoksa LLM parçaları üretildikçe
+    gönderilir ve tamamlanan metin question_explanations'a yazılır.
     """
     try:
-        # Seçenekleri formatla (1-based)
-        choices_text = ""
-        for i, choice in enumerate(choices, 1):
-            choices_text += f"{i}. {choice}\n"
-        
-        # Doğru ve öğrenci cevap metinlerini al
-        correct_answer_text = choices[correct_answer_index - 1] if correct_answer_index <= len(choices) else "Unknown"
-        student_answer_text = choices[student_answer_index - 1] if student_answer_index <= len(choices) else "Unknown"
-        
-        # LLM prompt oluştur (İngilizce prompt, Korece cevap)
-        if is_correct:
-            prompt_template = """
-You are a medical education expert. The student answered correctly! Please provide a clear and concise explanation in Korean.
-
-Question: {question}
-
-Choices:
-{choices}
+        context = await _explanation_context(request, services)
+        cache_key = explanation_key(request.question_id, context["is_correct"], context["student_answer_index"])
+        cached_explanation = await services.explanation_cache.aget(cache_key)
+    except Exception as e:
+        print(f"LLM explanation stream error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error occurred while generating explanation: {str(e)}")
 
-Correct Answer: {correct_answer_index}. {correct_answer_text}
-Student's Answer: {student_answer_index}. {student_answer_text}
+    cache_type = "correct answer" if context["is_correct"] else f"wrong answer ({context['student_answer_index']})"
 
-Please explain in Korean:
-1. Why this answer is correct
+    async def generate_and_store(stream: _ExplanationStream) -> str:
+        try:
+            async for chunk in stream_explanation_text(
+                services.llm_provider.llm, context["question_text"], context["choices"],
+                context["correct_answer_index"], context["student_answer_index"], context["is_correct"]
+            ):
+                await stream.push(chunk)
+        finally:
+            await stream.close()
 
-Provide the explanation in Korean language, keep it clear, short and educational. Do not provide any additional information or context. Only explanation in Korean.
+        text = "".join(stream.chunks).strip()
+        explanation_doc = build_explanation_doc(
+            request.question_id, cache_key[1], text, context["question_text"],
+            context["correct_answer_index"], context["student_answer_index"]
+        )
+        await services.explanation_cache.aput(cache_key, explanation_doc)
+        print(f"💾 New explanation saved to database ({cache_type}): {request.question_id}")
+        return text
 
-Korean Explanation:"""
-        else:
-            prompt_template = """
-You are a medical education expert. The student answered incorrectly. Please provide a clear and helpful explanation in Korean.
+    async def events():
+        yield _sse("meta", {
+            "question": context["question_text"],
+            "choices": context["choices"],
+            "correct_answer": context["correct_answer_index"],
+            "student_answer": context["student_answer_index"],
+            "is_correct": context["is_correct"],
+            "cached": cached_explanation is not None
+        })
 
-Question: {question}
+        if cached_explanation is not None:
+            print(f"📚 Explanation retrieved from cache ({cache_type}): {request.question_id}")
+            yield _sse("token", {"text": cached_explanation})
+            yield _sse("done", {"explanation": cached_explanation, "cached": True})
+            return
 
-Choices:
-{choices}
+        try:
+            # Aynı anahtar için zaten üretim varsa ona katıl - LLM'e tek çağrı
+            task = _inflight_explanations.get(cache_key)
+            stream = _inflight_streams.get(cache_key)
+            if task is None:
+                stream = _ExplanationStream()
+                task = _start_generation(cache_key, lambda: generate_and_store(stream))
+                _inflight_streams[cache_key] = stream
+                task.add_done_callback(lambda _: _inflight_streams.pop(cache_key, None))
+            else:
+                print(f"⏳ Joining in-flight explanation generation: {cache_key}")
 
-Correct Answer: {correct_answer_index}. {correct_answer_text}
-Student's Answer: {student_answer_index}. {student_answer_text}
+            if stream is not None:
+                async for chunk in stream.follow():
+                    yield _sse("token", {"text": chunk})
+                explanation_text = await asyncio.shield(task)
+            else:
+                # Akışsız üretime katıldık - bitince tek parça
+                explanation_text = await asyncio.shield(task)
+                yield _sse("token", {"text": explanation_text})
 
-Please explain in Korean:
-1. Why the correct answer ({correct_answer_index}) is right
-2. Why the student's choice ({student_answer_index}) is wrong
-3. Common misconceptions that might lead to choosing the wrong answer
+            yield _sse("done", {"explanation": explanation_text, "cached": False})
 
-Provide the explanation in Korean language, be short, supportive and educational.Do not provide any additional information or context. Only explanation in Korean.
+        except Exception as e:
+            print(f"LLM explanation stream error: {str(e)}")
+            yield _sse("error", {"detail": f"Error occurred while generating explanation: {str(e)}"})
 
-Korean Explanation:"""
-        
-        # LLM çağrısı
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["question", "choices", "correct_answer_index", "correct_answer_text", 
-                           "student_answer_index", "student_answer_text"]
-        )
-        
-        chain = prompt | llm
-        
-        explanation = chain.invoke({
-            "question": question_text,
-            "choices": choices_text,
-            "correct_answer_index": correct_answer_index,
-            "correct_answer_text": correct_answer_text,
-            "student_answer_index": student_answer_index,
-            "student_answer_text": student_answer_text
-        })
-        
-        # LangChain response'dan text çıkar
-        explanation_text = explanation.content if hasattr(explanation, 'content') else str(explanation)
-        
-        return explanation_text.strip()
-        
-    except Exception as e:
-        print(f"LLM explanation generation error: {str(e)}")
-        return "죄송합니다. 설명을 생성하는 중 오류가 발생했습니다."
\ No newline at end of file
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,13 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from router import router
+from services import AppServices
+from json_response import BSONJSONResponse
 import uvicorn
 
+
+# Shared resources - one Mongo client / BKT engine per worker process
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = AppServices()
+    services.startup()
+    app.state.services = services
+    try:
+        yield
+    finally:
+        services.close()
+
 # Create FastAPI app
 app = FastAPI(
     title="Exam Platform API",
     description="API that parses PDF questions and answers, provides student level tests and question explanations.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # ObjectId / datetime / NumPy değerleri orjson ile doğrudan (router'lar ayrıca BSONJSONRoute kullanır)
+    default_response_class=BSONJSONResponse
 )
 
 # CORS settings
@@ -0,0 +1,198 @@
+# pregenerate_explanations.py - Offline bulk generation of missing explanations
+#
+# diagnosis_test ve exam_questions'taki her soru için doğru cevap açıklamasını ve
+# her yanlış seçenek açıklamasını üretir; question_explanations'ta zaten olanları atlar.
+# Üretim hatasında kaydedilmiş eski FALLBACK_EXPLANATION dokümanları eksik sayılır ve yeniden üretilir.
+# Üretilen her açıklama hemen kaydedilir - yarıda kesilirse tekrar çalıştırmak kaldığı
+# yerden devam eder.
+#
+# Kullanım:
+#   python pregenerate_explanations.py --dry-run                 # eksikleri say
+#   python pregenerate_explanations.py --concurrency 4 --rpm 60  # üret
+#   python pregenerate_explanations.py --provider fake --fake-latency 0.2   # OpenAI'sız deneme
+#
+# Model LLM_PROVIDER / LLM_MODEL ile seçilir (bkz. llm_providers.py).
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from async_db import run_blocking
+from database import MongoSettings, create_mongo_client
+from explanation_cache import (
+    EXPLANATIONS_COLLECTION, ExplanationCache, CacheKey, explanation_key, explanation_query,
+    ensure_indexes as ensure_explanation_indexes
+)
+from explanation_generator import (
+    FALLBACK_EXPLANATION, question_fields, generate_explanation_text, build_explanation_doc
+)
+from llm_providers import PROVIDERS, LLMSettings, create_provider
+from question_resolver import QUESTION_COLLECTIONS
+
+QUESTION_PROJECTION = {"Problem": 1, "problem": 1, "Choices": 1, "choices": 1, "Answer Key": 1, "answer_key": 1}
+
+
+class RateLimiter:
+    """Dakikada en fazla rpm istek başlat (istekler arası eşit aralık)"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def existing_keys(db, question_ids: List[str]) -> set:
+    """Bu sorular için question_explanations'ta zaten olan anahtarlar (hata metni kaydedilmişler hariç)"""
+    cursor = db[EXPLANATIONS_COLLECTION].find(
+        {"question_id": {"$in": question_ids}, "explanation": {"$ne": FALLBACK_EXPLANATION}},
+        {"_id": 0, "question_id": 1, "explanation_type": 1, "student_answer": 1}
+    )
+    return {
+        explanation_key(doc["question_id"], doc.get("explanation_type") == "correct_answer", doc.get("student_answer"))
+        for doc in cursor
+    }
+
+
+def drop_fallback(db, key: CacheKey) -> int:
+    """Anahtar için kaydedilmiş hata metnini sil - put $setOnInsert ile yazdığı için yenisi ancak böyle eklenir"""
+    query = dict(explanation_query(key), explanation=FALLBACK_EXPLANATION)
+    return db[EXPLANATIONS_COLLECTION].delete_one(query).deleted_count
+
+
+def iter_missing(db, collections: List[str], batch_size: int = 200) -> Iterator[Tuple[CacheKey, Dict]]:
+    """Eksik (anahtar, üretim girdisi) çiftleri - koleksiyon _id sırasıyla, batch başına tek sorgu"""
+    seen_questions = set()
+    for collection_name in collections:
+        batch: List[Dict] = []
+        cursor = db[collection_name].find({}, QUESTION_PROJECTION).sort("_id", 1).batch_size(batch_size)
+        for question in cursor:
+            batch.append(question)
+            if len(batch) >= batch_size:
+                yield from _missing_in_batch(db, batch, seen_questions)
+                batch = []
+        if batch:
+            yield from _missing_in_batch(db, batch, seen_questions)
+
+
+def _missing_in_batch(db, questions: List[Dict], seen_questions: set) -> Iterator[Tuple[CacheKey, Dict]]:
+    # explain-answer aramayı diagnosis_test'ten başlatır - aynı id ilk koleksiyondakiyle çözülür
+    questions = [q for q in questions if str(q["_id"]) not in seen_questions]
+    seen_questions.update(str(q["_id"]) for q in questions)
+    done = existing_keys(db, [str(q["_id"]) for q in questions])
+
+    for question in questions:
+        question_id = str(question["_id"])
+        question_text, choices, correct_answer_index = question_fields(question)
+        if not choices or correct_answer_index is None:
+            continue
+
+        for student_answer_index in range(1, len(choices) + 1):
+            is_correct = student_answer_index == correct_answer_index
+            key = explanation_key(question_id, is_correct, student_answer_index)
+            if key in done:
+                continue
+            yield key, {
+                "question_id": question_id,
+                "question_text": question_text,
+                "choices": choices,
+                "correct_answer_index": correct_answer_index,
+                "student_answer_index": student_answer_index,
+                "is_correct": is_correct
+            }
+
+
+async def run_pregeneration(db, llm, collections: List[str], concurrency: int = 4,
+                            requests_per_minute: float = 60, limit: Optional[int] = None,
+                            dry_run: bool = False) -> Dict:
+    cache = ExplanationCache(db)
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(requests_per_minute)
+    stats = {"missing": 0, "generated": 0, "failed": 0}
+    started = time.monotonic()
+
+    async def generate_one(key: CacheKey, item: Dict):
+        try:
+            await rate_limiter.wait()
+            text = await generate_explanation_text(
+                llm, item["question_text"], item["choices"], item["correct_answer_index"],
+                item["student_answer_index"], item["is_correct"]
+            )
+            await run_blocking(drop_fallback, db, key)
+            await cache.aput(key, build_explanation_doc(
+                item["question_id"], key[1], text, item["question_text"],
+                item["correct_answer_index"], item["student_answer_index"], usage_count=0
+            ))
+            stats["generated"] += 1
+            if stats["generated"] % 50 == 0:
+                elapsed = time.monotonic() - started
+                print(f"📈 {stats['generated']} açıklama üretildi ({stats['generated'] / elapsed:.1f}/sn)")
+        except Exception as e:
+            # Kaydedilmedi - bir sonraki çalıştırmada tekrar denenir
+            stats["failed"] += 1
+            print(f"❌ {key}: {str(e)}")
+        finally:
+            semaphore.release()
+
+    tasks = []
+    missing = iter_missing(db, collections)
+    while True:
+        entry = await run_blocking(next, missing, None)
+        if entry is None or (limit is not None and stats["missing"] >= limit):
+            break
+        stats["missing"] += 1
+        if dry_run:
+            continue
+        # Semaphore burada alınır - bekleyen görev sayısı da concurrency ile sınırlı kalır
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(generate_one(*entry)))
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+    print(f"✅ Eksik: {stats['missing']}, üretilen: {stats['generated']}, başarısız: {stats['failed']} "
+          f"({time.monotonic() - started:.1f}s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eksik soru açıklamalarını toplu üret")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--collections", nargs="+", default=QUESTION_COLLECTIONS)
+    parser.add_argument("--concurrency", type=int, default=4, help="aynı anda en fazla LLM çağrısı")
+    parser.add_argument("--rpm", type=float, default=60, help="dakikada en fazla LLM çağrısı (0 = sınırsız)")
+    parser.add_argument("--limit", type=int, help="en fazla bu kadar eksik açıklama işle")
+    parser.add_argument("--provider", choices=list(PROVIDERS), help="varsayılan: LLM_PROVIDER")
+    parser.add_argument("--model", help="varsayılan: LLM_MODEL")
+    parser.add_argument("--dry-run", action="store_true", help="sadece eksikleri say")
+    parser.add_argument("--fake-latency", type=float, help="fake model gecikmesi (sn)")
+    args = parser.parse_args()
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    db = create_mongo_client(settings)[settings.db_name]
+    ensure_explanation_indexes(db)
+
+    llm_settings = LLMSettings(provider=args.provider, model=args.model)
+    if args.fake_latency is not None:
+        llm_settings.fake_latency = args.fake_latency
+    provider = create_provider(llm_settings)
+    llm = None if args.dry_run else provider.llm
+
+    asyncio.run(run_pregeneration(
+        db, llm, args.collections, concurrency=args.concurrency,
+        requests_per_minute=args.rpm, limit=args.limit, dry_run=args.dry_run
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# question_catalog.py - In-memory question catalogue
+
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from async_db import run_blocking
+
+# Bellekte tutulacak soru koleksiyonları
+CATALOG_COLLECTIONS = ["diagnosis_test", "exam_questions", "all_questions"]
+
+
+class QuestionCatalog:
+    """
+    Soru bankasının bellek içi kopyası
+    - koleksiyon başına {id: doküman} deposu
+    - (type, difficulty) başına id dizileri -> rastgele seçim DB'ye gitmeden yapılır
+    - örnekleme için id'ye göre sıralı katman dizileri -> k soru O(k), seed ile tekrarlanabilir
+    - change stream (replica set) ya da polling ile artımlı yenilenir; polling düzenleme/silmeleri
+      full_reload_interval'da bir tam yüklemeyle yakalar
+    - projection verilirse dokümanların sadece o alanları tutulur (ör. cevap anahtarı bellekte olmaz)
+    """
+
+    def __init__(self, db, collections: Optional[List[str]] = None,
+                 poll_interval: float = 60.0, auto_refresh: bool = True,
+                 projection: Optional[Dict[str, int]] = None,
+                 full_reload_interval: float = 600.0):
+        self.db = db
+        self.collections = list(collections or CATALOG_COLLECTIONS)
+        self.poll_interval = poll_interval
+        # Polling sadece yeni ObjectId'leri görür - düzenleme/silme bu aralıkla tam yüklemede yakalanır
+        self.full_reload_interval = full_reload_interval
+        self.auto_refresh = auto_refresh
+        # _id ve katman alanları (type, difficulty) her zaman gerekli
+        self.projection = dict(projection, _id=1, type=1, difficulty=1) if projection else None
+
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Dict[str, Dict]] = {name: {} for name in self.collections}
+        self._strata: Dict[str, Dict[Tuple, List[str]]] = {name: {} for name in self.collections}
+        self._last_object_id: Dict[str, Optional[ObjectId]] = {name: None for name in self.collections}
+        # (koleksiyon, type, difficulty) -> id'ye göre sıralı dizi; koleksiyon değişince silinir
+        self._sampling_ids: Dict[Tuple, List[str]] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._loaded = False
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        # Her değişiklikte artar - türetilmiş önbellekler bununla geçersiz kılınır
+        self.version = 0
+
+    # ---------- yükleme / yenileme ----------
+
+    def load(self):
+        """Tüm koleksiyonları baştan yükle"""
+        for collection_name in self.collections:
+            self._reload_collection(collection_name)
+        self._loaded = True
+
+    def ensure_loaded(self):
+        """İlk kullanımda yükle ve (varsa) arka plan yenilemeyi başlat"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.load()
+        if self.auto_refresh:
+            self.start()
+
+    async def aensure_loaded(self):
+        """ensure_loaded'ın async karşılığı - ilk yükleme event loop dışında yapılır"""
+        if not self._loaded:
+            await run_blocking(self.ensure_loaded)
+
+    def _reload_collection(self, collection_name: str):
+        documents = list(self.db[collection_name].find({}, self.projection))
+        with self._lock:
+            previous = self._docs[collection_name]
+            self._docs[collection_name] = {}
+            self._strata[collection_name] = {}
+            self._last_object_id[collection_name] = None
+            for doc in documents:
+                self._index(collection_name, doc)
+            # Periyodik tam yükleme bir şey değiştirmediyse türetilmiş önbellekler korunur
+            if self._docs[collection_name] != previous:
+                self._changed(collection_name)
+        print(f"📚 Catalog loaded {collection_name}: {len(documents)} questions")
+
+    def refresh(self, collection_name: Optional[str] = None):
+        """
+        Artımlı yenileme - son görülen ObjectId'den sonra eklenenleri getir
+        (merge-and-save ObjectId ile ekler). ObjectId yoksa koleksiyonu baştan yükle.
+        """
+        if not self._loaded:
+            # Henüz yüklenmedi - ilk kullanımda zaten tamamı yüklenecek
+            return
+
+        names = [collection_name] if collection_name else self.collections
+        for name in names:
+            if name not in self._docs:
+                continue
+
+            last_id = self._last_object_id[name]
+            if last_id is None:
+                self._reload_collection(name)
+                continue
+
+            new_docs = list(self.db[name].find({"_id": {"$gt": last_id}}, self.projection).sort("_id", 1))
+            if new_docs:
+                self.add(name, new_docs)
+                print(f"📚 Catalog refreshed {name}: +{len(new_docs)} questions")
+
+    def add(self, collection_name: str, documents: List[Dict]):
+        """Yeni/değişen dokümanları kataloğa ekle"""
+        if collection_name not in self._docs:
+            return
+        with self._lock:
+            for doc in documents:
+                self._index(collection_name, doc)
+            self._changed(collection_name)
+
+    def remove(self, collection_name: str, question_id):
+        if collection_name not in self._docs:
+            return
+        with self._lock:
+            self._unindex(collection_name, str(question_id))
+            self._changed(collection_name)
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """Katalog değiştiğinde çağrılacak fonksiyon (collection_name ile)"""
+        self._listeners.append(callback)
+
+    def _changed(self, collection_name: str):
+        self.version += 1
+        for key in [key for key in self._sampling_ids if key[0] == collection_name]:
+            del self._sampling_ids[key]
+        for callback in self._listeners:
+            try:
+                callback(collection_name)
+            except Exception as e:
+                print(f"⚠️ Catalog listener error: {str(e)}")
+
+    def _index(self, collection_name: str, doc: Dict):
+        if self.projection:
+            # Change stream tam dokümanı getirir - projection burada da uygulanır
+            doc = {key: value for key, value in doc.items() if self.projection.get(key)}
+        question_id = str(doc["_id"])
+        if question_id in self._docs[collection_name]:
+            self._unindex(collection_name, question_id)
+
+        self._docs[collection_name][question_id] = doc
+        key = (self._type_of(doc), doc.get("difficulty"))
+        self._strata[collection_name].setdefault(key, []).append(question_id)
+
+        if isinstance(doc["_id"], ObjectId):
+            last_id = self._last_object_id[collection_name]
+            if last_id is None or doc["_id"] > last_id:
+                self._last_object_id[collection_name] = doc["_id"]
+
+    def _unindex(self, collection_name: str, question_id: str):
+        doc = self._docs[collection_name].pop(question_id, None)
+        if doc is None:
+            return
+        key = (self._type_of(doc), doc.get("difficulty"))
+        ids = self._strata[collection_name].get(key, [])
+        if question_id in ids:
+            ids.remove(question_id)
+
+    @staticmethod
+    def _type_of(doc: Dict) -> Optional[str]:
+        question_type = doc.get("type")
+        if question_type is None or not str(question_type).strip():
+            return None
+        return str(question_type).strip()
+
+    # ---------- arka plan yenileme ----------
+
+    def start(self):
+        """Koleksiyon başına change stream dinleyicisi başlat (olmazsa polling)"""
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for collection_name in self.collections:
+            thread = threading.Thread(
+                target=self._watch_collection,
+                args=(collection_name,),
+                name=f"question-catalog-{collection_name}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop_event.set()
+        self._threads = []
+
+    def _watch_collection(self, collection_name: str):
+        opened = False
+        while not self._stop_event.is_set():
+            try:
+                with self.db[collection_name].watch(full_document="updateLookup") as stream:
+                    if opened:
+                        # Eski stream kapandıktan sonraki değişiklikler kaçmış olabilir
+                        self._reload_collection(collection_name)
+                    else:
+                        print(f"👀 Catalog watching {collection_name} (change stream)")
+                    opened = True
+                    # drop/rename/invalidate sonrası stream kapanır (alive=False) -> yeniden açılır
+                    while stream.alive and not self._stop_event.is_set():
+                        change = stream.try_next()
+                        if change is None:
+                            self._stop_event.wait(1.0)
+                            continue
+                        self._apply_change(collection_name, change)
+            except PyMongoError as e:
+                if not opened:
+                    # Standalone MongoDB change stream desteklemez -> polling
+                    print(f"⚠️ Change stream unavailable for {collection_name} ({str(e)}), polling every {self.poll_interval}s")
+                    self._poll_collection(collection_name)
+                    return
+                print(f"⚠️ Change stream for {collection_name} failed ({str(e)}), reopening")
+                self._stop_event.wait(self.poll_interval)
+
+    def _apply_change(self, collection_name: str, change: Dict):
+        operation = change.get("operationType")
+        if operation in ("insert", "replace", "update"):
+            doc = change.get("fullDocument")
+            if doc:
+                self.add(collection_name, [doc])
+        elif operation == "delete":
+            self.remove(collection_name, change["documentKey"]["_id"])
+        elif operation in ("drop", "rename", "invalidate"):
+            self._reload_collection(collection_name)
+
+    def _poll_collection(self, collection_name: str):
+        last_full_reload = time.monotonic()
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                if time.monotonic() - last_full_reload >= self.full_reload_interval:
+                    self._reload_collection(collection_name)
+                    last_full_reload = time.monotonic()
+                else:
+                    self.refresh(collection_name)
+            except PyMongoError as e:
+                print(f"⚠️ Catalog polling failed for {collection_name}: {str(e)}")
+
+    # ---------- okuma ----------
+
+    def _stratum_ids(self, collection_name: str, difficulty: Optional[str] = None,
+                     question_type: Optional[str] = None) -> List[str]:
+        strata = self._strata.get(collection_name, {})
+        if question_type is not None and difficulty is not None:
+            return list(strata.get((question_type, difficulty), []))
+
+        ids = []
+        for (stratum_type, stratum_difficulty), stratum_ids in strata.items():
+            if question_type is not None and stratum_type != question_type:
+                continue
+            if difficulty is not None and stratum_difficulty != difficulty:
+                continue
+            ids.extend(stratum_ids)
+        return ids
+
+    def count(self, collection_name: str, difficulty: Optional[str] = None,
+              question_type: Optional[str] = None) -> int:
+        self.ensure_loaded()
+        with self._lock:
+            return len(self._stratum_ids(collection_name, difficulty, question_type))
+
+    def types(self, collection_name: str) -> List[str]:
+        """Koleksiyondaki (boş olmayan) type'lar"""
+        self.ensure_loaded()
+        with self._lock:
+            return sorted({t for t, _ in self._strata.get(collection_name, {}) if t is not None})
+
+    def ids(self, collection_name: str, difficulty: Optional[str] = None,
+            question_type: Optional[str] = None) -> List[str]:
+        """Katmandaki soru id'leri (kopya liste)"""
+        self.ensure_loaded()
+        with self._lock:
+            return self._stratum_ids(collection_name, difficulty, question_type)
+
+    def stratum_counts(self, collection_name: str) -> Dict[Tuple, int]:
+        """{(type, difficulty): soru sayısı}"""
+        self.ensure_loaded()
+        with self._lock:
+            return {key: len(ids) for key, ids in self._strata.get(collection_name, {}).items() if ids}
+
+    def question_type(self, collection_name: str, question_id: str) -> Optional[str]:
+        with self._lock:
+            doc = self._docs.get(collection_name, {}).get(question_id)
+            return self._type_of(doc) if doc else None
+
+    def get_many(self, collection_name: str, question_ids: List[str]) -> List[Dict]:
+        """Verilen sırayla sorular (kopya olarak) - katalogda olmayanlar atlanır"""
+        self.ensure_loaded()
+        with self._lock:
+            docs = self._docs.get(collection_name, {})
+            return [dict(docs[question_id]) for question_id in question_ids if question_id in docs]
+
+    def get(self, collection_name: str, question_id) -> Optional[Dict]:
+        self.ensure_loaded()
+        with self._lock:
+            doc = self._docs.get(collection_name, {}).get(str(question_id))
+            return dict(doc) if doc else None
+
+    def _sorted_stratum(self, collection_name: str, difficulty: Optional[str],
+                        question_type: Optional[str]) -> List[str]:
+        """Katmanın id'ye göre sıralı dizisi - katalog değiştikten sonraki ilk örneklemede bir kez kurulur"""
+        key = (collection_name, question_type, difficulty)
+        ids = self._sampling_ids.get(key)
+        if ids is None:
+            ids = sorted(self._stratum_ids(collection_name, difficulty, question_type))
+            self._sampling_ids[key] = ids
+        return ids
+
+    def sample(self, collection_name: str, k: int, difficulty: Optional[str] = None,
+               question_type: Optional[str] = None,
+               rng: Optional[random.Random] = None) -> List[Dict]:
+        """
+        Rastgele en fazla k soru (kopya olarak) - tekrar yok, katman büyüklüğünden bağımsız O(k).
+        Sıra yükleme sırasından bağımsız olduğu için aynı seed + aynı soru bankası -> aynı sorular.
+        """
+        self.ensure_loaded()
+        rng = rng or random
+        with self._lock:
+            ids = self._sorted_stratum(collection_name, difficulty, question_type)
+            positions = rng.sample(range(len(ids)), min(k, len(ids)))
+            docs = self._docs[collection_name]
+            return [dict(docs[ids[position]]) for position in positions]
+
+    def choice(self, collection_name: str, difficulty: Optional[str] = None,
+               question_type: Optional[str] = None,
+               rng: Optional[random.Random] = None) -> Optional[Dict]:
+        self.ensure_loaded()
+        rng = rng or random
+        with self._lock:
+            ids = self._sorted_stratum(collection_name, difficulty, question_type)
+            if not ids:
+                return None
+            return dict(self._docs[collection_name][ids[rng.randrange(len(ids))]])
@@ -0,0 +1,64 @@
+# question_dto.py - Canonical student-facing question shape and matching Mongo projections
+#
+# Öğrenciye giden sorular tek biçimde: küçük harfli alanlar, _id string, cevap anahtarı YOK.
+#   {"_id": "665f...", "problem": "...", "choices": [...], "difficulty": "중", "type": "..."}
+# Eski dokümanlardaki büyük harfli alanlar (Problem/Choices/...) okunurken kanonik ada çevrilir;
+# yanıtta iki kopya gönderilmez. İstemci ?fields=_id,problem,choices ile alanları seçebilir.
+
+from typing import Dict, Iterable, Optional, Tuple
+
+# Öğrenciye gönderilebilecek alanlar - answer_key ve yönetim alanları bilerek yok
+QUESTION_FIELDS = ("_id", "problem_id", "problem", "choices", "difficulty", "type", "session", "subject")
+DEFAULT_QUESTION_FIELDS = ("_id", "problem", "choices", "difficulty", "type")
+
+# Yönetim ekranı (get-questions) ayrıca bunları seçebilir
+ADMIN_QUESTION_FIELDS = QUESTION_FIELDS + ("answer_key", "created_at")
+
+# Kanonik ad -> eski dokümanlardaki adı
+LEGACY_FIELD_NAMES = {
+    "problem_id": "Problem_ID",
+    "problem": "Problem",
+    "choices": "Choices",
+    "session": "Session",
+    "subject": "Subject",
+    "answer_key": "Answer Key"
+}
+
+
+def parse_fields(fields: Optional[str], allowed: Tuple[str, ...] = QUESTION_FIELDS,
+                 default: Tuple[str, ...] = DEFAULT_QUESTION_FIELDS) -> Tuple[str, ...]:
+    """?fields=_id,problem -> ("_id", "problem"); boşsa default, bilinmeyen alan varsa ValueError"""
+    if not fields:
+        return default
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return requested or default
+
+
+def question_projection(fields: Iterable[str] = QUESTION_FIELDS) -> Dict[str, int]:
+    """DTO'yu üretmek için gereken alanlar - eski adlarıyla birlikte"""
+    projection = {"_id": 0}
+    for field in fields:
+        projection[field] = 1
+        if field in LEGACY_FIELD_NAMES:
+            projection[LEGACY_FIELD_NAMES[field]] = 1
+    return projection
+
+
+def to_question_dto(doc: Dict, fields: Iterable[str] = DEFAULT_QUESTION_FIELDS) -> Dict:
+    """Dokümandan yalnızca istenen alanlar, kanonik adlarla - dokümanda olmayan alan yanıta girmez"""
+    dto = {}
+    for field in fields:
+        value = doc.get(field)
+        if value is None and field in LEGACY_FIELD_NAMES:
+            value = doc.get(LEGACY_FIELD_NAMES[field])
+        if value is None:
+            continue
+        dto[field] = str(value) if field == "_id" else value
+    return dto
+
+
+# Katalog ve seviye testi formları bu kadarını tutar - öğrenciye gidebilecek her alan, fazlası değil
+CATALOG_PROJECTION = question_projection(QUESTION_FIELDS)
@@ -0,0 +1,58 @@
+# question_resolver.py - Question lookup by id (string or ObjectId)
+
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+
+# Soru koleksiyonları - arama sırası önemli (ilk bulunan kullanılır)
+QUESTION_COLLECTIONS = ["diagnosis_test", "exam_questions"]
+
+
+def normalize_question_ids(question_ids: Iterable) -> Dict[str, List]:
+    """
+    Her id için MongoDB'de denenecek _id değerleri
+    {"665f...": ["665f...", ObjectId("665f...")], "q-12": ["q-12"]}
+    """
+    candidates = {}
+    for question_id in question_ids:
+        key = str(question_id)
+        if key in candidates:
+            continue
+
+        values = [key]
+        if ObjectId.is_valid(key):
+            values.append(ObjectId(key))
+        candidates[key] = values
+
+    return candidates
+
+
+def fetch_questions_by_ids(db, question_ids: Iterable,
+                           collections: Optional[List[str]] = None,
+                           projection: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    Soruları toplu getir - koleksiyon başına tek bir $in sorgusu
+    Dönüş: {string id: soru dokümanı}, bulunamayan id'ler dahil edilmez
+    """
+    candidates = normalize_question_ids(question_ids)
+    found = {}
+
+    for collection_name in collections or QUESTION_COLLECTIONS:
+        missing = [key for key in candidates if key not in found]
+        if not missing:
+            break
+
+        id_values = [value for key in missing for value in candidates[key]]
+        cursor = db[collection_name].find({"_id": {"$in": id_values}}, projection)
+
+        for question in cursor:
+            key = str(question["_id"])
+            if key in candidates and key not in found:
+                found[key] = question
+
+    return found
+
+
+def fetch_question(db, question_id, collections: Optional[List[str]] = None,
+                   projection: Optional[Dict] = None) -> Optional[Dict]:
+    """Tek soru getir (string veya ObjectId)"""
+    return fetch_questions_by_ids(db, [question_id], collections, projection).get(str(question_id))
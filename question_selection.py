@@ -0,0 +1,132 @@
+# question_selection.py - Expected-information-gain question selection for adaptive tests
+#
+# Her (type, difficulty) adayı için, BKT parametreleri altında bir cevabın o type'ın
+# mastery belirsizliğini (ikili entropi) ne kadar azaltacağı hesaplanır:
+#
+#   IG(p) = H(p) - [P(doğru) * H(p | doğru) + P(yanlış) * H(p | yanlış)]
+#
+# Aynı type'tan birden çok soru seçilirse kazanç azalır (cevaplar mastery verildiğinde
+# koşullu bağımsız -> karşılıklı bilgi submodüler). Bu yüzden seçim, type başına olası
+# posterior dağılımını takip eden tembel (lazy) greedy + heapq ile yapılır.
+# Belirsizliği en yüksek (az denenmiş) type'lar önce ölçülür -> güvenilir mastery
+# tahminine (min_attempts_for_reliable) daha az soruyla ulaşılır.
+
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+
+MASTERY_FLOOR = 0.01
+MASTERY_CEILING = 0.99
+
+
+def binary_entropy(p: float) -> float:
+    if p <= 0.0 or p >= 1.0:
+        return 0.0
+    return -(p * math.log2(p) + (1 - p) * math.log2(1 - p))
+
+
+def answer_posteriors(p: float, params: Dict) -> Tuple[float, float, float]:
+    """(P(doğru), P(mastery | doğru), P(mastery | yanlış)) - öğrenme geçişi hariç"""
+    slip, guess = params["slip"], params["guess"]
+    p_correct = p * (1 - slip) + (1 - p) * guess
+    p_wrong = 1 - p_correct
+    posterior_correct = p * (1 - slip) / p_correct if p_correct > 0 else p
+    posterior_wrong = p * slip / p_wrong if p_wrong > 0 else p
+    return p_correct, posterior_correct, posterior_wrong
+
+
+def information_gain(p: float, params: Dict) -> float:
+    """Tek sorunun beklenen entropi azalması (bit)"""
+    p = min(MASTERY_CEILING, max(MASTERY_FLOOR, p))
+    p_correct, posterior_correct, posterior_wrong = answer_posteriors(p, params)
+    expected = p_correct * binary_entropy(posterior_correct) + (1 - p_correct) * binary_entropy(posterior_wrong)
+    return max(0.0, binary_entropy(p) - expected)
+
+
+class _TypeBelief:
+    """Bir type için seçilen sorulardan sonra olası posterior'lar: [(olasılık, mastery)]"""
+
+    __slots__ = ("atoms", "version")
+
+    def __init__(self, mastery: float):
+        self.atoms: List[Tuple[float, float]] = [(1.0, min(MASTERY_CEILING, max(MASTERY_FLOOR, mastery)))]
+        self.version = 0
+
+    def marginal_gain(self, params: Dict) -> float:
+        return sum(weight * information_gain(p, params) for weight, p in self.atoms)
+
+    def observe(self, params: Dict):
+        """Bu type'a bir soru daha eklendi - her posterior doğru/yanlış olarak ikiye ayrılır"""
+        merged: Dict[float, float] = {}
+        for weight, p in self.atoms:
+            p_correct, posterior_correct, posterior_wrong = answer_posteriors(p, params)
+            for branch_weight, posterior in ((weight * p_correct, posterior_correct),
+                                             (weight * (1 - p_correct), posterior_wrong)):
+                key = round(posterior, 9)
+                merged[key] = merged.get(key, 0.0) + branch_weight
+        self.atoms = [(weight, p) for p, weight in merged.items() if weight > 1e-12]
+        self.version += 1
+
+
+class QuestionSelector:
+    """BKT parametreleriyle beklenen bilgi kazancına göre top-N (type, difficulty) seçimi"""
+
+    def __init__(self, difficulty_params: Dict[str, Dict], max_per_type: Optional[int] = None,
+                 type_params: Optional[Dict[str, Dict[str, Dict]]] = None):
+        self.difficulty_params = difficulty_params
+        self.type_params = type_params or {}  # type'a özel öğrenilmiş parametreler (bkt_trainer.py)
+        self.max_per_type = max_per_type
+
+    def _params(self, question_type: str, difficulty: str) -> Dict:
+        type_difficulty_params = self.type_params.get(question_type)
+        if type_difficulty_params and difficulty in type_difficulty_params:
+            return type_difficulty_params[difficulty]
+        return self.difficulty_params[difficulty]
+
+    def plan(self, masteries: Dict[str, float], available: Dict[Tuple[str, str], int],
+             num_questions: int) -> List[Dict]:
+        """
+        masteries: {type: mastery}, available: {(type, difficulty): soru sayısı}
+        Dönüş: seçim sırasıyla [{type, difficulty, mastery, expected_gain}]
+        """
+        beliefs = {question_type: _TypeBelief(mastery) for question_type, mastery in masteries.items()}
+        remaining = {key: count for key, count in available.items() if count > 0 and key[0] in beliefs}
+        per_type: Dict[str, int] = {}
+
+        heap = []
+        for (question_type, difficulty) in remaining:
+            gain = beliefs[question_type].marginal_gain(self._params(question_type, difficulty))
+            heap.append((-gain, question_type, difficulty, 0))
+        heapq.heapify(heap)
+
+        plan = []
+        while heap and len(plan) < num_questions:
+            negative_gain, question_type, difficulty, version = heapq.heappop(heap)
+            belief = beliefs[question_type]
+            key = (question_type, difficulty)
+
+            if remaining.get(key, 0) <= 0:
+                continue
+            if self.max_per_type is not None and per_type.get(question_type, 0) >= self.max_per_type:
+                continue
+
+            params = self._params(question_type, difficulty)
+            if version != belief.version:
+                # Bu type'tan başka soru seçildi - kazancı yeniden hesapla (tembel greedy)
+                heapq.heappush(heap, (-belief.marginal_gain(params), question_type, difficulty, belief.version))
+                continue
+
+            plan.append({
+                "type": question_type,
+                "difficulty": difficulty,
+                "mastery": masteries[question_type],
+                "expected_gain": -negative_gain
+            })
+            belief.observe(params)
+            remaining[key] -= 1
+            per_type[question_type] = per_type.get(question_type, 0) + 1
+
+            if remaining[key] > 0:
+                heapq.heappush(heap, (-belief.marginal_gain(params), question_type, difficulty, belief.version))
+
+        return plan
@@ -0,0 +1,83 @@
+# services.py - Application-scoped shared objects (one Mongo client, one BKT engine)
+#
+# main.py lifespan içinde create_services() ile oluşturulur ve app.state.services'e konur.
+# Router'lar Depends(get_services) ile alır:
+#
+#   @router.get("/...")
+#   async def handler(services: AppServices = Depends(get_services)):
+#       user = await services.adb["users"].find_one(...)
+
+import os
+from typing import Optional
+
+from fastapi import Request
+
+from adaptive_pool import AdaptivePool
+from async_db import AsyncDatabase, configure_executor
+from database import MongoSettings, create_mongo_client
+from llm_providers import LLMSettings, create_provider
+from explanation_cache import ExplanationCache
+from index_manager import ensure_indexes
+from level_test_forms import LevelTestForms
+from question_catalog import QuestionCatalog
+from question_dto import CATALOG_PROJECTION
+from type_based_bkt_system import TypeBasedPhysioTherapyBKT
+
+
+class AppServices:
+    """Uygulama boyunca paylaşılan nesneler"""
+
+    def __init__(self, settings: Optional[MongoSettings] = None,
+                 llm_settings: Optional[LLMSettings] = None):
+        self.settings = settings or MongoSettings()
+        self.mongo_client = create_mongo_client(self.settings)
+        self.db = self.mongo_client[self.settings.db_name]
+        self.adb = AsyncDatabase(self.db)
+
+        self.bkt_system = TypeBasedPhysioTherapyBKT(self.mongo_client, db_name=self.settings.db_name)
+        # Sadece öğrenciye gidebilecek alanlar bellekte - cevap anahtarı katalogda yok
+        self.question_catalog = QuestionCatalog(self.db, projection=CATALOG_PROJECTION)
+        self.adaptive_pool = AdaptivePool(self.question_catalog)
+        self.bkt_system.question_pool = self.adaptive_pool
+        self.explanation_cache = ExplanationCache(self.db)
+        # Yayınlanmış seviye testi formları - diagnosis_test değişikliklerini katalog üzerinden izler
+        self.level_test_forms = LevelTestForms(self.db, self.question_catalog)
+        # LLM_PROVIDER ile seçilir, model istemcisi ilk açıklama isteğinde oluşturulur
+        self.llm_provider = create_provider(llm_settings)
+
+        # Soru bankası değişince BKT type listesi de yenilensin
+        type_registry = self.bkt_system.type_registry
+        self.question_catalog.add_listener(
+            lambda collection_name: type_registry.invalidate()
+            if collection_name in type_registry.collections else None
+        )
+
+    def startup(self):
+        """Başlangıç işleri - Mongo yoksa uygulama yine açılır, ilk istekte tekrar denenir"""
+        # I/O havuzu bağlantı havuzundan büyük olursa thread'ler bağlantı bekler
+        configure_executor(int(os.getenv("MONGO_IO_THREADS", self.settings.max_pool_size)))
+
+        if self.settings.ensure_indexes:
+            try:
+                # Modüllerin REQUIRED_INDEXES tanımları - unique index eski kopyalar yüzünden
+                # oluşamazsa uyarı basılır (question_explanations için: python explanation_cache.py --dedupe)
+                ensure_indexes(self.db)
+            except Exception as e:
+                print(f"⚠️ Index'ler oluşturulamadı: {str(e)}")
+        self.explanation_cache.start()
+
+        try:
+            self.question_catalog.ensure_loaded()
+        except Exception as e:
+            print(f"⚠️ Soru kataloğu başlangıçta yüklenemedi: {str(e)}")
+
+    def close(self):
+        self.question_catalog.stop()
+        self.explanation_cache.stop()
+        self.mongo_client.close()
+        print("🔌 MongoDB client closed")
+
+
+def get_services(request: Request) -> AppServices:
+    """FastAPI dependency - lifespan'da oluşturulan servisler"""
+    return request.app.state.services
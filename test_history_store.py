@@ -0,0 +1,343 @@
+# test_history_store.py - Test results stored outside the user document
+#
+# Her test kaydı test_results koleksiyonunda ayrı bir doküman:
+#   {user_id: "<str>", test_date: datetime, test_type, total_score, level, ..., detailed_results}
+# users dokümanında sadece test_count sayacı tutulur.
+# user_stats koleksiyonunda kullanıcı başına önceden hesaplanmış özet (rollup) vardır,
+# her test kaydında $inc/$max/$push ile atomik güncellenir. Özet yoksa (eski kullanıcı) $inc ile yarım
+# özet oluşturulmaz, test_results'tan baştan hesaplanır. Her güncelleme "revision"ı artırır; yeniden
+# hesaplama sadece okuduğu revision hâlâ geçerliyse yazar - araya giren bir $inc ezilmez.
+# $inc kayıt başına idempotenttir: özet son sayılan kayıtların _id'lerini (counted_ids) tutar. Kayıt
+# eklendikten sonra, $inc'ten önce çalışan bir yeniden hesaplama kaydı zaten saydıysa $inc atlanır.
+#
+# Eski (gömülü test_history) kullanıcıları taşımak için:
+#   python test_history_store.py --migrate
+# user_stats'ı test_results'tan yeniden hesaplamak için:
+#   python test_history_store.py --backfill-stats
+
+import argparse
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import MongoSettings, create_mongo_client
+from index_manager import create_indexes
+
+TEST_RESULTS_COLLECTION = "test_results"
+# Taşınmakta olan gömülü dizi - süreç yarıda kalırsa bir sonraki taşıma buradan devam eder
+MIGRATING_FIELD = "test_history_migrating"
+USER_STATS_COLLECTION = "user_stats"
+
+# İlerleme trendi için saklanan son skor sayısı
+RECENT_SCORES_LIMIT = 5
+# Özette tutulan son sayılmış kayıt id'leri - kayıt ile $inc arasındaki pencereyi kapsaması yeterli
+COUNTED_IDS_LIMIT = 20
+STATS_LEVELS = ["하", "중", "상"]
+
+# Liste görünümü - detailed_results (soru metni + seçenekler) hariç
+TEST_SUMMARY_PROJECTION = {"detailed_results": 0}
+
+# (user_id, test_date) - geçmiş listesi, sayım ve index'e göre detay bu index'le okunur
+REQUIRED_INDEXES = [
+    {"collection": TEST_RESULTS_COLLECTION, "keys": [("user_id", 1), ("test_date", -1)],
+     "name": "user_id_1_test_date_-1"}
+]
+
+HOT_QUERIES = [
+    {"name": "test_history_page", "collection": TEST_RESULTS_COLLECTION, "filter": {"user_id": "__audit__"},
+     "projection": TEST_SUMMARY_PROJECTION, "sort": [("test_date", DESCENDING), ("_id", DESCENDING)], "limit": 10},
+    {"name": "test_results_by_user_chronological", "collection": TEST_RESULTS_COLLECTION,
+     "filter": {"detailed_results": {"$exists": True}}, "sort": [("user_id", -1), ("test_date", 1)]}
+]
+
+
+def _user_key(user_id) -> str:
+    # ObjectId ya da string - test_results'ta her zaman string
+    return str(user_id)
+
+
+def ensure_indexes(db):
+    return create_indexes(db, REQUIRED_INDEXES)
+
+
+def record_test_result(db, user_id, test_record: Dict):
+    """Test kaydını ekle (kopya üzerinde - çağıranın dict'i değişmez)"""
+    document = dict(test_record)
+    document["user_id"] = _user_key(user_id)
+    result = db[TEST_RESULTS_COLLECTION].insert_one(document)
+    update_user_stats(db, user_id, document)
+    return result.inserted_id
+
+
+def count_test_results(db, user_id) -> int:
+    return db[TEST_RESULTS_COLLECTION].count_documents({"user_id": _user_key(user_id)})
+
+
+def get_test_history(db, user_id, skip: int = 0, limit: Optional[int] = None,
+                     include_details: bool = False) -> List[Dict]:
+    """Kullanıcının testleri, en yeni en üstte"""
+    projection = None if include_details else TEST_SUMMARY_PROJECTION
+    cursor = db[TEST_RESULTS_COLLECTION].find(
+        {"user_id": _user_key(user_id)}, projection
+    ).sort([("test_date", DESCENDING), ("_id", DESCENDING)]).skip(max(skip, 0))
+
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+def get_test_by_index(db, user_id, test_index: int) -> Optional[Dict]:
+    """Tarihe göre sıralı listede test_index'teki test (0 = en yeni)"""
+    if test_index < 0:
+        return None
+    tests = get_test_history(db, user_id, skip=test_index, limit=1, include_details=True)
+    return tests[0] if tests else None
+
+
+def _legacy_record_id(user_key: str, index: int) -> str:
+    # Deterministik _id - yarıda kalan taşıma tekrar çalışınca aynı kayıtlar tekrar eklenmez
+    return f"{user_key}-history-{index}"
+
+
+def migrate_user_history(db, user_id) -> int:
+    """
+    Gömülü test_history dizisini test_results'a taşı
+    Dizi yoksa hiçbir şey yapmaz - tekrar çalıştırmak güvenli.
+    Dizi önce tek atomik update ile sahiplenilir (test_history -> test_history_migrating): aynı anda
+    gelen istekler (login, submit, stats ...) diziyi ancak biri görür. Süreç $unset'ten önce durursa
+    test_history_migrating kalır ve sonraki çağrı kaldığı yerden devam eder; kayıtlar deterministik
+    _id ile upsert edildiği için iki kez eklenmez.
+    """
+    users = db["users"]
+    user = users.find_one_and_update(
+        {"_id": user_id, "test_history": {"$exists": True}},
+        {"$rename": {"test_history": MIGRATING_FIELD}},
+        projection={"test_history": 1}
+    )
+    if user:
+        history = user.get("test_history")
+    else:
+        user = users.find_one({"_id": user_id, MIGRATING_FIELD: {"$exists": True}}, {MIGRATING_FIELD: 1})
+        if not user:
+            return 0
+        print(f"🔁 Resuming interrupted test_history migration for user={user['_id']}")
+        history = user.get(MIGRATING_FIELD)
+
+    user_key = _user_key(user["_id"])
+    operations = []
+    for index, test in enumerate(history or []):
+        if not isinstance(test, dict):
+            continue
+        record = dict(test, user_id=user_key)
+        record.setdefault("_id", _legacy_record_id(user_key, index))
+        operations.append(UpdateOne({"_id": record["_id"]}, {"$setOnInsert": record}, upsert=True))
+
+    if operations:
+        # Hata olursa dizi test_history_migrating'de kalır - bir sonraki çağrı tekrar dener
+        db[TEST_RESULTS_COLLECTION].bulk_write(operations, ordered=False)
+        rebuild_user_stats(db, user_key)
+
+    users.update_one(
+        {"_id": user["_id"]},
+        {
+            "$unset": {MIGRATING_FIELD: ""},
+            "$set": {"test_count": count_test_results(db, user_key)}
+        }
+    )
+    return len(operations)
+
+
+# ---------- user_stats rollup ----------
+
+def _month_key(test_date) -> Optional[str]:
+    if test_date and hasattr(test_date, 'strftime'):
+        return test_date.strftime("%Y-%m")
+    if isinstance(test_date, str) and len(test_date) >= 7:
+        return test_date[:7]
+    return None
+
+
+def update_user_stats(db, user_id, test_record: Dict):
+    """
+    Tek test kaydını özete ekle - tek atomik update; özet yoksa test_results'tan hesaplanır
+    test_record test_results'a eklenmiş haliyle (_id ile) verilir; aynı kayıt iki kez sayılmaz.
+    """
+    record_id = test_record.get("_id")
+    score = test_record.get("total_score", 0) or 0
+    level = test_record.get("level") or "하"
+    test_date = test_record.get("test_date")
+
+    increments = {
+        "total_tests": 1,
+        "score_sum": score,
+        "total_correct_answers": test_record.get("correct_count", 0) or 0,
+        "total_questions_attempted": test_record.get("total_questions", 0) or 0,
+        f"level_distribution.{level}": 1,
+        "revision": 1
+    }
+    month = _month_key(test_date)
+    if month:
+        increments[f"monthly_test_count.{month}"] = 1
+
+    update = {
+        "$inc": increments,
+        "$max": {"highest_score": score},
+        "$push": {
+            "recent_scores": {"$each": [score], "$slice": -RECENT_SCORES_LIMIT},
+            "counted_ids": {"$each": [record_id], "$slice": -COUNTED_IDS_LIMIT}
+        },
+        "$set": {"latest_level": level, "updated_at": datetime.utcnow()}
+    }
+    if test_date and hasattr(test_date, 'isoformat'):
+        update["$max"]["last_test_date"] = test_date
+
+    # upsert yok: özeti olmayan kullanıcıda tek testlik özet oluşmasın
+    stats_collection = db[USER_STATS_COLLECTION]
+    user_key = _user_key(user_id)
+    result = stats_collection.update_one({"_id": user_key, "counted_ids": {"$ne": record_id}}, update)
+    if result.matched_count:
+        return
+    if stats_collection.find_one({"_id": user_key}, {"_id": 1}) is not None:
+        # Araya giren yeniden hesaplama bu kaydı zaten saydı
+        return
+    # Kayıt test_results'a zaten eklendi - yeniden hesaplama onu da sayar
+    rebuild_user_stats(db, user_id)
+
+
+def _compute_user_stats(db, user_key: str) -> Dict:
+    stats = {
+        "_id": user_key,
+        "total_tests": 0,
+        "score_sum": 0,
+        "highest_score": 0,
+        "total_correct_answers": 0,
+        "total_questions_attempted": 0,
+        "level_distribution": {level: 0 for level in STATS_LEVELS},
+        "monthly_test_count": {},
+        "recent_scores": [],
+        "latest_level": None,
+        "updated_at": datetime.utcnow()
+    }
+    # record_test_result'ın eklediği kayıtlar (ObjectId) - taşınmış eski kayıtlar $inc'ten geçmez
+    counted_ids = []
+
+    cursor = db[TEST_RESULTS_COLLECTION].find(
+        {"user_id": user_key}, TEST_SUMMARY_PROJECTION
+    ).sort([("test_date", 1), ("_id", 1)])
+
+    for test in cursor:
+        score = test.get("total_score", 0) or 0
+        level = test.get("level") or "하"
+        stats["total_tests"] += 1
+        stats["score_sum"] += score
+        stats["highest_score"] = max(stats["highest_score"], score)
+        stats["total_correct_answers"] += test.get("correct_count", 0) or 0
+        stats["total_questions_attempted"] += test.get("total_questions", 0) or 0
+        stats["level_distribution"][level] = stats["level_distribution"].get(level, 0) + 1
+        month = _month_key(test.get("test_date"))
+        if month:
+            stats["monthly_test_count"][month] = stats["monthly_test_count"].get(month, 0) + 1
+        stats["recent_scores"] = (stats["recent_scores"] + [score])[-RECENT_SCORES_LIMIT:]
+        stats["latest_level"] = level
+        if hasattr(test.get("test_date"), 'isoformat'):
+            stats["last_test_date"] = test["test_date"]
+        if isinstance(test["_id"], ObjectId):
+            counted_ids.append(test["_id"])
+
+    # En son eklenenler - $inc'i henüz çalışmamış bir kayıt varsa bunların arasındadır
+    stats["counted_ids"] = sorted(heapq.nlargest(COUNTED_IDS_LIMIT, counted_ids))
+    return stats
+
+
+def rebuild_user_stats(db, user_id, max_attempts: int = 5) -> Dict:
+    """
+    Özeti test_results'tan baştan hesapla (backfill / taşıma sonrası / özet yoksa)
+    Optimistic yazma: revision önce okunur, özet sadece revision değişmediyse değiştirilir.
+    Araya bir $inc girdiyse hesaplama tekrarlanır.
+    """
+    user_key = _user_key(user_id)
+    collection = db[USER_STATS_COLLECTION]
+
+    for _ in range(max_attempts):
+        current = collection.find_one({"_id": user_key}, {"revision": 1})
+        stats = _compute_user_stats(db, user_key)
+
+        if current is None:
+            stats["revision"] = 0
+            try:
+                collection.insert_one(stats)
+                return stats
+            except DuplicateKeyError:
+                # Başka bir istek özeti az önce oluşturdu - onun revision'ıyla tekrar dene
+                continue
+
+        revision = current.get("revision")
+        stats["revision"] = (revision or 0) + 1
+        # revision alanı olmayan eski özetlerde {"revision": None} eksik alanla eşleşir
+        result = collection.replace_one({"_id": user_key, "revision": revision}, stats)
+        if result.matched_count:
+            return stats
+
+    raise RuntimeError(f"user_stats rebuild for {user_key} kept racing with concurrent updates")
+
+
+def get_user_stats(db, user_id) -> Dict:
+    """Özet dokümanı - yoksa (eski kullanıcı) bir kereliğine hesaplanır"""
+    stats = db[USER_STATS_COLLECTION].find_one({"_id": _user_key(user_id)})
+    if stats is None:
+        stats = rebuild_user_stats(db, user_id)
+    return stats
+
+
+def backfill_user_stats(db) -> int:
+    """test_results'taki tüm kullanıcılar için özeti yeniden hesapla"""
+    processed = 0
+    for user_key in db[TEST_RESULTS_COLLECTION].distinct("user_id"):
+        rebuild_user_stats(db, user_key)
+        processed += 1
+        if processed % 100 == 0:
+            print(f"📊 {processed} kullanıcı özeti hesaplandı")
+
+    print(f"✅ user_stats backfill bitti: {processed} kullanıcı")
+    return processed
+
+
+def migrate_all(db) -> Dict:
+    moved_users = 0
+    moved_tests = 0
+    legacy_filter = {"$or": [{"test_history": {"$exists": True}}, {MIGRATING_FIELD: {"$exists": True}}]}
+    for user in db["users"].find(legacy_filter, {"_id": 1}):
+        moved_tests += migrate_user_history(db, user["_id"])
+        moved_users += 1
+        if moved_users % 100 == 0:
+            print(f"📦 {moved_users} kullanıcı taşındı ({moved_tests} test)")
+
+    print(f"✅ Taşıma bitti: {moved_users} kullanıcı, {moved_tests} test")
+    return {"users": moved_users, "tests": moved_tests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="test_results taşıma ve user_stats backfill")
+    parser.add_argument("--mongo-uri", help="varsayılan: MONGO_URI")
+    parser.add_argument("--migrate", action="store_true", help="gömülü test_history dizilerini taşı")
+    parser.add_argument("--backfill-stats", action="store_true", help="user_stats'ı test_results'tan yeniden hesapla")
+    args = parser.parse_args()
+
+    settings = MongoSettings(uri=args.mongo_uri)
+    db = create_mongo_client(settings)[settings.db_name]
+
+    for label, status in ensure_indexes(db).items():
+        print(f"🗂️ {label}: {status}")
+
+    if args.migrate:
+        migrate_all(db)
+    if args.backfill_stats:
+        backfill_user_stats(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 # type_based_bkt_router.py - Type-Based BKT API
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from typing import Dict, List
-import pymongo
-from type_based_bkt_system import TypeBasedPhysioTherapyBKT
+from async_db import run_blocking
+from services import AppServices, get_services
+from json_response import BSONJSONRoute
 from pydantic import BaseModel
 
-# MongoDB connection
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-bkt_system = TypeBasedPhysioTherapyBKT(mongo_client)
-
-bkt_router = APIRouter(prefix="/api/bkt", tags=["bkt"])
+bkt_router = APIRouter(prefix="/api/bkt", tags=["bkt"], route_class=BSONJSONRoute)
 
 class BKTUpdateRequest(BaseModel):
     user_id: str
@@ -19,10 +16,10 @@ class BKTUpdateRequest(BaseModel):
     is_correct: bool
 
 @bkt_router.post("/update-knowledge")
-async def update_bkt_knowledge(request: BKTUpdateRequest):
+async def update_bkt_knowledge(request: BKTUpdateRequest, services: AppServices = Depends(get_services)):
     """학생 답변 후 BKT 지식 상태 업데이트 (TYPE 기반)"""
     try:
-        result = bkt_system.update_bkt_with_answer(
+        result = await services.bkt_system.aupdate_bkt_with_answer(
             user_id=request.user_id,
             question_data=request.question_data,
             student_answer=request.student_answer,
@@ -38,10 +35,10 @@ async def update_bkt_knowledge(request: BKTUpdateRequest):
         raise HTTPException(status_code=500, detail=f"BKT update error: {str(e)}")
 
 @bkt_router.get("/mastery-report/{user_id}")
-async def get_mastery_report(user_id: str):
+async def get_mastery_report(user_id: str, services: AppServices = Depends(get_services)):
     """사용자의 상세 습득도 리포트 (TYPE 기반)"""
     try:
-        report = bkt_system.get_mastery_report(user_id)
+        report = await services.bkt_system.aget_mastery_report(user_id)
         return {
             "status": "success",
             "report": report
@@ -51,10 +48,10 @@ async def get_mastery_report(user_id: str):
         raise HTTPException(status_code=500, detail=f"Report generation error: {str(e)}")
 
 @bkt_router.get("/type-summary/{user_id}")
-async def get_type_summary(user_id: str):
+async def get_type_summary(user_id: str, services: AppServices = Depends(get_services)):
     """사용자의 type별 간단 요약"""
     try:
-        summary = bkt_system.get_type_summary(user_id)
+        summary = await services.bkt_system.aget_type_summary(user_id)
         return {
             "status": "success",
             "summary": summary
@@ -64,10 +61,10 @@ async def get_type_summary(user_id: str):
         raise HTTPException(status_code=500, detail=f"Summary error: {str(e)}")
 
 @bkt_router.get("/weak-types/{user_id}")
-async def get_weak_types(user_id: str, threshold: float = 0.6):
+async def get_weak_types(user_id: str, threshold: float = 0.6, services: AppServices = Depends(get_services)):
     """사용자의 약한 문제 유형들"""
     try:
-        weak_types = bkt_system.get_weak_types(user_id, threshold)
+        weak_types = await services.bkt_system.aget_weak_types(user_id, threshold)
         return {
             "status": "success",
             "weak_types": weak_types,
@@ -78,10 +75,10 @@ async def get_weak_types(user_id: str, threshold: float = 0.6):
         raise HTTPException(status_code=500, detail=f"Weak types error: {str(e)}")
 
 @bkt_router.get("/adaptive-questions/{user_id}")
-async def get_adaptive_questions(user_id: str, num_questions: int = 10):
+async def get_adaptive_questions(user_id: str, num_questions: int = 10, services: AppServices = Depends(get_services)):
     """type별 약점 기반 적응형 문제 추천"""
     try:
-        questions = bkt_system.get_adaptive_questions_by_type(user_id, num_questions)
+        questions = await services.bkt_system.aget_adaptive_questions_by_type(user_id, num_questions)
         
         return {
             "status": "success",
@@ -93,10 +90,10 @@ async def get_adaptive_questions(user_id: str, num_questions: int = 10):
         raise HTTPException(status_code=500, detail=f"Adaptive questions error: {str(e)}")
 
 @bkt_router.get("/available-types")
-async def get_available_types():
+async def get_available_types(services: AppServices = Depends(get_services)):
     """시스템에서 추적 가능한 모든 문제 유형 목록"""
     try:
-        types = bkt_system._get_unique_types()
+        types = await run_blocking(services.bkt_system.type_registry.get_types)
         return {
             "status": "success",
             "types": types,
@@ -107,10 +104,10 @@ async def get_available_types():
         raise HTTPException(status_code=500, detail=f"Types error: {str(e)}")
 
 @bkt_router.get("/type-performance/{user_id}/{question_type}")
-async def get_type_performance(user_id: str, question_type: str):
+async def get_type_performance(user_id: str, question_type: str, services: AppServices = Depends(get_services)):
     """특정 type에 대한 상세 성과"""
     try:
-        bkt_state = bkt_system.get_user_bkt_state(user_id)
+        bkt_state = await services.bkt_system.aget_user_bkt_state(user_id)
         
         if question_type not in bkt_state["type_mastery"]:
             return {
@@ -141,11 +138,13 @@ async def get_type_performance(user_id: str, question_type: str):
         raise HTTPException(status_code=500, detail=f"Type performance error: {str(e)}")
 
 @bkt_router.post("/reset-user-bkt/{user_id}")
-async def reset_user_bkt(user_id: str):
+async def reset_user_bkt(user_id: str, services: AppServices = Depends(get_services)):
     """사용자의 BKT 데이터 초기화 (개발/테스트용)"""
     try:
         # BKT 컬렉션에서 사용자 데이터 삭제
-        result = bkt_system.bkt_collection.delete_one({"user_id": user_id})
+        result = await services.adb[services.bkt_system.bkt_collection.name].delete_one({"user_id": user_id})
+        # 답변 이벤트 로그도 삭제 - 남아 있으면 bkt_rebuild.py 가 초기화된 상태를 되살린다
+        events_result = await services.adb[services.bkt_system.events_collection.name].delete_many({"user_id": user_id})
         
         if result.deleted_count > 0:
             message = f"사용자 {user_id}의 BKT 데이터가 초기화되었습니다."
@@ -155,30 +154,31 @@ async def reset_user_bkt(user_id: str):
         return {
             "status": "success",
             "message": message,
-            "deleted_count": result.deleted_count
+            "deleted_count": result.deleted_count,
+            "deleted_events": events_result.deleted_count
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Reset error: {str(e)}")
 
 @bkt_router.get("/debug/all-types")
-async def debug_get_all_types():
+async def debug_get_all_types(services: AppServices = Depends(get_services)):
     """디버그: 데이터베이스의 모든 types 확인"""
     try:
         collections = ["diagnosis_test", "exam_questions"]
         all_types = {}
         
         for collection_name in collections:
-            collection = bkt_system.db[collection_name]
+            collection = services.adb[collection_name]
             
             # type 필드의 모든 unique values
-            types = collection.distinct("type")
+            types = await collection.distinct("type")
             
             # 각 type의 문제 수도 확인
             type_counts = {}
             for qtype in types:
                 if qtype:  # None이 아닌 경우만
-                    count = collection.count_documents({"type": qtype})
+                    count = await collection.count_documents({"type": qtype})
                     type_counts[str(qtype)] = count
             
             all_types[collection_name] = {
@@ -1,8 +1,187 @@
 import pymongo
+from pymongo import ReturnDocument
 import numpy as np
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import json
+import threading
+import time
+from async_db import run_blocking
+from database import DEFAULT_DB_NAME
+from question_catalog import CATALOG_COLLECTIONS
+from question_selection import QuestionSelector
+
+# bkt_trainer.py 가 발행하는 학습된 파라미터 세트 (version 이 가장 큰 문서가 사용됨)
+BKT_PARAMETERS_COLLECTION = "bkt_parameters"
+BKT_PARAMETER_FIELDS = ("slip", "guess", "learn", "prior")
+BKT_DIFFICULTIES = ("하", "중", "상")
+
+BKT_PARAMETERS_INDEX = {
+    "collection": BKT_PARAMETERS_COLLECTION, "keys": [("version", pymongo.DESCENDING)],
+    "name": "bkt_parameters_version", "unique": True
+}
+
+REQUIRED_INDEXES = [
+    # 사용자당 BKT 문서 하나 - version 조건 업데이트도 이 index 로 찾는다
+    {"collection": "bkt_tracking", "keys": [("user_id", 1)], "name": "bkt_user_id", "unique": True},
+    BKT_PARAMETERS_INDEX
+] + [
+    # type/난이도 검색 (카탈로그 없는 경로), distinct("type"), type별 count
+    {"collection": collection_name, "keys": [("type", 1), ("difficulty", 1)], "name": "type_difficulty"}
+    for collection_name in CATALOG_COLLECTIONS
+]
+
+HOT_QUERIES = [
+    {"name": "bkt_state_by_user", "collection": "bkt_tracking", "filter": {"user_id": "__audit__"}},
+    {"name": "bkt_parameters_latest", "collection": BKT_PARAMETERS_COLLECTION, "filter": {},
+     "projection": {"version": 1}, "sort": [("version", pymongo.DESCENDING)], "limit": 1}
+] + [
+    {"name": f"{collection_name}_by_type_difficulty", "collection": collection_name,
+     "filter": {"type": "__audit__", "difficulty": "중"}, "limit": 3}
+    for collection_name in CATALOG_COLLECTIONS
+]
+
+
+def validate_parameter_set(param_set: Dict):
+    """
+    파라미터 세트 형식 검사 - 잘못된 세트는 엔진에 적용하지 않는다
+    {version, difficulty_params: {난이도: {slip, guess, learn, prior}},
+     initial_type_mastery?, type_params?: {type: {난이도: {...}}}, type_initial_mastery?: {type: p}}
+    """
+    def check_params(params: Dict, where: str):
+        for field in BKT_PARAMETER_FIELDS:
+            value = params.get(field)
+            if not isinstance(value, (int, float)) or not 0.0 <= value <= 1.0:
+                raise ValueError(f"{where}.{field} must be a probability, got {value!r}")
+        # slip + guess >= 1 이면 '안다' 상태가 정답 확률을 높이지 못한다
+        if params["slip"] + params["guess"] >= 1.0:
+            raise ValueError(f"{where}: slip + guess must be < 1")
+    
+    if not isinstance(param_set.get("version"), int):
+        raise ValueError("parameter set needs an integer version")
+    
+    difficulty_params = param_set.get("difficulty_params") or {}
+    for difficulty in BKT_DIFFICULTIES:
+        if difficulty not in difficulty_params:
+            raise ValueError(f"difficulty_params is missing '{difficulty}'")
+        check_params(difficulty_params[difficulty], f"difficulty_params.{difficulty}")
+    
+    for question_type, type_difficulty_params in (param_set.get("type_params") or {}).items():
+        for difficulty, params in type_difficulty_params.items():
+            if difficulty not in BKT_DIFFICULTIES:
+                raise ValueError(f"type_params.{question_type}: unknown difficulty '{difficulty}'")
+            check_params(params, f"type_params.{question_type}.{difficulty}")
+    
+    initial_values = list((param_set.get("type_initial_mastery") or {}).values())
+    if "initial_type_mastery" in param_set:
+        initial_values.append(param_set["initial_type_mastery"])
+    for value in initial_values:
+        if not isinstance(value, (int, float)) or not 0.0 < value < 1.0:
+            raise ValueError(f"initial mastery must be in (0, 1), got {value!r}")
+
+
+class QuestionTypeRegistry:
+    """
+    문제 type 목록 캐시
+    - TTL 이 지나거나 invalidate() 로 version 이 바뀌면 다시 읽는다
+    - distinct 는 캐시가 만료됐을 때만 실행
+    """
+    
+    def __init__(self, db, collections: Optional[List[str]] = None, ttl_seconds: float = 300):
+        self.db = db
+        self.collections = collections or ["diagnosis_test", "exam_questions"]
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        
+        self._lock = threading.Lock()
+        self._types: List[str] = []
+        self._type_set = set()
+        self._loaded_version = None
+        self._loaded_at = 0.0
+    
+    def invalidate(self, *_):
+        """soru bankası değişti - sonraki okumada yeniden yükle"""
+        self.version += 1
+    
+    def _is_stale(self) -> bool:
+        return (
+            self._loaded_version != self.version
+            or time.monotonic() - self._loaded_at > self.ttl_seconds
+        )
+    
+    def _refresh_if_stale(self):
+        if not self._is_stale():
+            return
+        with self._lock:
+            if not self._is_stale():
+                return
+            version = self.version
+            unique_types = set()
+            
+            for collection_name in self.collections:
+                try:
+                    # 'type' 필드에서 unique values 가져오기
+                    types = self.db[collection_name].distinct("type")
+                    
+                    # ⭐ SADECE NULL olmayan ve boş olmayan types ekle - hiçbir manual filtreleme yok
+                    for t in types:
+                        if t and str(t).strip():
+                            unique_types.add(str(t).strip())
+                
+                except Exception as e:
+                    print(f"⚠️ Collection {collection_name}에서 types 가져오기 실패: {str(e)}")
+            
+            self._types = sorted(unique_types)
+            self._type_set = unique_types
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+            print(f"✅ Type registry loaded: {len(self._types)} unique types")
+    
+    def get_types(self) -> List[str]:
+        self._refresh_if_stale()
+        return list(self._types)
+    
+    def __contains__(self, question_type) -> bool:
+        self._refresh_if_stale()
+        return question_type in self._type_set
+
+
+class BKTParameterRegistry:
+    """
+    bkt_parameters 컬렉션의 최신 파라미터 세트 캐시 (hot-load)
+    - TTL 마다 최신 version 만 확인하고, 바뀌었을 때만 전체 문서를 읽는다
+    - 발행된 세트가 없거나 읽기/검사에 실패하면 마지막으로 읽은 세트 (없으면 None)
+    """
+    
+    def __init__(self, db, ttl_seconds: float = 60):
+        self.collection = db[BKT_PARAMETERS_COLLECTION]
+        self.ttl_seconds = ttl_seconds
+        
+        self._lock = threading.Lock()
+        self._param_set: Optional[Dict] = None
+        self._checked_at: Optional[float] = None
+    
+    def _is_stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at > self.ttl_seconds
+    
+    def latest(self, force: bool = False) -> Optional[Dict]:
+        if not force and not self._is_stale():
+            return self._param_set
+        with self._lock:
+            if not force and not self._is_stale():
+                return self._param_set
+            try:
+                head = self.collection.find_one({}, {"version": 1}, sort=[("version", pymongo.DESCENDING)])
+                if head is not None and (self._param_set is None or head["version"] != self._param_set["version"]):
+                    param_set = self.collection.find_one({"_id": head["_id"]})
+                    validate_parameter_set(param_set)
+                    self._param_set = param_set
+                    print(f"✅ BKT parameters loaded: version {param_set['version']}")
+            except Exception as e:
+                print(f"⚠️ BKT parameter load failed: {str(e)}")
+            self._checked_at = time.monotonic()
+        return self._param_set
+
 
 class TypeBasedPhysioTherapyBKT:
     """
@@ -10,10 +189,21 @@ class TypeBasedPhysioTherapyBKT:
     Veritabanındaki 'type' alanını (uzman bilgisi) kullanır
     """
     
-    def __init__(self, mongo_client):
-        self.db = mongo_client["physical_therapy_questions"]
+    def __init__(self, mongo_client, type_registry: Optional["QuestionTypeRegistry"] = None,
+                 db_name: str = DEFAULT_DB_NAME):
+        self.db = mongo_client[db_name]
         self.users_collection = self.db["users"]
         self.bkt_collection = self.db["bkt_tracking"]
+        self.events_collection = self.db["answer_events"]  # 답변 이벤트 로그 (재생/재구축용)
+        
+        # 문제 type 목록 (캐시) - 라우터들과 공유
+        self.type_registry = type_registry or QuestionTypeRegistry(self.db)
+        
+        # 메모리 내 적응형 문제 풀 (adaptive_pool.AdaptivePool) - 없으면 DB에서 검색
+        self.question_pool = None
+        
+        # 카탈로그 type의 첫 시도 전 습득 확률
+        self.initial_type_mastery = 0.4
         
         # ⭐ İYİLEŞTİRİLMİŞ - Daha konservatif ve güvenilir parametreler
         self.difficulty_params = {
@@ -37,6 +227,15 @@ class TypeBasedPhysioTherapyBKT:
             }
         }
         
+        # 학습된 파라미터 (bkt_trainer.py) - 발행되면 위 상수 대신 사용, type별 값이 있으면 우선
+        self.parameter_registry = BKTParameterRegistry(self.db)
+        self.params_version: Optional[int] = None  # None = 위의 기본 상수
+        self.type_params: Dict[str, Dict[str, Dict]] = {}
+        self.type_initial_mastery: Dict[str, float] = {}
+        
+        # 적응형 문제 선택 - 기대 정보 이득 (question_selection.py)
+        self.question_selector = QuestionSelector(self.difficulty_params)
+        
         # ⭐ YENİ: Güvenilirlik ayarları
         self.reliability_settings = {
             "min_attempts_for_reliable": 5,
@@ -49,6 +248,42 @@ class TypeBasedPhysioTherapyBKT:
                 "high": (10, float('inf'))  # 10+ soru: Yüksek güven
             }
         }
+        
+        # version 충돌 시 배치 재시도 횟수
+        self.max_update_retries = 5
+
+    def sync_parameters(self, force: bool = False) -> Optional[int]:
+        """발행된 최신 파라미터 세트로 교체 (TTL 캐시) - 적용된 version 반환"""
+        param_set = self.parameter_registry.latest(force)
+        if param_set is not None and param_set["version"] != self.params_version:
+            self.apply_parameter_set(param_set)
+        return self.params_version
+
+    def apply_parameter_set(self, param_set: Dict):
+        """파라미터 세트 적용 - 이미 저장된 mastery 값은 바뀌지 않는다 (필요하면 bkt_rebuild.py)"""
+        validate_parameter_set(param_set)
+        self.difficulty_params = {
+            difficulty: {field: float(param_set["difficulty_params"][difficulty][field]) for field in BKT_PARAMETER_FIELDS}
+            for difficulty in BKT_DIFFICULTIES
+        }
+        self.type_params = param_set.get("type_params") or {}
+        self.type_initial_mastery = param_set.get("type_initial_mastery") or {}
+        self.initial_type_mastery = param_set.get("initial_type_mastery", self.initial_type_mastery)
+        self.question_selector.difficulty_params = self.difficulty_params
+        self.question_selector.type_params = self.type_params
+        self.params_version = param_set["version"]
+        print(f"🔄 BKT parameters applied: version {self.params_version} ({len(self.type_params)} type overrides)")
+
+    def params_for(self, question_type: str, difficulty: str) -> Dict:
+        """type별 학습 파라미터가 있으면 그것, 없으면 난이도 파라미터"""
+        type_difficulty_params = self.type_params.get(question_type)
+        if type_difficulty_params and difficulty in type_difficulty_params:
+            return type_difficulty_params[difficulty]
+        return self.difficulty_params[difficulty]
+
+    def initial_mastery_for(self, question_type: str) -> float:
+        return self.type_initial_mastery.get(question_type, self.initial_type_mastery)
+
     def get_confidence_level(self, attempts: int) -> str:
         """Attempt sayısına göre güven seviyesi"""
         for level, (min_att, max_att) in self.reliability_settings["confidence_levels"].items():
@@ -115,77 +350,56 @@ class TypeBasedPhysioTherapyBKT:
 
 
     def get_user_bkt_state(self, user_id: str) -> Dict:
-        """사용자의 현재 BKT 상태 가져오기"""
+        """
+        사용자의 현재 BKT 상태 가져오기 - 읽기 전용
+        기록이 없으면 저장하지 않고 메모리 상의 초기(prior) 상태를 반환한다.
+        문서 생성은 답변 업데이트 경로(_load_bkt_state_for_update)에서만 일어난다.
+        """
         bkt_record = self.bkt_collection.find_one({"user_id": user_id})
         
         if not bkt_record:
-            initial_state = self._create_initial_bkt_state(user_id)
-            self.bkt_collection.insert_one(initial_state)
-            return initial_state
+            return self._create_initial_bkt_state(user_id)
         
         return bkt_record
 
     def _create_initial_bkt_state(self, user_id: str) -> Dict:
-        """새 사용자의 초기 BKT 상태 생성"""
-        # 데이터베이스에서 unique types 가져오기
-        unique_types = self._get_unique_types()
-        
+        """새 사용자의 초기 BKT 상태 생성 - type 항목은 첫 시도 때 생성 (sparse)"""
         initial_state = {
             "user_id": user_id,
             "created_at": datetime.now(),
             "updated_at": datetime.now(),
-            "type_mastery": {},  # type별 습득 확률
+            "type_mastery": {},  # type별 습득 확률 - 시도한 type만
             "total_attempts": 0,
             "total_correct": 0,
-            "overall_mastery": 0.4  # 전체 습득도
+            "overall_mastery": 0.4,  # 전체 습득도
+            "version": 0  # 동시 업데이트 감지용
         }
         
-        # 모든 type에 대해 초기값 설정
-        for question_type in unique_types:
-            initial_state["type_mastery"][question_type] = {
-                "mastery_probability": 0.4,  # 초기 습득 확률
-                "total_attempts": 0,
-                "correct_answers": 0,
-                "last_updated": datetime.now(),
-                "difficulty_performance": {  # 난이도별 성과
-                    "하": {"attempts": 0, "correct": 0, "mastery": 0.5},
-                    "중": {"attempts": 0, "correct": 0, "mastery": 0.4},
-                    "상": {"attempts": 0, "correct": 0, "mastery": 0.3}
-                }
-            }
-        
         return initial_state
 
-    def _get_unique_types(self) -> List[str]:
-        """데이터베이스에서 unique types 가져오기 - SADECE DB'deki types"""
-        collections = ["diagnosis_test", "exam_questions"]
-        unique_types = set()
-        
-        for collection_name in collections:
-            try:
-                collection = self.db[collection_name]
-                
-                # 'type' 필드에서 unique values 가져오기
-                types = collection.distinct("type")
-                
-                # ⭐ SADECE NULL olmayan ve boş olmayan types ekle - hiçbir manual filtreleme yok
-                for t in types:
-                    if t and str(t).strip():
-                        type_str = str(t).strip()
-                        unique_types.add(type_str)
-                
-                print(f"📋 Collection {collection_name}: Found {len(types)} total types")
-                filtered_count = len([t for t in types if t and str(t).strip()])
-                print(f"    Valid types: {filtered_count}")
-                
-            except Exception as e:
-                print(f"⚠️ Collection {collection_name}에서 types 가져오기 실패: {str(e)}")
-        
-        unique_types_list = list(unique_types)
-        print(f"✅ Total unique types found: {len(unique_types_list)}")
-        print(f"📝 Types: {sorted(unique_types_list)}")
+    def _new_type_entry(self, question_type: str, difficulty: str) -> Dict:
+        """type 항목 생성 - 카탈로그에 있는 type은 기본 초기값, 그 외에는 난이도 prior"""
+        if question_type in self.type_registry:
+            mastery = self.initial_mastery_for(question_type)
+        else:
+            mastery = self.params_for(question_type, difficulty)["prior"]
         
-        return unique_types_list
+        return {
+            "mastery_probability": mastery,
+            "total_attempts": 0,
+            "correct_answers": 0,
+            "last_updated": datetime.utcnow(),
+            "difficulty_performance": {  # 난이도별 성과
+                "하": {"attempts": 0, "correct": 0, "mastery": 0.5},
+                "중": {"attempts": 0, "correct": 0, "mastery": 0.4},
+                "상": {"attempts": 0, "correct": 0, "mastery": 0.3}
+            }
+        }
+
+    def _get_unique_types(self) -> List[str]:
+        """데이터베이스에서 unique types 가져오기 - SADECE DB'deki types (캐시됨)"""
+        return self.type_registry.get_types()
+
     def _is_korean_type(self, type_str: str) -> bool:
         """⭐ REMOVED - 모든 types kabul edilir artık"""
         # Artık tüm types kabul ediliyor, filtreleme yok
@@ -196,44 +410,195 @@ class TypeBasedPhysioTherapyBKT:
         """
         학생의 답변을 바탕으로 BKT 상태 업데이트 (Korean TYPE 기반)
         """
-        # 현재 BKT 상태 가져오기
-        bkt_state = self.get_user_bkt_state(user_id)
+        return self.update_bkt_with_answers(
+            user_id, [(question_data, student_answer, is_correct)]
+        )[0]
+
+    def update_bkt_with_answers(self, user_id: str,
+                                answers: List[Tuple[Dict, int, bool]]) -> List[Dict]:
+        """
+        여러 답변을 한 번에 BKT 상태에 반영 (1 read + 1 write)
+        answers: [(question_data, student_answer, is_correct), ...] - 답변 순서대로
         
-        # 문제 정보 추출 - TYPE이 가장 중요!
-        difficulty = question_data.get("difficulty", "중")
-        question_type = question_data.get("type", "general")
+        변경된 필드만 $inc/$set 으로 기록하고, version 필드로 동시 제출 충돌을 감지한다.
+        충돌 시 최신 상태를 다시 읽어 배치를 재적용한다.
+        """
+        if not answers:
+            return []
         
+        self.sync_parameters()
+        
+        for attempt in range(1, self.max_update_retries + 1):
+            # 현재 BKT 상태 가져오기 - 배치 전체에서 한 번만
+            bkt_state = self._load_bkt_state_for_update(user_id)
+            version = bkt_state.get("version", 0)
+            existing_types = set(bkt_state["type_mastery"].keys())
+            
+            # 전체 mastery 가중합 - 매 답변마다 모든 type을 다시 돌지 않도록 누적값 유지
+            mastery_sum, weight_sum = self._overall_mastery_totals(bkt_state)
+            
+            results = []
+            for question_data, student_answer, is_correct in answers:
+                result, mastery_sum, weight_sum = self._apply_answer(
+                    bkt_state, question_data, is_correct, mastery_sum, weight_sum
+                )
+                print(f"🔍 BKT Update: user={user_id}, type={result['type']}, difficulty={result['difficulty']}, correct={is_correct}")
+                results.append(result)
+            
+            bkt_state["updated_at"] = datetime.utcnow()
+            
+            # 데이터베이스에 저장 - 배치당 한 번, 변경된 경로만
+            outcomes = [is_correct for _, _, is_correct in answers]
+            update = self._build_field_update(bkt_state, results, outcomes, existing_types)
+            write_result = self.bkt_collection.update_one(
+                self._version_filter(user_id, version),
+                update
+            )
+            
+            if write_result.matched_count:
+                self._log_answer_events(user_id, answers, results, bkt_state["updated_at"], version + 1)
+                print(f"✅ BKT Updated: {len(results)} answers for user={user_id}, overall={bkt_state['overall_mastery']:.3f}, version={version + 1}")
+                return results
+            
+            print(f"⚠️ BKT version conflict for user={user_id} (version={version}), retry {attempt}/{self.max_update_retries}")
+        
+        raise RuntimeError(f"BKT update conflict: user={user_id} could not be updated after {self.max_update_retries} attempts")
+
+    def _log_answer_events(self, user_id: str, answers: List[Tuple[Dict, int, bool]],
+                           results: List[Dict], timestamp: datetime, bkt_version: int):
+        """
+        반영된 답변들을 answer_events 에 기록 - bkt_rebuild.py 가 이 로그로 상태를 재구축한다
+        상태 저장이 성공한 뒤에만 기록 (version 충돌 재시도 시 중복 방지)
+        """
+        events = []
+        for seq, ((question_data, student_answer, is_correct), result) in enumerate(zip(answers, results)):
+            question_id = question_data.get("_id")
+            events.append({
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "seq": seq,  # 같은 배치 안에서의 순서
+                "question_id": str(question_id) if question_id is not None else None,
+                "type": result["type"],
+                "difficulty": result["difficulty"],
+                "student_answer": student_answer,
+                "is_correct": bool(is_correct),
+                "bkt_version": bkt_version  # 사용자별 배치 순서 (재생 정렬 키)
+            })
+        
+        try:
+            self.events_collection.insert_many(events, ordered=True)
+        except Exception as e:
+            # 상태는 이미 저장됨 - 로그 실패로 제출을 실패시키지 않는다
+            print(f"⚠️ Answer event log failed for user={user_id}: {str(e)}")
+
+    def _load_bkt_state_for_update(self, user_id: str) -> Dict:
+        """업데이트용 BKT 상태 - 문서가 없으면 초기 상태로 원자적으로 생성"""
+        bkt_record = self.bkt_collection.find_one({"user_id": user_id})
+        if bkt_record:
+            return bkt_record
+        
+        initial_state = self._create_initial_bkt_state(user_id)
+        initial_state.pop("user_id")
+        return self.bkt_collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": initial_state},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def _version_filter(user_id: str, version: int) -> Dict:
+        """읽은 version 그대로일 때만 쓰기 - version 없는 기존 문서는 0으로 간주"""
+        if version == 0:
+            return {"user_id": user_id, "version": {"$in": [0, None]}}
+        return {"user_id": user_id, "version": version}
+
+    def _build_field_update(self, bkt_state: Dict, results: List[Dict],
+                            outcomes: List[bool], existing_types: set) -> Dict:
+        """배치 결과로부터 변경된 경로만 담은 update 문서 생성"""
+        inc = {
+            "version": 1,
+            "total_attempts": len(results),
+            "total_correct": sum(1 for is_correct in outcomes if is_correct)
+        }
+        set_fields = {
+            "overall_mastery": bkt_state["overall_mastery"],
+            "updated_at": bkt_state["updated_at"]
+        }
+        
+        if not all(self._is_path_safe(result["type"]) for result in results):
+            # "." içeren ya da "$" ile başlayan type adı update yolunda kullanılamaz (yolu böler / operatör sanılır)
+            # -> type_mastery alt dokümanı anahtarlar olduğu gibi tek parça yazılır; version filtresi eşzamanlılığı korur
+            set_fields["type_mastery"] = bkt_state["type_mastery"]
+            return {"$inc": inc, "$set": set_fields}
+        
+        for result, is_correct in zip(results, outcomes):
+            question_type = result["type"]
+            difficulty = result["difficulty"]
+            type_path = f"type_mastery.{question_type}"
+            type_data = bkt_state["type_mastery"][question_type]
+            
+            if question_type not in existing_types:
+                # 이번 배치에서 처음 생긴 type은 통째로 기록
+                set_fields[type_path] = type_data
+                continue
+            
+            diff_path = f"{type_path}.difficulty_performance.{difficulty}"
+            for path, amount in (
+                (f"{type_path}.total_attempts", 1),
+                (f"{type_path}.correct_answers", 1 if is_correct else 0),
+                (f"{diff_path}.attempts", 1),
+                (f"{diff_path}.correct", 1 if is_correct else 0),
+            ):
+                inc[path] = inc.get(path, 0) + amount
+            
+            set_fields[f"{type_path}.mastery_probability"] = type_data["mastery_probability"]
+            set_fields[f"{type_path}.last_updated"] = type_data["last_updated"]
+            set_fields[f"{diff_path}.mastery"] = type_data["difficulty_performance"][difficulty]["mastery"]
+        
+        return {"$inc": inc, "$set": set_fields}
+
+    @staticmethod
+    def _is_path_safe(question_type: str) -> bool:
+        """type adı "type_mastery.<type>.…" update yolunda tek bir alan olarak kullanılabilir mi"""
+        return "." not in question_type and not question_type.startswith("$")
+
+    @staticmethod
+    def normalize_question_type(question_type) -> str:
+        """BKT'de kullanılan type anahtarı"""
         # ⭐ SADECE BOŞ KONTROL - manuel filtreleme yok
         if not question_type or not str(question_type).strip():
             print(f"⚠️ Empty type, using 'general': {question_type}")
-            question_type = "general"
-        else:
-            # type을 string으로 확실히 변환
-            question_type = str(question_type).strip()
-        
-        print(f"🔍 BKT Update: user={user_id}, type={question_type}, difficulty={difficulty}, correct={is_correct}")
+            return "general"
+        # type을 string으로 확실히 변환
+        return str(question_type).strip()
+
+    def _apply_answer(self, bkt_state: Dict, question_data: Dict, is_correct: bool,
+                      mastery_sum: float, weight_sum: float) -> Tuple[Dict, float, float]:
+        """메모리 상의 BKT 상태에 답변 하나 반영 (DB 접근 없음)"""
+        # 문제 정보 추출 - TYPE이 가장 중요!
+        difficulty = question_data.get("difficulty", "중")
+        question_type = self.normalize_question_type(question_data.get("type", "general"))
         
         # BKT 파라미터 가져오기
-        params = self.difficulty_params[difficulty]
+        params = self.params_for(question_type, difficulty)
         
         # type이 없으면 새로 생성
         if question_type not in bkt_state["type_mastery"]:
             print(f"📝 Creating new type entry: {question_type}")
-            bkt_state["type_mastery"][question_type] = {
-                "mastery_probability": params["prior"],
-                "total_attempts": 0,
-                "correct_answers": 0,
-                "last_updated": datetime.utcnow(),
-                "difficulty_performance": {
-                    "하": {"attempts": 0, "correct": 0, "mastery": 0.5},
-                    "중": {"attempts": 0, "correct": 0, "mastery": 0.4},
-                    "상": {"attempts": 0, "correct": 0, "mastery": 0.3}
-                }
-            }
+            type_entry = self._new_type_entry(question_type, difficulty)
+            bkt_state["type_mastery"][question_type] = type_entry
+            mastery_sum += type_entry["mastery_probability"]
+            weight_sum += 1
         
         type_data = bkt_state["type_mastery"][question_type]
         current_mastery = type_data["mastery_probability"]
         
+        # 가중합에서 이 type의 이전 기여분 제거
+        old_weight = max(1, type_data["total_attempts"])
+        mastery_sum -= current_mastery * old_weight
+        weight_sum -= old_weight
+        
         # Bayesian 업데이트 수행
         updated_mastery = self._bayesian_update(current_mastery, is_correct, params)
         
@@ -258,7 +623,25 @@ class TypeBasedPhysioTherapyBKT:
         if is_correct:
             bkt_state["total_correct"] += 1
         
-        # 전체 mastery 재계산 (모든 type들의 가중평균)
+        # 새 기여분 추가 후 전체 mastery 갱신 (모든 type들의 가중평균)
+        new_weight = max(1, type_data["total_attempts"])  # 최소 weight 1
+        mastery_sum += updated_mastery * new_weight
+        weight_sum += new_weight
+        bkt_state["overall_mastery"] = mastery_sum / weight_sum if weight_sum > 0 else 0.4
+        
+        result = {
+            "type": question_type,
+            "difficulty": difficulty,
+            "previous_mastery": current_mastery,
+            "updated_mastery": updated_mastery,
+            "overall_mastery": bkt_state["overall_mastery"],
+            "attempts_in_type": type_data["total_attempts"],
+            "skipped": False
+        }
+        return result, mastery_sum, weight_sum
+
+    def _overall_mastery_totals(self, bkt_state: Dict) -> Tuple[float, float]:
+        """전체 mastery 가중평균을 위한 (가중합, 가중치합)"""
         total_mastery = 0
         total_weight = 0
         
@@ -268,27 +651,7 @@ class TypeBasedPhysioTherapyBKT:
             total_mastery += data["mastery_probability"] * weight
             total_weight += weight
         
-        bkt_state["overall_mastery"] = total_mastery / total_weight if total_weight > 0 else 0.4
-        bkt_state["updated_at"] = datetime.utcnow()
-        
-        # 데이터베이스에 저장
-        self.bkt_collection.update_one(
-            {"user_id": user_id},
-            {"$set": bkt_state},
-            upsert=True
-        )
-        
-        print(f"✅ BKT Updated: {question_type} mastery {current_mastery:.3f} → {updated_mastery:.3f}")
-        
-        return {
-            "type": question_type,
-            "difficulty": difficulty,
-            "previous_mastery": current_mastery,
-            "updated_mastery": updated_mastery,
-            "overall_mastery": bkt_state["overall_mastery"],
-            "attempts_in_type": type_data["total_attempts"],
-            "skipped": False
-        }   
+        return total_mastery, total_weight
 
     def _bayesian_update(self, prior_mastery: float, is_correct: bool, 
                         params: Dict) -> float:
@@ -322,8 +685,10 @@ class TypeBasedPhysioTherapyBKT:
 
     def get_weak_types(self, user_id: str, threshold: float = 0.6) -> List[Dict]:
         """약한 type들 찾기 - sadece güvenilir olanlar"""
-        bkt_state = self.get_user_bkt_state(user_id)
-        
+        return self.weak_types_from_state(self.get_user_bkt_state(user_id), threshold)
+
+    def weak_types_from_state(self, bkt_state: Dict, threshold: float = 0.6) -> List[Dict]:
+        """이미 읽은 BKT 상태에서 약한 type들"""
         weak_types = []
         for question_type, data in bkt_state["type_mastery"].items():
             attempts = data.get("total_attempts", 0)
@@ -348,12 +713,90 @@ class TypeBasedPhysioTherapyBKT:
         return weak_types
 
     def get_adaptive_questions_by_type(self, user_id: str, num_questions: int = 10) -> List[Dict]:
-        """type별 약점을 기반으로 적응형 문제 추천"""
+        """기대 정보 이득이 가장 큰 (type, 난이도) 문제 추천 - 문제 풀이 없으면 약점 기반 DB 검색"""
+        if self.question_pool is None:
+            return self._get_weak_type_questions(user_id, num_questions)
+        
+        bkt_state = self.get_user_bkt_state(user_id)
+        selected = self.select_questions(user_id, bkt_state, ["diagnosis_test", "exam_questions"], num_questions)
+        
+        if not selected:
+            return self._get_balanced_questions(num_questions, user_id)
+        
+        return [
+            {
+                "question_id": str(question.get("_id")),
+                "type": item["type"],
+                "difficulty": item["difficulty"],
+                "current_mastery": item["mastery"],
+                "expected_information_gain": round(item["expected_gain"], 4),
+                "reason": self.selection_reason(item)
+            }
+            for item, question in selected
+        ]
+
+    def selection_masteries(self, bkt_state: Dict) -> Dict[str, float]:
+        """선택 후보 type들의 현재 mastery - 아직 시도하지 않은 카탈로그 type은 초기값"""
+        masteries = {question_type: self.initial_mastery_for(question_type) for question_type in self._get_unique_types()}
+        for question_type, data in bkt_state.get("type_mastery", {}).items():
+            masteries[question_type] = data.get("mastery_probability", self.initial_mastery_for(question_type))
+        return masteries
+
+    def select_questions(self, user_id: str, bkt_state: Dict, collection_names: List[str],
+                         num_questions: int) -> List[Tuple[Dict, Dict]]:
+        """
+        기대 정보 이득 top-N 계획을 세우고 문제 풀에서 문제를 꺼낸다 (DB 접근 없음).
+        Dönüş: [(plan item, soru dokümanı)]
+        """
+        self.sync_parameters()
+        catalog = self.question_pool.catalog
+        available: Dict[Tuple[str, str], int] = {}
+        for collection_name in collection_names:
+            for (question_type, difficulty), count in catalog.stratum_counts(collection_name).items():
+                if question_type is None or difficulty not in self.difficulty_params:
+                    continue
+                key = (question_type, difficulty)
+                available[key] = available.get(key, 0) + count
+        
+        plan = self.question_selector.plan(self.selection_masteries(bkt_state), available, num_questions)
+        
+        # 같은 (type, 난이도)는 한 번에 꺼낸다
+        grouped: Dict[Tuple[str, str], List[Dict]] = {}
+        for item in plan:
+            grouped.setdefault((item["type"], item["difficulty"]), []).append(item)
+        
+        selected = []
+        picked_ids = set()
+        for (question_type, difficulty), items in grouped.items():
+            questions = []
+            for collection_name in collection_names:
+                if len(questions) >= len(items):
+                    break
+                questions.extend(self.question_pool.take(
+                    user_id, collection_name, len(items) - len(questions),
+                    question_type=question_type, difficulty=difficulty, exclude_ids=picked_ids
+                ))
+            for item, question in zip(items, questions):
+                picked_ids.add(str(question["_id"]))
+                selected.append((item, question))
+        
+        # 계획 순서 (정보 이득 높은 순)
+        selected.sort(key=lambda pair: -pair[0]["expected_gain"])
+        return selected
+
+    def selection_reason(self, item: Dict) -> str:
+        mastery = item["mastery"]
+        if mastery < 0.5:
+            return f"약한 유형 ({item['type']}) 측정 - 기대 정보 이득 {item['expected_gain']:.3f}"
+        return f"유형 ({item['type']}) 습득도 확인 - 기대 정보 이득 {item['expected_gain']:.3f}"
+
+    def _get_weak_type_questions(self, user_id: str, num_questions: int = 10) -> List[Dict]:
+        """type별 약점을 기반으로 적응형 문제 추천 (고정 임계값, DB 검색)"""
         weak_types = self.get_weak_types(user_id)
         
         if not weak_types:
             # 약한 type이 없으면 전체적으로 균등하게
-            return self._get_balanced_questions(num_questions)
+            return self._get_balanced_questions(num_questions, user_id)
         
         print(f"🎯 Weak types for {user_id}: {[t['type'] for t in weak_types[:3]]}")
         
@@ -378,16 +821,13 @@ class TypeBasedPhysioTherapyBKT:
             for collection_name in collections:
                 if questions_found >= 3:  # type당 최대 3문제
                     break
-                    
-                collection = self.db[collection_name]
                 
                 # type과 difficulty로 검색
                 query = {
                     "type": question_type,
                     "difficulty": target_difficulty
                 }
-                
-                questions = list(collection.find(query).limit(3))
+                questions = list(self.db[collection_name].find(query, {"_id": 1}).limit(3))
                 
                 for question in questions:
                     if len(recommended_questions) < num_questions:
@@ -404,14 +844,16 @@ class TypeBasedPhysioTherapyBKT:
         
         return recommended_questions[:num_questions]
 
-    def _get_balanced_questions(self, num_questions: int) -> List[Dict]:
+    def _get_balanced_questions(self, num_questions: int, user_id: Optional[str] = None) -> List[Dict]:
         """균등한 문제 분배"""
         questions = []
         collections = ["diagnosis_test", "exam_questions"]
         
         for collection_name in collections:
-            collection = self.db[collection_name]
-            random_questions = list(collection.aggregate([{"$sample": {"size": num_questions}}]))
+            if self.question_pool is not None and user_id is not None:
+                random_questions = self.question_pool.take(user_id, collection_name, num_questions - len(questions))
+            else:
+                random_questions = list(self.db[collection_name].aggregate([{"$sample": {"size": num_questions}}]))
             
             for q in random_questions:
                 if len(questions) < num_questions:
@@ -535,4 +977,31 @@ class TypeBasedPhysioTherapyBKT:
                 else:
                     summary["weak_types"] += 1
         
-        return summary
\ No newline at end of file
+        return summary
+    # ---------- async API (FastAPI handler'ları için) ----------
+    # Her çağrı tüm DB işini (okuma + versiyonlu yazma + tekrar denemeler) tek seferde
+    # Mongo I/O havuzunda yapar - event loop bloklanmaz
+
+    async def aget_user_bkt_state(self, user_id: str) -> Dict:
+        return await run_blocking(self.get_user_bkt_state, user_id)
+
+    async def aupdate_bkt_with_answer(self, user_id: str, question_data: Dict,
+                                      student_answer: int, is_correct: bool) -> Dict:
+        return await run_blocking(self.update_bkt_with_answer, user_id, question_data,
+                                  student_answer, is_correct)
+
+    async def aupdate_bkt_with_answers(self, user_id: str,
+                                       answers: List[Tuple[Dict, int, bool]]) -> List[Dict]:
+        return await run_blocking(self.update_bkt_with_answers, user_id, answers)
+
+    async def aget_weak_types(self, user_id: str, threshold: float = 0.6) -> List[Dict]:
+        return await run_blocking(self.get_weak_types, user_id, threshold)
+
+    async def aget_adaptive_questions_by_type(self, user_id: str, num_questions: int = 10) -> List[Dict]:
+        return await run_blocking(self.get_adaptive_questions_by_type, user_id, num_questions)
+
+    async def aget_mastery_report(self, user_id: str) -> Dict:
+        return await run_blocking(self.get_mastery_report, user_id)
+
+    async def aget_type_summary(self, user_id: str) -> Dict:
+        return await run_blocking(self.get_type_summary, user_id)
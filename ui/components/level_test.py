@@ -53,6 +53,7 @@ def _show_test_start_page():
                 if result and result.get("status") == "success":
                     # 테스트를 세션 상태에 저장
                     st.session_state.current_test = result.get("test", [])
+                    st.session_state.current_test_version = result.get("test_info", {}).get("test_version")
                     st.session_state.current_answers = {}
                     st.session_state.test_submitted = False
                     st.session_state.test_results = None
@@ -425,7 +426,7 @@ def submit_final_test():
             print(f"🔍 [DEBUG] Unanswered questions: {len(unanswered_questions)}")
         
         # API에 제출 - 답변된 문제들만 보냄
-        result = submit_test(user_id, answers)
+        result = submit_test(user_id, answers, st.session_state.get("current_test_version"))
         
         if result and result.get("status") == "success":
             # 결과 저장
@@ -1,5 +1,5 @@
 import streamlit as st
-from api.client import get_practice_question, submit_practice_answer, explain_answer
+from api.client import get_practice_question, submit_practice_answer, stream_explain_answer
 from config.settings import DIFFICULTY_NAMES, DIFFICULTY_COLORS
 
 def show_practice_test_tab():
@@ -148,30 +148,38 @@ def show_practice_question():
             st.rerun()
 
 def submit_practice_answer_func(question_id, student_answer):
-    """연습 테스트 답변 제출 및 설명 가져오기"""
+    """연습 테스트 답변 제출 - 설명은 결과 화면에서 스트리밍으로 표시"""
     with st.spinner("답변을 평가 중..."):
         # 먼저 답변 확인
         answer_result = submit_practice_answer(question_id, student_answer)
         
         if answer_result and answer_result.get("status") == "success":
-            # 그 다음 설명 가져오기
-            explanation_result = explain_answer(question_id, student_answer)
-            
-            if explanation_result and explanation_result.get("status") == "success":
-                # 결과 합치기
-                combined_result = {
-                    **answer_result,
-                    **explanation_result
-                }
-                
-                st.session_state.practice_explanation = combined_result
-                st.session_state.practice_answer_submitted = True
-                st.rerun()
-            else:
-                st.error("설명을 가져오는 중 오류가 발생했습니다.")
+            st.session_state.practice_explanation = answer_result
+            st.session_state.practice_answer_submitted = True
+            st.rerun()
         else:
             st.error("답변 평가 중 오류가 발생했습니다.")
 
+def _stream_practice_explanation(result):
+    """설명을 생성되는 대로 표시하고 세션에 저장"""
+    box = st.empty()
+    explanation = ""
+    box.info("설명 준비 중...")
+    
+    for event, data in stream_explain_answer(result.get("question_id"), result.get("student_answer")):
+        if event == "token":
+            explanation += data.get("text", "")
+            box.info(explanation + " ▌")
+        elif event == "done":
+            result["explanation"] = data.get("explanation", explanation)
+            result["cached"] = data.get("cached", False)
+            box.info(result["explanation"])
+            return
+        elif event == "error":
+            break
+    
+    box.error("설명을 가져오는 중 오류가 발생했습니다.")
+
 def show_practice_results():
     """연습 테스트 결과 표시"""
     result = st.session_state.practice_explanation
@@ -190,7 +198,6 @@ def show_practice_results():
     is_correct = result.get("is_correct", False)
     correct_answer = result.get("correct_answer", 1)
     student_answer = result.get("student_answer", 1)
-    explanation = result.get("explanation", "설명을 찾을 수 없습니다.")
     
     # 난이도
     difficulty_name = DIFFICULTY_NAMES.get(difficulty, "알 수 없음")
@@ -224,7 +231,10 @@ def show_practice_results():
     
     # 설명
     st.markdown("### 💡 설명")
-    st.info(explanation)
+    if "explanation" in result:
+        st.info(result["explanation"])
+    else:
+        _stream_practice_explanation(result)
     
     # 버튼들
     st.markdown("---")
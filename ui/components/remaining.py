@@ -1,7 +1,7 @@
 # ui/components/test_history.py
 import streamlit as st
 from datetime import datetime
-from api.client import get_user_test_history, get_test_details, explain_answer
+from api.client import get_user_test_history, get_test_details, stream_explain_answer
 
 def show_test_history_tab():
     """테스트 기록 탭 표시"""
@@ -41,7 +41,8 @@ def show_test_history_tab():
             return
         
         st.markdown("---")
-        st.subheader(f"📋 완료된 테스트 ({len(test_history)}개)")
+        total_tests = st.session_state.test_history_data.get("total_tests", len(test_history))
+        st.subheader(f"📋 완료된 테스트 ({total_tests}개)")
         
         # 각 테스트에 대한 카드 표시
         for i, test in enumerate(test_history):
@@ -181,39 +182,50 @@ def _show_question_detail(i, question_result):
             if st.button(f"💡 이 문제 설명", key=f"explain_history_{i}", use_container_width=True):
                 show_question_explanation_popup(question_id, student_answer, i)
 
+EXPLANATION_BOX_HTML = """
+<div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; border-left: 5px solid #ff6b6b;">
+{explanation}
+</div>
+"""
+
 def show_question_explanation_popup(question_id, student_answer, question_index):
-    """문제 설명을 팝업으로 표시"""
+    """문제 설명을 팝업으로 표시 - 해설은 생성되는 대로 표시"""
+    explanation = ""
+    box = None
+    
     with st.spinner("설명 준비 중..."):
-        result = explain_answer(question_id, student_answer)
-        
-        if result and result.get("status") == "success":
-            explanation = result.get("explanation", "")
-            is_correct = result.get("is_correct", False)
-            cached = result.get("cached", False)
-            
-            # 설명 모달 스타일 표시
-            st.markdown("---")
-            st.markdown(f"### 💡 문제 {question_index + 1} 설명")
-            
-            if cached:
-                st.info("📚 이 설명은 이전에 생성되었습니다 (빠른 로딩)")
+        for event, data in stream_explain_answer(question_id, student_answer):
+            if event == "meta":
+                # 설명 모달 스타일 표시
+                st.markdown("---")
+                st.markdown(f"### 💡 문제 {question_index + 1} 설명")
+                
+                if data.get("cached"):
+                    st.info("📚 이 설명은 이전에 생성되었습니다 (빠른 로딩)")
+                
+                if data.get("is_correct"):
+                    st.success("🎉 이 문제를 정답으로 답했습니다!")
+                else:
+                    st.warning("📖 이 문제에서 틀린 답을 했습니다. 설명은 다음과 같습니다:")
+                
+                # 설명 박스 - 토큰이 올 때마다 갱신
+                box = st.empty()
             
-            if is_correct:
-                st.success("🎉 이 문제를 정답으로 답했습니다!")
-            else:
-                st.warning("📖 이 문제에서 틀린 답을 했습니다. 설명은 다음과 같습니다:")
+            elif event == "token" and box is not None:
+                explanation += data.get("text", "")
+                box.markdown(EXPLANATION_BOX_HTML.format(explanation=explanation + " ▌"), unsafe_allow_html=True)
             
-            # 설명 박스
-            with st.container():
-                st.markdown(f"""
-                <div style="background-color: #f0f2f6; padding: 20px; border-radius: 10px; border-left: 5px solid #ff6b6b;">
-                {explanation}
-                </div>
-                """, unsafe_allow_html=True)
+            elif event == "done" and box is not None:
+                explanation = data.get("explanation", explanation)
+                box.markdown(EXPLANATION_BOX_HTML.format(explanation=explanation), unsafe_allow_html=True)
+                st.markdown("---")
+                return
             
-            st.markdown("---")
-        else:
-            st.error("설명을 가져오는 중 오류가 발생했습니다.")
+            elif event == "error":
+                print(f"Explanation stream error: {data.get('detail')}")
+                break
+    
+    st.error("설명을 가져오는 중 오류가 발생했습니다.")
 
 # ui/components/questions.py
 def show_questions_tab():
@@ -273,8 +285,6 @@ def show_questions_tab():
 
 def _show_individual_question(i, question):
     """개별 문제 표시"""
-    from api.client import explain_answer
-    
     question_id = question.get("_id")
     problem_id = question.get("problem_id", "")
     problem = question.get("problem", "")
@@ -294,14 +304,18 @@ def _show_individual_question(i, question):
         
         # 설명 버튼
         if st.button("설명 요청", key=f"explain_{question_id}"):
-            with st.spinner("설명 준비 중..."):
-                explanation_result = explain_answer(question_id, answer_key)
-                
-                if explanation_result and explanation_result.get("status") == "success":
-                    explanation = explanation_result.get("explanation", "")
-                    st.info(explanation)
-                else:
-                    st.error("설명 준비 중 오류가 발생했습니다.")
+            box = st.empty()
+            explanation = ""
+            for event, data in stream_explain_answer(question_id, answer_key):
+                if event == "token":
+                    explanation += data.get("text", "")
+                    box.info(explanation + " ▌")
+                elif event == "done":
+                    box.info(data.get("explanation", explanation))
+                    break
+                elif event == "error":
+                    box.error("설명 준비 중 오류가 발생했습니다.")
+                    break
 
 # ui/components/profile.py
 def show_profile_tab():
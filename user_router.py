@@ -1,36 +1,68 @@
 from fastapi import APIRouter, HTTPException, Body, Depends
 from typing import Dict, Any, List, Optional
-import pymongo
 import uuid
 import bcrypt
 import random
 import string
 import datetime 
+from bson import ObjectId
 from pydantic import BaseModel, EmailStr, Field
+from test_history_store import (
+    MIGRATING_FIELD, migrate_user_history, count_test_results, get_user_stats as get_test_stats_rollup
+)
+from async_db import run_blocking
+from services import AppServices, get_services
+from json_response import BSONJSONRoute
 
-# MongoDB bağlantısı
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client["physical_therapy_questions"]
-user_collection = db["users"]
+# Kullanıcı okumaları - eski dokümanlardaki gömülü test_history asla çekilmez
+USER_PROJECTION = {"test_history": 0, MIGRATING_FIELD: 0}
+
+# Giriş/profil/skor uçları kullanıcıyı e-posta ile bulur - sparse: e-postasız eski dokümanlar çakışmaz
+REQUIRED_INDEXES = [
+    {"collection": "users", "keys": [("email", 1)], "name": "users_email", "unique": True, "sparse": True}
+]
+
+HOT_QUERIES = [
+    {"name": "user_by_email", "collection": "users", "filter": {"email": "audit@example.com"},
+     "projection": USER_PROJECTION}
+]
+
+
+def _migrate_and_count(db, user_id) -> int:
+    migrate_user_history(db, user_id)
+    return count_test_results(db, user_id)
+
+
+def _stats_rollup(db, user_id):
+    migrate_user_history(db, user_id)
+    return get_test_stats_rollup(db, user_id)
+
+
+async def _test_count(services: AppServices, user) -> int:
+    """users.test_count - henüz taşınmamış eski kullanıcıda test_history'yi taşıyıp say"""
+    if "test_count" in user:
+        return user["test_count"]
+    return await run_blocking(_migrate_and_count, services.db, user["_id"])
 
 # User router
-user_router = APIRouter(prefix="/api/user", tags=["user"])
+user_router = APIRouter(prefix="/api/user", tags=["user"], route_class=BSONJSONRoute)
 from models import UserRegister, UserLogin, GoogleLogin, UpdateProfile, UpdateScore
 
 @user_router.post("/register")
-async def register_user(user_data: UserRegister):
+async def register_user(user_data: UserRegister, services: AppServices = Depends(get_services)):
     """
     New user registration endpoint.
     """
     try:
+        user_collection = services.adb["users"]
         # check if the email already exists
-        existing_user = user_collection.find_one({"email": user_data.email})
+        existing_user = await user_collection.find_one({"email": user_data.email}, {"_id": 1})
         if existing_user:
             raise HTTPException(status_code=400, detail="이미 등록된 이메일 주소입니다.")
         
         # PW hashing
         password_bytes = user_data.password.encode('utf-8')
-        hashed_password = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+        hashed_password = await run_blocking(bcrypt.hashpw, password_bytes, bcrypt.gensalt())
         
         # Kullanıcı ID'si oluştur
         #user_id = str(uuid.uuid4())
@@ -46,32 +78,22 @@ async def register_user(user_data: UserRegister):
             "role": "student",
             "test_score": 0,
             "level": None,
-            "test_history": [],  # YENİ: Test geçmişi
+            "test_count": 0,  # Test kayıtları test_results koleksiyonunda
             "last_test_date": None,  # YENİ: Son test tarihi
             "created_at": datetime.datetime.utcnow(),  # YENİ: Kayıt tarihi
             "updated_at": datetime.datetime.utcnow()   # YENİ: Güncelleme tarihi
         }
         
         # MongoDB 
-        result = user_collection.insert_one(new_user)
+        result = await user_collection.insert_one(new_user)
         
         # remove pw
         response_user = new_user.copy()
         response_user.pop("password")
         
-        # ObjectId => string
+        # _id -> user_id (ObjectId yanıtta string olur)
         if "_id" in response_user:
-            response_user["user_id"] = str(response_user.pop("_id"))
-        
-        
-        if "created_at" in response_user and hasattr(response_user["created_at"], 'isoformat'):
-            response_user["created_at"] = response_user["created_at"].isoformat()
-        if "updated_at" in response_user and hasattr(response_user["updated_at"], 'isoformat'):
-            response_user["updated_at"] = response_user["updated_at"].isoformat()
-        if "last_login" in response_user and hasattr(response_user["last_login"], 'isoformat'):
-            response_user["last_login"] = response_user["last_login"].isoformat()
-        if "last_test_date" in response_user and hasattr(response_user["last_test_date"], 'isoformat'):
-            response_user["last_test_date"] = response_user["last_test_date"].isoformat()
+            response_user["user_id"] = response_user.pop("_id")
         
         return {
             "status": "success",
@@ -83,13 +105,14 @@ async def register_user(user_data: UserRegister):
         raise HTTPException(status_code=500, detail=f"Kullanıcı kaydı sırasında hata: {str(e)}")
 
 @user_router.post("/login")
-async def login_user(login_data: UserLogin):
+async def login_user(login_data: UserLogin, services: AppServices = Depends(get_services)):
     """
     Kullanıcı girişi yap - Role bilgisini de döndür
     """
     try:
+        user_collection = services.adb["users"]
         # Kullanıcıyı e-posta ile bul
-        user = user_collection.find_one({"email": login_data.email})
+        user = await user_collection.find_one({"email": login_data.email}, USER_PROJECTION)
         
         if not user:
             raise HTTPException(status_code=401, detail="Geçersiz e-posta veya şifre")
@@ -100,7 +123,8 @@ async def login_user(login_data: UserLogin):
         
         if stored_password.startswith("$2b$"):
             # Şifre doğrulama
-            is_valid = bcrypt.checkpw(
+            is_valid = await run_blocking(
+                bcrypt.checkpw,
                 login_data.password.encode('utf-8'),
                 stored_password.encode('utf-8')
             )
@@ -113,25 +137,26 @@ async def login_user(login_data: UserLogin):
                 raise HTTPException(status_code=401, detail="Geçersiz e-posta veya şifre")
             
             # Şifreyi hash'leyip güncelle
-            hashed_password = bcrypt.hashpw(
+            hashed_password = await run_blocking(
+                bcrypt.hashpw,
                 login_data.password.encode('utf-8'),
                 bcrypt.gensalt()
             )
             
-            user_collection.update_one(
+            await user_collection.update_one(
                 {"_id": user["_id"]},
                 {"$set": {"password": hashed_password.decode('utf-8')}}
             )
         
         # Son giriş tarihini güncelle - YENİ EKLENEN
-        user_collection.update_one(
+        await user_collection.update_one(
             {"_id": user["_id"]},
             {"$set": {"last_login": datetime.datetime.utcnow()}}
         )
         
         # Kullanıcı bilgilerini döndür (şifre hariç) - ROL BİLGİSİNİ DE EKLEYİN
         response_user = {
-            "user_id": str(user["_id"]),  # ObjectId'yi string'e dönüştür
+            "user_id": user["_id"],
             "name": user.get("name", ""),
             "email": user.get("email", ""),
             "department": user.get("department", ""),
@@ -139,15 +164,10 @@ async def login_user(login_data: UserLogin):
             "test_score": user.get("test_score", 0),
             "level": user.get("level", None),
             "role": user.get("role", "student"),  # ROL BİLGİSİNİ EKLEMEYE UNUTMAYIN!
-            "test_count": len(user.get("test_history", [])),  # YENİ: Test sayısı
+            "test_count": await _test_count(services, user),  # YENİ: Test sayısı
         }
         
-        # Datetime alanlarını güvenli şekilde dönüştür
-        last_test_date = user.get("last_test_date")
-        if last_test_date and hasattr(last_test_date, 'isoformat'):
-            response_user["last_test_date"] = last_test_date.isoformat()
-        else:
-            response_user["last_test_date"] = None
+        response_user["last_test_date"] = user.get("last_test_date")
         
         return {
             "status": "success",
@@ -159,13 +179,14 @@ async def login_user(login_data: UserLogin):
         raise HTTPException(status_code=500, detail=f"Giriş sırasında hata: {str(e)}")
 
 @user_router.post("/google-login")
-async def google_login(login_data: GoogleLogin):
+async def google_login(login_data: GoogleLogin, services: AppServices = Depends(get_services)):
     """
     Google hesabıyla giriş yap veya kayıt ol.
     """
     try:
+        user_collection = services.adb["users"]
         # Kullanıcıyı e-posta ile kontrol et
-        user = user_collection.find_one({"email": login_data.email})
+        user = await user_collection.find_one({"email": login_data.email}, USER_PROJECTION)
         
         if not user:
             # Kullanıcı yoksa yeni kayıt oluştur
@@ -173,7 +194,7 @@ async def google_login(login_data: GoogleLogin):
             random_password = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
             
             # Şifreyi hashle
-            hashed_password = bcrypt.hashpw(random_password.encode('utf-8'), bcrypt.gensalt())
+            hashed_password = await run_blocking(bcrypt.hashpw, random_password.encode('utf-8'), bcrypt.gensalt())
             
             # Kullanıcı ID'si oluştur
             #user_id = str(uuid.uuid4())
@@ -189,7 +210,7 @@ async def google_login(login_data: GoogleLogin):
                 "role": "googleuser",
                 "test_score": 0,
                 "level": None,
-                "test_history": [],  # YENİ: Test geçmişi
+                "test_count": 0,  # Test kayıtları test_results koleksiyonunda
                 "last_test_date": None,  # YENİ: Son test tarihi
                 "created_at": datetime.datetime.now(),  
                 "updated_at": datetime.datetime.now(),  
@@ -197,25 +218,15 @@ async def google_login(login_data: GoogleLogin):
             }
             
             # MongoDB'ye ekle
-            result = user_collection.insert_one(new_user)
+            result = await user_collection.insert_one(new_user)
             
             # Response için kullanıcı bilgilerini hazırla
             response_user = new_user.copy()
             response_user.pop("password")
             
-            # ObjectId'leri string'e dönüştür
+            # _id -> user_id (ObjectId yanıtta string olur)
             if "_id" in response_user:
-                response_user["user_id"] = str(response_user.pop("_id"))
-            
-            # Datetime objelerini string'e dönüştür
-            if "created_at" in response_user and hasattr(response_user["created_at"], 'isoformat'):
-                response_user["created_at"] = response_user["created_at"].isoformat()
-            if "updated_at" in response_user and hasattr(response_user["updated_at"], 'isoformat'):
-                response_user["updated_at"] = response_user["updated_at"].isoformat()
-            if "last_login" in response_user and hasattr(response_user["last_login"], 'isoformat'):
-                response_user["last_login"] = response_user["last_login"].isoformat()
-            if "last_test_date" in response_user and hasattr(response_user["last_test_date"], 'isoformat'):
-                response_user["last_test_date"] = response_user["last_test_date"].isoformat()
+                response_user["user_id"] = response_user.pop("_id")
             
             response_user["test_count"] = 0  # YENİ: Test sayısı
             
@@ -227,7 +238,7 @@ async def google_login(login_data: GoogleLogin):
         else:
             # Kullanıcı zaten varsa giriş yap
             # Son giriş tarihini güncelle - YENİ EKLENEN
-            user_collection.update_one(
+            await user_collection.update_one(
                 {"_id": user["_id"]},
                 {"$set": {"last_login": datetime.datetime.utcnow()}}
             )
@@ -241,15 +252,10 @@ async def google_login(login_data: GoogleLogin):
                 "test_score": user.get("test_score", 0),
                 "level": user.get("level", None),
                 "role": user.get("role", "googleuser"),
-                "test_count": len(user.get("test_history", [])),  # YENİ: Test sayısı
+                "test_count": await _test_count(services, user),  # YENİ: Test sayısı
             }
             
-            # Datetime alanlarını güvenli şekilde dönüştür
-            last_test_date = user.get("last_test_date")
-            if last_test_date and hasattr(last_test_date, 'isoformat'):
-                response_user["last_test_date"] = last_test_date.isoformat()
-            else:
-                response_user["last_test_date"] = None
+            response_user["last_test_date"] = user.get("last_test_date")
             
             return {
                 "status": "success",
@@ -261,13 +267,14 @@ async def google_login(login_data: GoogleLogin):
         raise HTTPException(status_code=500, detail=f"Google login error: {str(e)}")
 
 @user_router.post("/update-profile")
-async def update_profile(profile_data: UpdateProfile):
+async def update_profile(profile_data: UpdateProfile, services: AppServices = Depends(get_services)):
     """
     Kullanıcı profilini güncelle.
     """
     try:
+        user_collection = services.adb["users"]
         # Kullanıcıyı e-posta ile bul
-        user = user_collection.find_one({"email": profile_data.email})
+        user = await user_collection.find_one({"email": profile_data.email}, USER_PROJECTION)
         
         if not user:
             raise HTTPException(status_code=404, detail="no user found with this email")
@@ -279,7 +286,7 @@ async def update_profile(profile_data: UpdateProfile):
             "updated_at": datetime.datetime.now()  # YENİ: Güncelleme tarihi
         }
         
-        result = user_collection.update_one(
+        result = await user_collection.update_one(
             {"email": profile_data.email},
             {"$set": updated_data}
         )
@@ -295,15 +302,10 @@ async def update_profile(profile_data: UpdateProfile):
                 "test_score": user.get("test_score", 0),
                 "level": user.get("level", None),
                 "role": user.get("role", "student"),
-                "test_count": len(user.get("test_history", [])),  # YENİ: Test sayısı
+                "test_count": await _test_count(services, user),  # YENİ: Test sayısı
             }
             
-            # Datetime alanlarını güvenli şekilde dönüştür
-            last_test_date = user.get("last_test_date")
-            if last_test_date and hasattr(last_test_date, 'isoformat'):
-                response_user["last_test_date"] = last_test_date.isoformat()
-            else:
-                response_user["last_test_date"] = None
+            response_user["last_test_date"] = user.get("last_test_date")
             
             return {
                 "status": "warning",
@@ -312,11 +314,11 @@ async def update_profile(profile_data: UpdateProfile):
             }
         
         # Güncellenmiş kullanıcı bilgilerini al
-        updated_user = user_collection.find_one({"email": profile_data.email})
+        updated_user = await user_collection.find_one({"email": profile_data.email}, USER_PROJECTION)
         
         # Response için kullanıcı bilgilerini hazırla
         response_user = {
-            "user_id": str(updated_user["_id"]),  # ObjectId'yi string'e dönüştür
+            "user_id": updated_user["_id"],
             "name": updated_user.get("name", ""),
             "email": updated_user.get("email", ""),
             "department": updated_user.get("department", ""),
@@ -324,15 +326,10 @@ async def update_profile(profile_data: UpdateProfile):
             "test_score": updated_user.get("test_score", 0),
             "level": updated_user.get("level", None),
             "role": updated_user.get("role", "student"),
-            "test_count": len(updated_user.get("test_history", [])),  # YENİ: Test sayısı
+            "test_count": await _test_count(services, updated_user),  # YENİ: Test sayısı
         }
         
-        # Datetime alanlarını güvenli şekilde dönüştür
-        last_test_date = updated_user.get("last_test_date")
-        if last_test_date and hasattr(last_test_date, 'isoformat'):
-            response_user["last_test_date"] = last_test_date.isoformat()
-        else:
-            response_user["last_test_date"] = None
+        response_user["last_test_date"] = updated_user.get("last_test_date")
         
         return {
             "status": "success",
@@ -344,13 +341,14 @@ async def update_profile(profile_data: UpdateProfile):
         raise HTTPException(status_code=500, detail=f"Profile update error: {str(e)}")
 
 @user_router.post("/update-score")
-async def update_score(score_data: UpdateScore):
+async def update_score(score_data: UpdateScore, services: AppServices = Depends(get_services)):
     """
     Kullanıcının test skorunu güncelle.
     """
     try:
+        user_collection = services.adb["users"]
         # Kullanıcıyı e-posta ile bul
-        user = user_collection.find_one({"email": score_data.email})
+        user = await user_collection.find_one({"email": score_data.email}, USER_PROJECTION)
         
         if not user:
             raise HTTPException(status_code=404, detail="No user found with this email")
@@ -369,7 +367,7 @@ async def update_score(score_data: UpdateScore):
             "updated_at": datetime.datetime.now # YENİ: Güncelleme tarihi
         }
         
-        result = user_collection.update_one(
+        result = await user_collection.update_one(
             {"email": score_data.email},
             {"$set": updated_data}
         )
@@ -377,7 +375,7 @@ async def update_score(score_data: UpdateScore):
         if result.modified_count == 0:
             # Değişiklik yapılmadıysa, mevcut kullanıcı bilgilerini döndür
             response_user = {
-                "user_id": str(user["_id"]),  # ObjectId'yi string'e dönüştür
+                "user_id": user["_id"],
                 "name": user.get("name", ""),
                 "email": user.get("email", ""),
                 "department": user.get("department", ""),
@@ -385,15 +383,10 @@ async def update_score(score_data: UpdateScore):
                 "test_score": user.get("test_score", 0),
                 "level": user.get("level", None),
                 "role": user.get("role", "student"),
-                "test_count": len(user.get("test_history", [])),  # YENİ: Test sayısı
+                "test_count": await _test_count(services, user),  # YENİ: Test sayısı
             }
             
-            # Datetime alanlarını güvenli şekilde dönüştür
-            last_test_date = user.get("last_test_date")
-            if last_test_date and hasattr(last_test_date, 'isoformat'):
-                response_user["last_test_date"] = last_test_date.isoformat()
-            else:
-                response_user["last_test_date"] = None
+            response_user["last_test_date"] = user.get("last_test_date")
             
             return {
                 "status": "warning",
@@ -402,11 +395,11 @@ async def update_score(score_data: UpdateScore):
             }
         
         # Güncellenmiş kullanıcı bilgilerini al
-        updated_user = user_collection.find_one({"email": score_data.email})
+        updated_user = await user_collection.find_one({"email": score_data.email}, USER_PROJECTION)
         
         # Response için kullanıcı bilgilerini hazırla
         response_user = {
-            "user_id": str(updated_user["_id"]),  # ObjectId'yi string'e dönüştür
+            "user_id": updated_user["_id"],
             "name": updated_user.get("name", ""),
             "email": updated_user.get("email", ""),
             "department": updated_user.get("department", ""),
@@ -414,15 +407,10 @@ async def update_score(score_data: UpdateScore):
             "test_score": updated_user.get("test_score", 0),
             "level": updated_user.get("level", None),
             "role": updated_user.get("role", "student"),
-            "test_count": len(updated_user.get("test_history", [])),  # YENİ: Test sayısı
+            "test_count": await _test_count(services, updated_user),  # YENİ: Test sayısı
         }
         
-        # Datetime alanlarını güvenli şekilde dönüştür
-        last_test_date = updated_user.get("last_test_date")
-        if last_test_date and hasattr(last_test_date, 'isoformat'):
-            response_user["last_test_date"] = last_test_date.isoformat()
-        else:
-            response_user["last_test_date"] = None
+        response_user["last_test_date"] = updated_user.get("last_test_date")
         
         return {
             "status": "success",
@@ -435,51 +423,35 @@ async def update_score(score_data: UpdateScore):
 
 # YENİ ENDPOINT: Kullanıcı istatistiklerini getir
 @user_router.get("/stats/{user_id}")
-async def get_user_stats(user_id: str):
+async def get_user_stats(user_id: str, services: AppServices = Depends(get_services)):
     """
     Kullanıcının detaylı istatistiklerini getir
     """
     try:
-        user = user_collection.find_one({"_id": user_id})
+        user_collection = services.adb["users"]
+        user = await user_collection.find_one({"_id": user_id}, {"level": 1})
+        if not user and ObjectId.is_valid(user_id):
+            user = await user_collection.find_one({"_id": ObjectId(user_id)}, {"level": 1})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        test_history = user.get("test_history", [])
+        # Önceden hesaplanmış özet - tek doküman okuma
+        rollup = await run_blocking(_stats_rollup, services.db, user["_id"])
+        total_tests = rollup.get("total_tests", 0)
         
-        # İstatistikleri hesapla
         stats = {
-            "total_tests": len(test_history),
-            "average_score": 0,
-            "highest_score": 0,
+            "total_tests": total_tests,
+            "average_score": round(rollup.get("score_sum", 0) / total_tests, 1) if total_tests else 0,
+            "highest_score": rollup.get("highest_score", 0) if total_tests else 0,
             "latest_level": user.get("level"),
-            "total_correct_answers": 0,
-            "total_questions_attempted": 0,
-            "level_distribution": {"하": 0, "중": 0, "상": 0},
-            "monthly_test_count": {},
-            "improvement_trend": []
+            "total_correct_answers": rollup.get("total_correct_answers", 0),
+            "total_questions_attempted": rollup.get("total_questions_attempted", 0),
+            "level_distribution": {"하": 0, "중": 0, "상": 0, **rollup.get("level_distribution", {})},
+            "monthly_test_count": rollup.get("monthly_test_count", {}),
+            "improvement_trend": rollup.get("recent_scores", [])
         }
         
-        if test_history:
-            # Skorlar
-            scores = [test.get("total_score", 0) for test in test_history]
-            stats["average_score"] = round(sum(scores) / len(scores), 1)
-            stats["highest_score"] = max(scores)
-            
-            # Doğru cevaplar
-            stats["total_correct_answers"] = sum(test.get("correct_count", 0) for test in test_history)
-            stats["total_questions_attempted"] = sum(test.get("total_questions", 0) for test in test_history)
-            
-            # Seviye dağılımı
-            for test in test_history:
-                level = test.get("level", "하")
-                if level in stats["level_distribution"]:
-                    stats["level_distribution"][level] += 1
-            
-            # İlerleme trendi (son 5 test)
-            recent_tests = test_history[-5:]
-            stats["improvement_trend"] = [test.get("total_score", 0) for test in recent_tests]
-        
         return {
             "status": "success",
             "stats": stats
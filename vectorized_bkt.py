@@ -0,0 +1,277 @@
+# vectorized_bkt.py - NumPy BKT engine for cohort-scale recomputation
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+from type_based_bkt_system import TypeBasedPhysioTherapyBKT
+
+# 난이도 순서 - 배열 인덱스로 사용
+DIFFICULTIES = ["하", "중", "상"]
+DIFFICULTY_INDEX = {difficulty: i for i, difficulty in enumerate(DIFFICULTIES)}
+
+# type 항목 생성 시 난이도별 mastery 기본값 (스칼라 경로와 동일)
+DEFAULT_DIFFICULTY_MASTERY = np.array([0.5, 0.4, 0.3])
+
+
+def bayesian_update_vectorized(mastery: np.ndarray, is_correct: np.ndarray,
+                               slip: np.ndarray, guess: np.ndarray,
+                               learn: np.ndarray) -> np.ndarray:
+    """
+    TypeBasedPhysioTherapyBKT._bayesian_update 의 배열 버전
+    연산 순서가 스칼라 경로와 같으므로 결과가 비트 단위로 동일하다.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 맞췄을 때: P(known|correct)
+        p_correct = mastery * (1 - slip) + (1 - mastery) * guess
+        updated_correct = np.where(p_correct > 0, (mastery * (1 - slip)) / p_correct, mastery)
+
+        # 틀렸을 때: P(known|wrong)
+        p_wrong = mastery * slip + (1 - mastery) * (1 - guess)
+        updated_wrong = np.where(p_wrong > 0, (mastery * slip) / p_wrong, mastery)
+
+    updated = np.where(is_correct, updated_correct, updated_wrong)
+
+    # 학습 효과 추가 후 0.01과 0.99 사이로 제한
+    final_mastery = updated + (1 - updated) * learn
+    return np.minimum(0.99, np.maximum(0.01, final_mastery))
+
+
+class VectorizedBKT:
+    """
+    (user × type) mastery 를 NumPy 배열로 들고 있는 BKT 엔진
+    - 답변 배치를 한 번에 적용 (같은 셀의 연속 답변은 순서대로 '웨이브'로 처리)
+    - 파라미터를 바꿔서 재계산(what-if)하거나 전체 기록을 재생할 때 사용
+    - 시도하지 않은 셀은 NaN (스칼라 경로의 sparse type_mastery 와 동일한 의미)
+    """
+
+    def __init__(self, difficulty_params: Dict, user_ids: Sequence[str],
+                 type_names: Sequence[str],
+                 initial_mastery: Optional[Dict[str, float]] = None,
+                 type_params: Optional[Dict[str, Dict[str, Dict]]] = None):
+        self.user_ids = list(user_ids)
+        self.type_names = list(type_names)
+        self.user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.type_index = {type_name: i for i, type_name in enumerate(self.type_names)}
+        self.set_params(difficulty_params, type_params)
+
+        num_users, num_types = len(self.user_ids), len(self.type_names)
+
+        # type 셀의 첫 시도 전 mastery - NaN 이면 첫 답변 난이도의 prior 사용
+        self.type_initial = np.full(num_types, np.nan)
+        for type_name, value in (initial_mastery or {}).items():
+            if type_name in self.type_index:
+                self.type_initial[self.type_index[type_name]] = value
+
+        self.mastery = np.full((num_users, num_types), np.nan)
+        self.attempts = np.zeros((num_users, num_types), dtype=np.int64)
+        self.correct = np.zeros((num_users, num_types), dtype=np.int64)
+        self.difficulty_attempts = np.zeros((num_users, num_types, len(DIFFICULTIES)), dtype=np.int64)
+        self.difficulty_correct = np.zeros((num_users, num_types, len(DIFFICULTIES)), dtype=np.int64)
+        self.difficulty_mastery = np.tile(DEFAULT_DIFFICULTY_MASTERY, (num_users, num_types, 1))
+        self.user_attempts = np.zeros(num_users, dtype=np.int64)
+        self.user_correct = np.zeros(num_users, dtype=np.int64)
+
+    @classmethod
+    def from_engine(cls, engine: TypeBasedPhysioTherapyBKT, user_ids: Sequence[str],
+                    type_names: Sequence[str],
+                    difficulty_params: Optional[Dict] = None) -> "VectorizedBKT":
+        """스칼라 엔진과 같은 파라미터/초기값 규칙으로 생성"""
+        initial_mastery = {
+            type_name: engine.initial_mastery_for(type_name)
+            for type_name in type_names if type_name in engine.type_registry
+        }
+        if difficulty_params is not None:
+            # what-if 파라미터는 type별 학습값 없이 그대로 적용
+            return cls(difficulty_params, user_ids, type_names, initial_mastery)
+        return cls(engine.difficulty_params, user_ids, type_names, initial_mastery, engine.type_params)
+
+    def set_params(self, difficulty_params: Dict, type_params: Optional[Dict[str, Dict[str, Dict]]] = None):
+        """
+        (type × 난이도) slip/guess/learn/prior 배열 (what-if 재계산용으로 교체 가능)
+        type_params 에 있는 type/난이도는 그 값, 나머지는 난이도 파라미터
+        """
+        self.difficulty_params = difficulty_params
+        self.type_params = type_params or {}
+        for field in ("slip", "guess", "learn", "prior"):
+            values = np.tile([float(difficulty_params[d][field]) for d in DIFFICULTIES], (len(self.type_names), 1))
+            for type_name, type_difficulty_params in self.type_params.items():
+                t = self.type_index.get(type_name)
+                if t is None:
+                    continue
+                for difficulty, params in type_difficulty_params.items():
+                    values[t, DIFFICULTY_INDEX[difficulty]] = params[field]
+            setattr(self, field, values)
+
+    # ---------- 상태 적재 ----------
+
+    def load_states(self, bkt_states: Iterable[Dict]):
+        """bkt_tracking 문서들을 배열로 적재 (엔진에 등록된 user/type 만)"""
+        for bkt_state in bkt_states:
+            u = self.user_index.get(bkt_state.get("user_id"))
+            if u is None:
+                continue
+
+            self.user_attempts[u] = bkt_state.get("total_attempts", 0)
+            self.user_correct[u] = bkt_state.get("total_correct", 0)
+
+            for type_name, type_data in bkt_state.get("type_mastery", {}).items():
+                t = self.type_index.get(type_name)
+                if t is None:
+                    continue
+                self.mastery[u, t] = type_data.get("mastery_probability", np.nan)
+                self.attempts[u, t] = type_data.get("total_attempts", 0)
+                self.correct[u, t] = type_data.get("correct_answers", 0)
+
+                for difficulty, perf in type_data.get("difficulty_performance", {}).items():
+                    d = DIFFICULTY_INDEX.get(difficulty)
+                    if d is None:
+                        continue
+                    self.difficulty_attempts[u, t, d] = perf.get("attempts", 0)
+                    self.difficulty_correct[u, t, d] = perf.get("correct", 0)
+                    self.difficulty_mastery[u, t, d] = perf.get("mastery", DEFAULT_DIFFICULTY_MASTERY[d])
+
+    # ---------- 답변 적용 ----------
+
+    def encode_answers(self, answers: Iterable[Tuple[str, str, str, bool]]) -> Tuple[np.ndarray, ...]:
+        """[(user_id, type, difficulty, is_correct), ...] -> 인덱스 배열"""
+        user_idx, type_idx, difficulty_idx, correct = [], [], [], []
+        for user_id, question_type, difficulty, is_correct in answers:
+            user_idx.append(self.user_index[user_id])
+            type_idx.append(self.type_index[question_type])
+            difficulty_idx.append(DIFFICULTY_INDEX[difficulty])
+            correct.append(bool(is_correct))
+
+        return (
+            np.asarray(user_idx, dtype=np.int64),
+            np.asarray(type_idx, dtype=np.int64),
+            np.asarray(difficulty_idx, dtype=np.int64),
+            np.asarray(correct, dtype=bool)
+        )
+
+    def apply_answers(self, user_idx: np.ndarray, type_idx: np.ndarray,
+                      difficulty_idx: np.ndarray, is_correct: np.ndarray) -> int:
+        """
+        시간 순서대로 정렬된 답변 배치 적용
+        같은 (user, type) 셀의 k번째 답변은 k번째 웨이브에서 처리되므로
+        각 웨이브 안에서는 셀이 겹치지 않고, 셀별 순서는 스칼라 경로와 같다.
+        반환값: 웨이브 수 (= 한 셀의 최대 답변 수)
+        """
+        num_answers = len(user_idx)
+        if num_answers == 0:
+            return 0
+
+        # 셀 안에서의 순번(rank) 계산
+        cell = user_idx * len(self.type_names) + type_idx
+        order = np.argsort(cell, kind="stable")
+        sorted_cell = cell[order]
+        positions = np.arange(num_answers)
+        is_first = np.ones(num_answers, dtype=bool)
+        is_first[1:] = sorted_cell[1:] != sorted_cell[:-1]
+        group_start = np.maximum.accumulate(np.where(is_first, positions, 0))
+        rank = np.empty(num_answers, dtype=np.int64)
+        rank[order] = positions - group_start
+
+        # 웨이브 순서로 한 번 정렬 후 구간별 처리
+        wave_order = np.argsort(rank, kind="stable")
+        wave_bounds = np.searchsorted(rank[wave_order], np.arange(rank.max() + 2))
+
+        for wave in range(len(wave_bounds) - 1):
+            selected = wave_order[wave_bounds[wave]:wave_bounds[wave + 1]]
+            self._apply_wave(user_idx[selected], type_idx[selected],
+                             difficulty_idx[selected], is_correct[selected])
+
+        return len(wave_bounds) - 1
+
+    def _apply_wave(self, u: np.ndarray, t: np.ndarray, d: np.ndarray, is_correct: np.ndarray):
+        """셀이 서로 겹치지 않는 답변 묶음 적용"""
+        current = self.mastery[u, t]
+
+        # 처음 시도하는 셀 생성: 카탈로그 초기값, 없으면 난이도 prior
+        new_cells = np.isnan(current)
+        if new_cells.any():
+            initial = self.type_initial[t]
+            initial = np.where(np.isnan(initial), self.prior[t, d], initial)
+            current = np.where(new_cells, initial, current)
+
+        updated = bayesian_update_vectorized(current, is_correct, self.slip[t, d], self.guess[t, d], self.learn[t, d])
+        correct = is_correct.astype(np.int64)
+
+        self.mastery[u, t] = updated
+        self.attempts[u, t] += 1
+        self.correct[u, t] += correct
+        self.difficulty_attempts[u, t, d] += 1
+        self.difficulty_correct[u, t, d] += correct
+        self.difficulty_mastery[u, t, d] = updated
+        np.add.at(self.user_attempts, u, 1)
+        np.add.at(self.user_correct, u, correct)
+
+    # ---------- 결과 ----------
+
+    def overall_mastery(self) -> np.ndarray:
+        """사용자별 전체 mastery (시도한 type 들의 attempts 가중평균, 없으면 0.4)"""
+        materialized = ~np.isnan(self.mastery)
+        weights = np.where(materialized, np.maximum(1, self.attempts), 0)
+        weighted = np.where(materialized, self.mastery, 0.0) * weights
+        total_weight = weights.sum(axis=1)
+
+        overall = np.full(len(self.user_ids), 0.4)
+        has_types = total_weight > 0
+        overall[has_types] = weighted.sum(axis=1)[has_types] / total_weight[has_types]
+        return overall
+
+    def to_state_documents(self, user_rows: Optional[Iterable[int]] = None) -> List[Dict]:
+        """bkt_tracking 형식의 문서 생성 (version 은 저장 시점에 결정)"""
+        now = datetime.utcnow()
+        overall = self.overall_mastery()
+        documents = []
+
+        rows = range(len(self.user_ids)) if user_rows is None else user_rows
+        for u in rows:
+            type_mastery = {}
+            for t in np.flatnonzero(~np.isnan(self.mastery[u])):
+                type_mastery[self.type_names[t]] = {
+                    "mastery_probability": float(self.mastery[u, t]),
+                    "total_attempts": int(self.attempts[u, t]),
+                    "correct_answers": int(self.correct[u, t]),
+                    "last_updated": now,
+                    "difficulty_performance": {
+                        difficulty: {
+                            "attempts": int(self.difficulty_attempts[u, t, d]),
+                            "correct": int(self.difficulty_correct[u, t, d]),
+                            "mastery": float(self.difficulty_mastery[u, t, d])
+                        }
+                        for d, difficulty in enumerate(DIFFICULTIES)
+                    }
+                }
+
+            documents.append({
+                "user_id": self.user_ids[u],
+                "updated_at": now,
+                "type_mastery": type_mastery,
+                "total_attempts": int(self.user_attempts[u]),
+                "total_correct": int(self.user_correct[u]),
+                "overall_mastery": float(overall[u])
+            })
+
+        return documents
+
+
+def replay_answers(difficulty_params: Dict,
+                   answers: Sequence[Tuple[str, str, str, bool]],
+                   initial_mastery: Optional[Dict[str, float]] = None,
+                   type_params: Optional[Dict[str, Dict[str, Dict]]] = None) -> VectorizedBKT:
+    """
+    시간 순서의 답변 목록을 처음부터 재생
+    answers: [(user_id, type, difficulty, is_correct), ...]
+    """
+    normalized = [
+        (user_id, TypeBasedPhysioTherapyBKT.normalize_question_type(question_type), difficulty, is_correct)
+        for user_id, question_type, difficulty, is_correct in answers
+    ]
+    user_ids = list(dict.fromkeys(answer[0] for answer in normalized))
+    type_names = list(dict.fromkeys(answer[1] for answer in normalized))
+
+    engine = VectorizedBKT(difficulty_params, user_ids, type_names, initial_mastery, type_params)
+    engine.apply_answers(*engine.encode_answers(normalized))
+    return engine